@@ -0,0 +1,11 @@
+
+from django.contrib import admin
+
+from .models import PersistedQuery
+
+
+@admin.register(PersistedQuery)
+class PersistedQueryAdmin(admin.ModelAdmin):
+    list_display = 'name', 'hash', 'created'
+    search_fields = 'name', 'hash', 'query'
+    readonly_fields = 'hash', 'created', 'modified'
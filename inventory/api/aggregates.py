@@ -0,0 +1,199 @@
+
+
+import graphene
+import re
+
+from django.core.exceptions import FieldDoesNotExist
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import models
+from django.db.models import Avg, Count, F, Max, Min, Sum
+from graphene.types.generic import GenericScalar
+from graphene_django.converter import get_choices
+
+from utils.string import camel_to_snake
+
+
+"""
+Aggregates
+
+`<name>Aggregate` root fields group the rows of a type by some of its fields and aggregate others in the database,
+a single `values(*group_by).annotate(...)` query, i.e. the stock value by category:
+
+    partsAggregate(groupBy: ["category"], aggregates: [{function: SUM, field: "stockValue"}]) { group values }
+
+Only whitelisted fields can be grouped by or aggregated, set by the type's Meta:
+
+group_by: Field paths to group by, defaults to the concrete fields of Meta.fields.
+aggregate_fields: Field paths to aggregate, or a dictionary {name: expression} of computed values,
+                  defaults to the numeric fields of Meta.fields. COUNT without a field counts the rows.
+
+Grouped fields with choices return the names of their choices, like the enums of the types (`DIODES`, not `diodes`).
+"""
+
+NUMERIC_FIELDS = models.IntegerField, models.FloatField, models.DecimalField
+
+FUNCTIONS = {
+    'sum': Sum,
+    'avg': Avg,
+    'min': Min,
+    'max': Max,
+    'count': Count,
+}
+
+
+class AggregateFunction(graphene.Enum):
+    SUM = 'sum'
+    AVG = 'avg'
+    MIN = 'min'
+    MAX = 'max'
+    COUNT = 'count'
+
+
+class AggregateInput(graphene.InputObjectType):
+    function = AggregateFunction(required=True)
+    field = graphene.String(description="Whitelisted field to aggregate, COUNT counts the rows without it.")
+    alias = graphene.String(description="Key of the value in `values`, ``<function><Field>`` by default.")
+
+
+def get_concrete_fields(NodeType):
+    Model = NodeType.Meta.model
+    fields = getattr(NodeType.Meta, 'fields', [])
+    fields = [field.name for field in Model._meta.concrete_fields] if fields == '__all__' else fields
+    out = []
+    for name in fields:
+        try:
+            field = Model._meta.get_field(name)
+        except FieldDoesNotExist:
+            continue
+        if field.concrete:
+            out.append(field)
+    return out
+
+
+def get_group_by_fields(NodeType):
+    """Return the field paths `NodeType` can be grouped by."""
+    if hasattr(NodeType.Meta, 'group_by'):
+        return set(NodeType.Meta.group_by)
+    return {field.name for field in get_concrete_fields(NodeType) if not field.primary_key}
+
+
+def get_aggregate_fields(NodeType):
+    """Return {name: expression} of the values of `NodeType` that can be aggregated."""
+    if hasattr(NodeType.Meta, 'aggregate_fields'):
+        aggregate_fields = NodeType.Meta.aggregate_fields
+    else:
+        aggregate_fields = [field.name for field in get_concrete_fields(NodeType) if isinstance(field, NUMERIC_FIELDS) and not field.primary_key]
+    # Aggregate fields are either an iterable or a dictionary {name: expression}
+    return aggregate_fields if type(aggregate_fields) == dict else {name: F(name) for name in aggregate_fields}
+
+
+def get_alias(aggregate):
+    if aggregate.get('alias'):
+        return aggregate['alias']
+    field = aggregate.get('field')
+    return aggregate['function'] + (field[0].upper() + field[1:] if field else '')
+
+
+def get_choice_names(Model, path):
+    """Return {value: enum name} of the choices of the field at `path`, the names graphene-django gives them, or None."""
+    for name in path.split('__'):
+        try:
+            field = Model._meta.get_field(name)
+        except FieldDoesNotExist:
+            return None
+        Model = field.related_model
+    if not field.choices:
+        return None
+    return {value: name for name, value, _ in get_choices(field.choices)}
+
+
+def serialize(value):
+    if value is None or isinstance(value, (bool, int, float, str)):
+        return value
+    return DjangoJSONEncoder().default(value)  # decimals, dates and UUIDs
+
+
+def aggregate_qs(NodeType, qs, group_by, aggregates):
+    """
+    Return the rows of `qs` grouped by `group_by` with `aggregates` computed, [{'group': {}, 'values': {}}].
+
+    `group_by` and the aggregated fields are checked against the whitelists of `NodeType`, both accept camelCase.
+    """
+    group_by = group_by or []
+    group_by_fields = get_group_by_fields(NodeType)
+    aggregate_fields = get_aggregate_fields(NodeType)
+
+    group_paths = {}  # {requested name: field path}
+    for name in group_by:
+        path = camel_to_snake(name)
+        if path not in group_by_fields:
+            raise ValueError(f"{NodeType.__name__} can't be grouped by {name}, use one of {sorted(group_by_fields)}.")
+        group_paths[name] = path
+
+    annotations = {}  # {annotation name: aggregate}, the names don't clash with model fields
+    aliases = {}  # {annotation name: alias}
+    for index, aggregate in enumerate(aggregates):
+        function, field = aggregate['function'], aggregate.get('field')
+        alias = get_alias(aggregate)
+        if not re.match(r'^[A-Za-z_][A-Za-z0-9_]*$', alias) or alias in aliases.values():
+            raise ValueError(f'Invalid or duplicate aggregate alias {alias}.')
+
+        if field is None:
+            if function != AggregateFunction.COUNT.value:
+                raise ValueError(f'Aggregate {function} needs a field.')
+            expression = F('pk')
+        elif camel_to_snake(field) in aggregate_fields:
+            expression = aggregate_fields[camel_to_snake(field)]
+        else:
+            raise ValueError(f"{NodeType.__name__} can't aggregate {field}, use one of {sorted(aggregate_fields)}.")
+
+        annotations[f'_aggregate_{index}'] = FUNCTIONS[function](expression)
+        aliases[f'_aggregate_{index}'] = alias
+
+    if group_paths:
+        # clear any ordering, ordered fields would be grouped by too
+        rows = qs.order_by().values(*group_paths.values()).annotate(**annotations).order_by(*group_paths.values())
+    else:
+        rows = [qs.order_by().aggregate(**annotations)]
+
+    choice_names = {path: get_choice_names(NodeType.Meta.model, path) for path in group_paths.values()}
+    return [{
+        'group': {name: serialize(choice_names[path].get(row[path], row[path]) if choice_names[path] else row[path])
+                  for name, path in group_paths.items()},
+        'values': {alias: serialize(row[annotation]) for annotation, alias in aliases.items()},
+    } for row in rows]
+
+
+def get_path_models(Model, path):
+    """Return the models a field path (i.e. 'part__stock') goes through, `Model` included."""
+    out = {Model}
+    for name in path.split('__'):
+        try:
+            field = Model._meta.get_field(name)
+        except FieldDoesNotExist:
+            break
+        if not field.is_relation:
+            break
+        Model = field.related_model
+        out.add(Model)
+    return out
+
+
+def get_aggregated_models(NodeType):
+    """Return the models the whitelisted paths of `NodeType` read from, the response cache tags aggregates with them."""
+    Model = NodeType.Meta.model
+    paths = set(get_group_by_fields(NodeType))
+    for expression in get_aggregate_fields(NodeType).values():
+        expressions = expression.flatten() if hasattr(expression, 'flatten') else [expression]
+        paths |= {item.name for item in expressions if isinstance(item, F)}
+    return set().union({Model}, *[get_path_models(Model, path) for path in paths])
+
+
+def get_aggregate_type(NodeType):
+    """Return the `<Type>Aggregate` row type, `aggregated_models` tag its responses in the response cache."""
+    return type(f'{NodeType.__name__}Aggregate', (graphene.ObjectType,), {
+        'aggregate_of': NodeType,
+        'aggregated_models': get_aggregated_models(NodeType),
+        'group': GenericScalar(description="Values of the `groupBy` fields."),
+        'values': GenericScalar(description="Aggregated values by alias."),
+    })
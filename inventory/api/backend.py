@@ -0,0 +1,130 @@
+
+
+from collections import OrderedDict
+from functools import partial
+from hashlib import sha1
+from threading import Lock
+
+from django.conf import settings
+from graphql.backend.base import GraphQLDocument
+from graphql.backend.core import GraphQLCoreBackend
+from graphql.execution import ExecutionResult, execute
+from graphql.language.base import parse
+from graphql.validation import validate
+
+
+"""
+Document cache
+
+graphql-core parses every query string and validates the parsed document against the schema on every request,
+dashboards send the same few documents over and over. The CachedDocumentBackend keeps the parsed AST together
+with its validation errors in a bounded LRU cache keyed by the schema version and the hash of the document,
+so a repeated query goes straight to execution.
+
+The cache is process-wide, `Registry.reset` invalidates it, the rebuilt schema gets a new version.
+Documents of persisted queries (api.persisted) are pinned, they're never evicted.
+"""
+
+
+def execute_validated(schema, document_ast, validation_errors, *args, **kwargs):
+    """Execute a document validated beforehand, the counterpart of graphql-core's `execute_and_validate`."""
+    if validation_errors:
+        return ExecutionResult(errors=validation_errors, invalid=True)
+    return execute(schema, document_ast, *args, **kwargs)
+
+
+class DocumentCache:
+    """LRU cache of GraphQLDocuments, {(schema version, document hash): document}."""
+
+    def __init__(self, maxsize):
+        self.maxsize = maxsize
+        self.schema_version = 0
+        self.hits = 0
+        self.misses = 0
+        self._documents = OrderedDict()
+        self._pinned = {}
+        self._lock = Lock()
+
+    def __repr__(self):
+        return f"<DocumentCache {self.info()}>"
+
+    def __len__(self):
+        return len(self._documents) + len(self._pinned)
+
+    def info(self):
+        return {'hits': self.hits, 'misses': self.misses, 'size': len(self), 'maxsize': self.maxsize, 'schema_version': self.schema_version}
+
+    def get_key(self, document_string):
+        return self.schema_version, sha1(document_string.encode('utf-8')).hexdigest()
+
+    def get(self, key, schema):
+        """Return the cached document of `key`, None if missing or built for another schema."""
+        with self._lock:
+            document = self._pinned.get(key) or self._documents.get(key)
+            if document is None or document.schema is not schema:
+                self.misses += 1
+                return None
+            if key in self._documents:
+                self._documents.move_to_end(key)
+            self.hits += 1
+            return document
+
+    def set(self, key, document):
+        with self._lock:
+            self._documents[key] = document
+            self._documents.move_to_end(key)
+            while len(self._documents) > self.maxsize:
+                self._documents.popitem(last=False)
+
+    def pin(self, key, document):
+        """Keep `document` until `unpin_all` or `invalidate`, out of the LRU."""
+        with self._lock:
+            self._documents.pop(key, None)
+            self._pinned[key] = document
+
+    def unpin_all(self):
+        with self._lock:
+            self._pinned.clear()
+
+    def invalidate(self):
+        """Drop all documents, called when the schema is rebuilt."""
+        with self._lock:
+            self._documents.clear()
+            self._pinned.clear()
+            self.schema_version += 1
+
+    def reset_counters(self):
+        self.hits = self.misses = 0
+
+
+document_cache = DocumentCache(settings.GRAPHQL_DOCUMENT_CACHE_SIZE)
+
+
+class CachedDocumentBackend(GraphQLCoreBackend):
+    """GraphQLCoreBackend parsing and validating each document once, documents come from the `document_cache`."""
+
+    def __init__(self, cache=document_cache, executor=None):
+        super().__init__(executor=executor)
+        self.cache = cache
+
+    def document_from_string(self, schema, document_string):
+        if not isinstance(document_string, str):  # an already parsed ast.Document
+            return super().document_from_string(schema, document_string)
+
+        key = self.cache.get_key(document_string)
+        document = self.cache.get(key, schema)
+        if document is not None:
+            return document
+
+        document_ast = parse(document_string)  # syntax errors are raised, the view turns them into a response
+        document = GraphQLDocument(
+            schema=schema,
+            document_string=document_string,
+            document_ast=document_ast,
+            execute=partial(execute_validated, schema, document_ast, validate(schema, document_ast), **self.execute_params),
+        )
+        self.cache.set(key, document)
+        return document
+
+
+document_backend = CachedDocumentBackend()
@@ -0,0 +1,200 @@
+
+
+import hashlib
+import json
+import time
+
+from collections import OrderedDict
+from functools import partial
+from threading import Lock
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.exceptions import ImproperlyConfigured
+from django.db import transaction
+from django.db.models.signals import m2m_changed, post_delete, post_save
+from django.dispatch import receiver
+from django.utils.module_loading import import_string
+from graphql.language.visitor import TypeInfoVisitor, Visitor, visit
+from graphql.type.definition import get_named_type
+from graphql.utils.type_info import TypeInfo
+
+from core.signals import bulk_changed
+from utils.django import bump_cache_generation, get_cache_generation, is_shared_cache
+
+from .backend import document_cache
+
+
+"""
+Response cache
+
+Serialized responses of read-only operations, keyed by the query, operation name, variables, user and schema version.
+Dashboards polling the same `parts`/`orders` queries get the stored response without touching the database.
+
+Every entry is tagged with the models of the registry types its document selects (a PartType field tags `parts.part`)
+and remembers the version of each tag when the execution started. A write bumps the version of its model and of the
+models its foreign keys point to (parents often show aggregates of their children), which makes the entries tagged
+with them stale. Versions are the generation counters of `utils.django.get_cache_generation`.
+
+Writes announce themselves by post_save, post_delete and m2m_changed, bulk writes by `core.signals.bulk_changed`,
+which the QuerySets of core.models.BulkChangedManager send after update, bulk_create and bulk_update. Raw SQL has
+to send it itself.
+
+Entries are stored by the backend of `GRAPHQL_RESPONSE_CACHE`, the LocalResponseCache of each worker
+or the SharedResponseCache in a Django cache. It's off by default, the versions have to be shared by all workers,
+so it refuses to start with a per-process default cache, as does the SharedResponseCache with a per-process one.
+"""
+
+VERSION_KEY = 'api:response_cache:{tag}'
+
+
+def get_tag(Model):
+    return Model._meta.label_lower
+
+
+class ModelCollector(Visitor):
+    """Collect the models of the registered types a document selects."""
+
+    def __init__(self, type_info):
+        self.type_info = type_info
+        self.models = set()
+
+    def enter_Field(self, node, *args):
+        graphene_type = getattr(get_named_type(self.type_info.get_type()), 'graphene_type', None)
+        Model = getattr(getattr(graphene_type, '_meta', None), 'model', None)
+        if Model:
+            self.models.add(Model)
+        self.models |= getattr(graphene_type, 'aggregated_models', set())  # rows of api.aggregates
+
+
+def get_document_models(schema, document_ast):
+    """Return the models of all registered types selected anywhere in the document."""
+    type_info = TypeInfo(schema)
+    collector = ModelCollector(type_info)
+    visit(document_ast, TypeInfoVisitor(type_info, collector))
+    return collector.models
+
+
+class LocalResponseCache:
+    """LRU of responses in the memory of this worker."""
+
+    def __init__(self, maxsize=512, timeout=300):
+        self.maxsize = maxsize
+        self.timeout = timeout
+        self._entries = OrderedDict()
+        self._lock = Lock()
+
+    def get(self, key):
+        with self._lock:
+            expires, entry = self._entries.get(key, (0, None))
+            if expires < time.monotonic():
+                self._entries.pop(key, None)
+                return None
+            self._entries.move_to_end(key)
+            return entry
+
+    def set(self, key, entry):
+        with self._lock:
+            self._entries[key] = time.monotonic() + self.timeout, entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+class SharedResponseCache:
+    """Responses in a Django cache shared by all workers, i.e. Redis or memcached."""
+
+    def __init__(self, alias='default', timeout=300):
+        self.cache = caches[alias]
+        self.timeout = timeout
+
+    def get(self, key):
+        return self.cache.get(key)
+
+    def set(self, key, entry):
+        self.cache.set(key, entry, self.timeout)
+
+    def clear(self):
+        self.cache.clear()
+
+
+class ResponseCache:
+    """Tagged responses in a backend, {key: (tag versions, response)}."""
+
+    def __init__(self, backend):
+        self.backend = backend
+        self.hits = 0
+        self.misses = 0
+
+    def __repr__(self):
+        return f"<ResponseCache {type(self.backend).__name__} hits={self.hits} misses={self.misses}>"
+
+    def get_key(self, query, variables, operation_name, user):
+        key = json.dumps([document_cache.schema_version, query, operation_name, variables, user.pk], sort_keys=True, default=str)
+        return 'api:response:' + hashlib.sha256(key.encode('utf-8')).hexdigest()
+
+    def get_versions(self, models):
+        """Return {tag: version}, read before executing, so writes during the execution make the stored entry stale."""
+        return {get_tag(Model): get_cache_generation(VERSION_KEY.format(tag=get_tag(Model))) for Model in models}
+
+    def get(self, key):
+        """Return the stored response, None if missing or any of its tags changed since."""
+        entry = self.backend.get(key)
+        if entry is not None:
+            versions, response = entry
+            if all(get_cache_generation(VERSION_KEY.format(tag=tag)) == version for tag, version in versions.items()):
+                self.hits += 1
+                return response
+        self.misses += 1
+        return None
+
+    def set(self, key, response, versions):
+        self.backend.set(key, (versions, response))
+
+
+def get_response_cache():
+    """Return the ResponseCache configured by `GRAPHQL_RESPONSE_CACHE`, None if it's off."""
+    config = settings.GRAPHQL_RESPONSE_CACHE
+    if not config:
+        return None
+    if not is_shared_cache():
+        raise ImproperlyConfigured("GRAPHQL_RESPONSE_CACHE needs a default cache shared by the workers, "
+                                   "other workers don't see the version bumps of a per-process one.")
+    Backend = import_string(config['BACKEND'])
+    backend = Backend(**config.get('OPTIONS', {}))
+    if isinstance(backend, SharedResponseCache) and not is_shared_cache(config.get('OPTIONS', {}).get('alias', 'default')):
+        raise ImproperlyConfigured("SharedResponseCache needs a cache shared by the workers.")
+    return ResponseCache(backend)
+
+
+response_cache = get_response_cache()
+
+
+def bump_tags(tags):
+    for tag in tags:
+        bump_cache_generation(VERSION_KEY.format(tag=tag))
+
+
+def invalidate_models(*models):
+    """Make the responses selecting `models` or the models their foreign keys point to stale once the transaction commits."""
+    tags = set()
+    for Model in models:
+        tags.add(get_tag(Model))
+        tags |= {get_tag(field.related_model) for field in Model._meta.concrete_fields if field.many_to_one or field.one_to_one}
+    transaction.on_commit(partial(bump_tags, tags))
+
+
+@receiver([post_save, post_delete, bulk_changed])
+def _model_changed(sender, raw=False, **kwargs):
+    if raw: return
+    invalidate_models(sender)
+
+
+@receiver(m2m_changed)
+def _m2m_changed(sender, instance, model, action, **kwargs):
+    if not action.startswith('post_'): return
+    invalidate_models(sender, type(instance), model)
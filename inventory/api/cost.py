@@ -0,0 +1,191 @@
+
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.exceptions import FieldDoesNotExist
+from django.db import connections, router
+from graphql.language.ast import FragmentDefinition, OperationDefinition
+from graphql.type.definition import GraphQLList, GraphQLNonNull, get_named_type
+
+from .filters import CursorPaginationFilter, DjangoFilter, PaginationFilter
+from .parsing import expand_fragments, get_selection
+
+
+"""
+Query cost
+
+Estimates the cost of a query from its parsed selection before execution, queries over the budget of
+`GRAPHQL_COST['MAX_COST']` or nested deeper than `GRAPHQL_COST['MAX_DEPTH']` are rejected up front,
+instead of being aborted by `MetaBase.abort_request_if_timedout` after `GRAPHQL_TIMEOUT` ms of wasted work.
+
+Every object costs the weight of its type (`GRAPHQL_COST['WEIGHTS']`, 1 by default) plus the cost of its fields,
+times the number of objects its list is expected to return:
+
+- root lists return the rows of their table, taken from the database statistics,
+- nested lists the average number of children of a parent row (rows of the child table / rows of the parent table),
+- lookups and filters narrow the rows down by `FILTER_SELECTIVITY` each, a lookup by a unique field to one row,
+- pagination (`limit_to`, `first`, `limit`) caps them.
+
+Aggregates cost a fraction of the scanned rows, `AGGREGATE_ROW_WEIGHT` each.
+"""
+
+ROW_COUNT_KEY = 'api:cost:rows:{label}'
+
+
+def get_table_rows(Model):
+    """Return the estimated number of rows of `Model`'s table, PostgreSQL's planner statistics or a COUNT, cached."""
+
+    def _count():
+        connection = connections[router.db_for_read(Model)]
+        if connection.vendor == 'postgresql':
+            with connection.cursor() as cursor:
+                cursor.execute('SELECT reltuples::bigint FROM pg_class WHERE oid = %s::regclass', [Model._meta.db_table])
+                row = cursor.fetchone()
+            if row and row[0] >= 0:  # -1 for tables never analyzed
+                return row[0]
+        return Model._default_manager.count()
+
+    return cache.get_or_set(ROW_COUNT_KEY.format(label=Model._meta.label_lower), _count, settings.GRAPHQL_COST['STATISTICS_TIMEOUT'])
+
+
+def unwrap_type(graphql_type):
+    """Return (named type, is a list) of a field type."""
+    if isinstance(graphql_type, GraphQLNonNull):
+        graphql_type = graphql_type.of_type
+    return get_named_type(graphql_type), isinstance(graphql_type, GraphQLList)
+
+
+def get_node_type(graphql_type):
+    """Return the registered model type behind a GraphQL type, None for other types."""
+    graphene_type = getattr(graphql_type, 'graphene_type', None)
+    return graphene_type if getattr(getattr(graphene_type, '_meta', None), 'model', None) else None
+
+
+def is_unique_lookup(Model, key):
+    try:
+        field = Model._meta.get_field(key)
+    except FieldDoesNotExist:
+        return False
+    return field.primary_key or field.unique
+
+
+def get_cap(filters):
+    """Return the number of rows `limit` or `first` arguments of a custom type limit its lists to, None if there are none."""
+    caps = [int(filters[key]) for key in ('limit', 'first') if filters.get(key) is not None]
+    return min(caps) if caps else None
+
+
+class QueryCost:
+    """Cost of an operation, `report` is returned to clients of rejected queries."""
+
+    def __init__(self, config=None):
+        self.config = config or settings.GRAPHQL_COST
+        self.weights = self.config.get('WEIGHTS', {})
+        self.fields = {}  # {root response key: cost}
+        self.depth = 0
+
+    @property
+    def cost(self):
+        return sum(self.fields.values())
+
+    @property
+    def is_over_budget(self):
+        return self.cost > self.config['MAX_COST'] or self.depth > self.config['MAX_DEPTH']
+
+    @property
+    def report(self):
+        return {
+            'cost': round(self.cost),
+            'maxCost': self.config['MAX_COST'],
+            'depth': self.depth,
+            'maxDepth': self.config['MAX_DEPTH'],
+            'fields': {key: round(cost) for key, cost in self.fields.items()},
+        }
+
+    def analyze(self, schema, document_ast, variables=None, operation_name=None):
+        """Estimate the cost of the query operation of a document, other operations cost nothing."""
+        operations = [definition for definition in document_ast.definitions if isinstance(definition, OperationDefinition)]
+        operation = next((operation for operation in operations if operation_name is None or getattr(operation.name, 'value', None) == operation_name), None)
+        if operation is None or operation.operation != 'query':
+            return self
+
+        fragments = {definition.name.value: definition for definition in document_ast.definitions if isinstance(definition, FragmentDefinition)}
+        query_type = schema.get_query_type()
+        for field in expand_fragments(operation.selection_set.selections, fragments):  # root fields of fragments too
+            if not field.selection_set or field.name.value.startswith('__'):
+                continue  # scalar root fields and introspection, nothing to estimate
+            response_key = getattr(field.alias, 'value', None) or field.name.value
+            selection = get_selection(operation.selection_set, variables or {}, fragments, operation_name=response_key)
+            self.fields[response_key] = self.field_cost(query_type, None, selection, depth=1)
+        return self
+
+    def field_cost(self, parent_type, ParentType, selection, depth, cap=None):
+        field = parent_type.fields.get(selection.attribute)
+        if field is None or not selection.sub_selections:
+            return 0  # scalars are free, unknown fields are left to validation
+
+        self.depth = max(self.depth, depth)
+        graphql_type, is_list = unwrap_type(field.type)
+        graphene_type = getattr(graphql_type, 'graphene_type', None)
+        weight = self.weights.get(graphql_type.name, 1)
+
+        if hasattr(graphene_type, 'aggregate_of'):  # the filtered rows are scanned, nothing below is fetched
+            return self.rows(graphene_type.aggregate_of, None, selection.filters) * self.config['AGGREGATE_ROW_WEIGHT']
+
+        if hasattr(graphene_type, 'page_of'):  # the page filters apply to its items
+            items = next((sub_selection for sub_selection in selection.sub_selections if sub_selection.attribute == 'items'), None)
+            if items is None:
+                return weight
+            items_type = unwrap_type(graphql_type.fields['items'].type)[0]
+            return weight + self.rows(graphene_type.page_of, ParentType, selection.filters) * self.object_cost(items_type, items, depth + 1)
+
+        NodeType = get_node_type(graphql_type)
+        rows = self.rows(NodeType, ParentType, selection.filters, cap) if is_list else 1
+        # arguments of custom types (i.e. `searchParts(limit: 20)`) limit their lists
+        return rows * self.object_cost(graphql_type, selection, depth, cap=get_cap(selection.filters) if NodeType is None else None)
+
+    def object_cost(self, graphql_type, selection, depth, cap=None):
+        NodeType = get_node_type(graphql_type)
+        weight = self.weights.get(graphql_type.name, 1)
+        return weight + sum(self.field_cost(graphql_type, NodeType, sub_selection, depth + 1, cap=cap) for sub_selection in selection.sub_selections)
+
+    def rows(self, NodeType, ParentType, filters, cap=None):
+        """Return the expected number of objects of a list of `NodeType` under a `ParentType` object (None at the root)."""
+        if NodeType is None:
+            return cap or 1
+
+        Model = NodeType.Meta.model
+        if ParentType is None:
+            rows = get_table_rows(Model)
+        else:
+            rows = get_table_rows(Model) / max(get_table_rows(ParentType.Meta.model), 1)
+
+        lookups = dict(NodeType.get_lookups())
+        node_filters = getattr(NodeType.Meta, 'filters', {})
+        caps = [cap] if cap is not None else []
+        for key, value in filters.items():
+            Filter = node_filters.get(key)
+            if value is None or (key not in lookups and Filter is None):
+                continue
+            if Filter == PaginationFilter:
+                caps.append(value.get('limit_to'))
+            elif Filter == CursorPaginationFilter:
+                caps.append(value.get('first'))
+            elif Filter == DjangoFilter and not (value.get('filter') or value.get('exclude')):
+                continue  # ordering only
+            elif is_unique_lookup(Model, key):
+                rows = min(rows, 1)
+            else:
+                rows *= self.config['FILTER_SELECTIVITY']
+
+        caps = [int(item) for item in caps if item is not None]
+        if caps:
+            rows = min(rows, *caps)
+        return max(rows, 1)
+
+
+def analyze_query(schema, document_ast, variables=None, operation_name=None):
+    """Return the QueryCost of a document, None if the analysis is turned off."""
+    if not settings.GRAPHQL_COST:
+        return None
+    return QueryCost().analyze(schema, document_ast, variables, operation_name)
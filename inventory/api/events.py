@@ -0,0 +1,116 @@
+
+
+import base64
+import json
+import time
+
+from django.conf import settings
+from django.contrib.auth.models import AnonymousUser
+from django.db import connections
+from django.http import HttpRequest, QueryDict
+from django.http.cookie import parse_cookie
+from graphql_jwt.exceptions import JSONWebTokenError
+from graphql_jwt.shortcuts import get_user_by_token
+from graphql_jwt.utils import get_credentials
+
+from utils.misc import parse_event
+
+from .meta import request_context
+from .views import GraphQLView
+
+
+"""
+API Gateway events
+
+`EventHandler` executes GraphQL requests of API Gateway HTTP API (payload v2) events, the Lambda entry point is
+`config.aws_lambda.handler`. The event becomes a bare HttpRequest handed straight to the GraphQLView, so persisted
+queries, the response cache, the cost analysis and the timeout work as they do behind Django, but Django's middleware,
+sessions and URL routing are skipped. Without sessions the user is authenticated by the JWT of the `Authorization`
+header (`JWT <token>`) or the JWT cookie.
+
+The handler lives as long as the Lambda container, with the schema, the document, persisted query and response caches
+and the database connections, invocations of a container never run concurrently. Connections idle for longer
+than `GRAPHQL_EVENTS_CONNECTION_CHECK_AFTER` seconds are checked before reuse, the database may have dropped them
+while the container was frozen.
+
+`manage.py invoke_event` runs recorded events (config/events/*.json) locally, `manage.py benchmark_events` compares
+the overhead of an invocation to the GraphQLView behind the Django request cycle.
+"""
+
+
+def get_request(event):
+    """Return an HttpRequest with the method, query string, headers, cookies and body of the event."""
+    method, query_kwargs = parse_event(event)
+
+    request = HttpRequest()
+    request.method = method.upper()
+    request.path = request.path_info = event.get('rawPath', '/')
+    request.GET = QueryDict(mutable=True)
+    request.GET.update(query_kwargs)
+
+    for name, value in (event.get('headers') or {}).items():
+        key = name.upper().replace('-', '_')
+        request.META[key if key in ('CONTENT_TYPE', 'CONTENT_LENGTH') else f'HTTP_{key}'] = value
+    request.COOKIES = parse_cookie('; '.join(event.get('cookies') or []))
+
+    body = event.get('body') or ''
+    request._body = base64.b64decode(body) if event.get('isBase64Encoded') else body.encode('utf-8')
+    return request
+
+
+def get_user(request):
+    """Return the user of the request's JWT, AnonymousUser without one, raise JSONWebTokenError for an invalid one."""
+    token = get_credentials(request)
+    return get_user_by_token(token) if token else AnonymousUser()
+
+
+def get_event_response(response):
+    """Return the API Gateway response of an HttpResponse."""
+    return {
+        'statusCode': response.status_code,
+        'headers': dict(response.items()),
+        'cookies': [morsel.OutputString() for morsel in response.cookies.values()],
+        'body': response.content.decode('utf-8'),
+        'isBase64Encoded': False,
+    }
+
+
+def get_error_response(status_code, message):
+    return {
+        'statusCode': status_code,
+        'headers': {'Content-Type': 'application/json'},
+        'body': json.dumps({'errors': [{'message': message}]}),
+        'isBase64Encoded': False,
+    }
+
+
+class EventHandler:
+    """Lambda handler, one GraphQLView for all the invocations of a container."""
+
+    def __init__(self, view=None):
+        self.view = view or GraphQLView()
+        self.last_invocation = None
+
+    def __call__(self, event, context=None):
+        self._check_connections()
+        try:
+            with request_context():  # what MetaCleanupMiddleware does behind Django
+                request = get_request(event)
+                try:
+                    request.user = get_user(request)
+                except JSONWebTokenError as e:
+                    return get_error_response(401, str(e))
+                return get_event_response(self.view.dispatch(request))
+        finally:
+            self.last_invocation = time.monotonic()
+
+    def _check_connections(self):
+        """Close the connections that broke or that the database dropped while the container was idle, they reconnect on use."""
+        idle = time.monotonic() - self.last_invocation if self.last_invocation is not None else 0
+        for connection in connections.all():
+            if connection.connection is None:
+                continue
+            if connection.errors_occurred or idle > settings.GRAPHQL_EVENTS_CONNECTION_CHECK_AFTER:
+                if not connection.is_usable():
+                    connection.close()
+                connection.errors_occurred = False
@@ -59,3 +59,22 @@ class TimeoutExit(BaseException):
     as exit(), so use with very high caution.
     """
     message = "The request timed out."
+
+
+class PersistedQueryNotFound(Exception):
+    message = "PersistedQueryNotFound"
+
+    def __init__(self, query_hash):
+        self.query_hash = query_hash
+        super().__init__(f"{self.message}: no persisted query with hash {query_hash}.")
+
+
+class QueryCostExceeded(Exception):
+    message = "QueryCostExceeded"
+
+    def __init__(self, report):
+        self.report = report
+        super().__init__(
+            f"{self.message}: the estimated cost {report['cost']} (depth {report['depth']}) is over the budget "
+            f"{report['maxCost']} (depth {report['maxDepth']}), paginate the lists or select less."
+        )
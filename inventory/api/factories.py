@@ -1,44 +1,150 @@
 
 
-from .filters import FilterSet
+from .aggregates import aggregate_qs
+from .filters import CursorPaginationFilter, FilterSet, PAGINATION_FILTERS
+from .loaders import get_loader
 from .meta import popmeta, meta_base
-from .parsing import selection_from_info
+from .parsing import Selection, selection_from_info
 
 from utils.string import camel_to_snake
 
+from django.core.exceptions import FieldDoesNotExist
 from django.db.models import Prefetch
+from django.db.models.fields.related_descriptors import ForwardManyToOneDescriptor
 from graphql_jwt.decorators import login_required
 
 
-def qs_resolver_factory(NodeType, single=False, source_fieldname=None):
+def prefetch_attr(response_key):
+    """Attribute holding the prefetched objects of the sub-selection `response_key` (its alias or field name)."""
+    return f'_prefetched_{response_key}'
+
+
+def is_forward_fk(NodeType, attribute):
+    return isinstance(getattr(NodeType.Meta.model, attribute, None), ForwardManyToOneDescriptor)
+
+
+def get_columns(NodeType, relevant_fields, link=None):
     """
-    Return a default Django qs resolver.
+    Return the concrete fields a selection needs loaded, None if any of them is computed by unknown means.
+
+    Foreign keys of nested fields are kept for their resolvers and prefetches, `link` is the foreign key back
+    to the parent of a prefetched sub-selection, Django matches the prefetched rows to their parents by it.
+    """
+    Model = NodeType.Meta.model
+    nested_names = {nested_field.name for nested_field in NodeType.get_nested_fields()}
+    columns = {Model._meta.pk.name} | ({link} if link else set())
+
+    for name in relevant_fields - {'__typename'}:
+        try:
+            field = Model._meta.get_field(name)
+        except FieldDoesNotExist:
+            return None  # a property or an annotation, any column might be used
+        if field.concrete:
+            columns.add(field.name)
+        elif name not in nested_names:
+            return None
+
+    return columns
+
+
+def is_leaf_selection(NodeType, relevant_fields):
+    """Whether every selected field is a plain column, so rows can be dicts resolved by graphene's default resolver."""
+    Model = NodeType.Meta.model
+    for name in relevant_fields - {'__typename'}:
+        field = Model._meta.get_field(name)
+        if field.is_relation or hasattr(NodeType, f"resolve_{name}"):
+            return False
+    return True
+
+
+class SelectionPlan:
+    """
+    The part of a query plan given by the fields of a selection, the same whatever the values of its arguments.
+
+    relevant_fields: Model attributes of the selected fields.
+    nested: (index of the sub-selection, attribute, its NodeType, is a forward FK, FK back to the parent) of every
+            nested sub-selection that might be prefetched, manually resolved fields are left to their resolvers.
+    select_related, prefetch_related: Meta options of the NodeType narrowed down to the selected fields.
+    columns: Columns to load, None to load all of them.
+    is_leaf: Whether the rows can be plain dicts.
+    """
+
+    def __init__(self, NodeType, selection, link=None):
+        Model = NodeType.Meta.model
+        nested_fields = {nested_field.name: nested_field for nested_field in NodeType.get_nested_fields()}
+
+        self.relevant_fields = set()
+        self.nested = []
+        for index, sub_selection in enumerate(selection.sub_selections):
+            attribute = NodeType.alias_to_attribute(camel_to_snake(sub_selection.attribute))
+            self.relevant_fields.add(attribute)
+
+            if hasattr(NodeType, f"resolve_{attribute}") or attribute not in nested_fields:
+                continue  # manually resolved or a plain field
+
+            field = Model._meta.get_field(attribute)
+            link_back = field.field.name if field.auto_created and not field.many_to_many else None  # the FK of a reverse relation
+            self.nested.append((index, attribute, nested_fields[attribute].Type, is_forward_fk(NodeType, attribute), link_back))
+
+        select_related = getattr(NodeType.Meta, 'select_related', [])
+        self.select_related = [item for item in select_related if item in self.relevant_fields or item.split('__')[0] in self.relevant_fields]
+
+        prefetch_related = getattr(NodeType.Meta, 'prefetch_related', [])
+        # Prefetch related is either an iterable or a dictionary {schema_field: field_to_prefetch}
+        prefetch_related = prefetch_related if type(prefetch_related) == dict else {item: item for item in prefetch_related}  # iterable -> dict
+        # Favour Prefetch objects over plain attribute names, because they might include further sub-prefetches
+        prefetch_related = {attribute: prefetch for attribute, prefetch in prefetch_related.items() if prefetch not in prefetch_related.keys()}
+        # Do not prefetch fields that are not mention by the query
+        self.prefetch_related = {attribute: prefetch for attribute, prefetch in prefetch_related.items() if attribute in self.relevant_fields}
+
+        self.columns = get_columns(NodeType, self.relevant_fields, link)
+        if self.columns is not None:
+            self.columns |= {item.split('__')[0] for item in self.select_related}
+        self.is_leaf = self.columns is not None and is_leaf_selection(NodeType, self.relevant_fields)
+
+
+def get_plan(NodeType, selection, link=None):
+    """Return the SelectionPlan of `selection`, kept on its template, so persisted queries plan each selection once."""
+    plans = selection.get_template().plans
+    if (NodeType, link) not in plans:
+        plans[NodeType, link] = SelectionPlan(NodeType, selection, link)
+    return plans[NodeType, link]
+
+
+def qs_resolver_factory(NodeType, single=False, source_fieldname=None, page=False):
+    """
+    Return a default Django qs resolver, or with `page` the resolver of a `<name>Page` root field.
 
     Is by default applied during Django Model registration when using the @query decorator or defining nested fields with @node.
     Parameters are taken from the child Model's type definition.
+
+    The root resolver plans the whole query: every nested sub-selection becomes a `Prefetch` of its own filtered
+    queryset, stored in an attribute specific to its alias, so the same field asked for twice with different filters
+    doesn't share results. Nested resolvers read that attribute and only fall back to querying per parent object
+    for sub-selections that can't be prefetched (paginated ones, Django can't prefetch sliced querysets).
     """
 
-    def _get_relevant_fields_and_subpfs(NodeType, selection):
-        """Extract fields asked for in the query and construct Prefetch objects for sub-selections."""
+    def _get_subpfs(selection, plan):
+        """Construct Prefetch objects for the nested sub-selections."""
         sub_pfs = dict()
-        relevant_fields = set()
 
-        sub_selections = [s for s in selection.sub_selections if not hasattr(NodeType, f"resolve_{s.attribute}")]
+        for index, attribute, SubNodeType, is_fk, link in plan.nested:
+            sub_selection = selection.sub_selections[index]
 
-        for sub_selection in sub_selections:
-            attribute = NodeType.alias_to_attribute(sub_selection.attribute)
-            relevant_fields.add(camel_to_snake(attribute))
-            try:
-                SubNodeType = NodeType.get_field_type(attribute)
-                sub_pf = construct_qs(SubNodeType, sub_selection)
-                sub_pfs[attribute] = sub_pf
-            except AttributeError:
-                # we hit a manually added field, so it's not on nested types
-                pass
+            sub_filters = getattr(SubNodeType.Meta, 'filters', {})
+            if any(sub_filters.get(key) in PAGINATION_FILTERS for key in sub_selection.filters):
+                continue
 
-        return relevant_fields, sub_pfs
+            # a plain foreign key goes to the field cache, Django repeats nested single-valued `to_attr` prefetches
+            to_attr = not is_fk or sub_selection.alias or sub_selection.filters
+            prefetch = construct_qs(SubNodeType, sub_selection, attribute=attribute, to_attr=to_attr, link=link)
+            if is_fk and not sub_selection.filters and not prefetch.queryset._prefetch_related_lookups:
+                continue  # nothing to plan below, the ForeignKeyLoader batches it, sharing objects between aliases
+            sub_pfs[sub_selection.alias or sub_selection.attribute] = prefetch
 
-    def construct_qs(NodeType, selection, root=False):
+        return sub_pfs
+
+    def construct_qs(NodeType, selection, root=False, attribute=None, to_attr=True, link=None):
 
         _ = selection.filters.pop('meta', None)  # popping the meta so it's not used as a filter parameter
 
@@ -48,25 +154,27 @@ def qs_resolver_factory(NodeType, single=False, source_fieldname=None):
         Model = NodeType.Meta.model
         qs = getattr(NodeType.Meta, 'queryset', Model.objects.all())
 
-        relevant_fields, sub_pfs = _get_relevant_fields_and_subpfs(NodeType, selection)
-
-        select_related = getattr(NodeType.Meta, 'select_related', [])
-        select_related = [item for item in select_related if item in relevant_fields or item.split('__')[0] in relevant_fields]
+        plan = get_plan(NodeType, selection, link)
+        sub_pfs = _get_subpfs(selection, plan)
 
-        prefetch_related = getattr(NodeType.Meta, 'prefetch_related', [])
-        # Prefetch related is either an iterable or a dictionary {schema_field: field_to_prefetch}
-        prefetch_related = prefetch_related if type(prefetch_related) == dict else {item: item for item in prefetch_related}  # iterable -> dict
-        # prefetch_related.update(sub_pfs)  # add Prefetch objects from _get_relevant_fields_and_subpfs  # TODO this breaks filtering of subfields when asked for twice on an object
-        # Favour Prefetch objects over plain attribute names, because they might include further sub-prefetches
-        prefetch_related = {attribute: prefetch for attribute, prefetch in prefetch_related.items() if prefetch not in prefetch_related.keys()}
-        # Do not prefetch fields that are not mention by the query
-        prefetch_related = [prefetch for attribute, prefetch in prefetch_related.items() if attribute in relevant_fields]
+        # Do not prefetch fields planned from the sub-selections
+        planned = {prefetch.prefetch_through for prefetch in sub_pfs.values()}
+        prefetch_related = [prefetch for attribute, prefetch in plan.prefetch_related.items() if attribute not in planned]
+        # Related objects of a select_related come with the rows already
+        sub_pfs = [prefetch for prefetch in sub_pfs.values() if prefetch.prefetch_through not in plan.select_related]
 
         # empty select_related would fetch all related fields!
-        if select_related:
-            qs = qs.select_related(*select_related)
-        if prefetch_related:
-            qs = qs.prefetch_related(*prefetch_related)
+        if plan.select_related:
+            qs = qs.select_related(*plan.select_related)
+        if prefetch_related or sub_pfs:
+            qs = qs.prefetch_related(*prefetch_related, *sub_pfs)
+
+        # Load only the selected columns, a root selecting plain columns only skips model instances altogether
+        if plan.columns is not None:
+            if root and not plan.select_related and not prefetch_related and plan.is_leaf:
+                qs = qs.values(*plan.columns)
+            else:
+                qs = qs.only(*plan.columns)
 
         qs = filter_set.apply(qs)
 
@@ -76,8 +184,7 @@ def qs_resolver_factory(NodeType, single=False, source_fieldname=None):
         if root:
             out = qs
         else:
-            attribute = NodeType.alias_to_attribute(selection.attribute)
-            out = Prefetch(attribute, qs)
+            out = Prefetch(attribute, qs, to_attr=prefetch_attr(selection.alias or selection.attribute) if to_attr else None)
         return out
 
     def _resolve_child_qs(obj, ParentType, lookups):
@@ -93,11 +200,38 @@ def qs_resolver_factory(NodeType, single=False, source_fieldname=None):
 
         return qs
 
+    def _resolve_page(NodeType, info, lookups):
+        """
+        Resolve the `items` of a cursor page as a root selection and its `pageInfo`.
+
+        One row more than `first` is loaded to tell whether there's a next page, no COUNT query.
+        """
+        selection = selection_from_info(info, lookups=lookups)
+        items = next((sub_selection for sub_selection in selection.sub_selections if sub_selection.attribute == 'items'), None)
+
+        cursor_filter = NodeType.get_cursor_filter()
+        cursor = selection.filters.get(cursor_filter) or {}
+        first = int(cursor['first']) if cursor.get('first') is not None else None  # literal arguments parse into strings
+        filters = {**selection.filters, cursor_filter: {**cursor, 'first': first + 1} if first is not None else cursor}
+
+        items_selection = Selection(selection.attribute, filters, items.sub_selections if items else [], alias=selection.alias)
+        items_selection.template = items.get_template() if items else None  # the items are planned once per template
+        qs = construct_qs(NodeType, items_selection, root=True)
+
+        rows = list(qs)
+        has_next_page = first is not None and len(rows) > first
+        rows = rows[:first] if first is not None else rows
+        end_cursor = CursorPaginationFilter.get_cursor(qs, rows[-1]) if rows else cursor.get('after')
+        return {'items': rows, 'page_info': {'end_cursor': end_cursor, 'has_next_page': has_next_page}}
+
     @login_required
     @popmeta
     def qs_resolver(obj, info, **kwargs):
 
-        NodeType = info.return_type.of_type.graphene_type
+        if page:
+            NodeType = info.return_type.fields['items'].type.of_type.graphene_type
+        else:
+            NodeType = info.return_type.of_type.graphene_type
         ParentType = info.parent_type.graphene_type
 
         available_qs_lookups = dict(NodeType.get_lookups())
@@ -105,16 +239,41 @@ def qs_resolver_factory(NodeType, single=False, source_fieldname=None):
 
         lookups = {key: value for key, value in kwargs.items() if key in available_qs_lookups or key in available_filters}
 
-        selection = selection_from_info(info, lookups=lookups)
-
         if source_fieldname:
+            prefetched = getattr(obj, prefetch_attr(info.path[-1]), None)
+            if prefetched is not None:
+                return prefetched
             return _resolve_child_qs(obj, ParentType, lookups)
+        elif page:
+            return _resolve_page(NodeType, info, lookups)
         else:
+            selection = selection_from_info(info, lookups=lookups)
             return construct_qs(NodeType, selection, root=True)
 
     return qs_resolver
 
 
+def aggregate_resolver_factory(NodeType):
+    """Return the resolver of a `<name>Aggregate` root field, the filtered queryset grouped and aggregated by api.aggregates."""
+
+    @login_required
+    @popmeta
+    def aggregate_resolver(obj, info, aggregates, group_by=None, **kwargs):
+        available_qs_lookups = dict(NodeType.get_lookups())
+        available_filters = {key: Filter for key, Filter in getattr(NodeType.Meta, 'filters', {}).items() if Filter not in PAGINATION_FILTERS}
+
+        lookups = {key: value for key, value in kwargs.items() if key in available_qs_lookups or key in available_filters}
+
+        qs = getattr(NodeType.Meta, 'queryset', NodeType.Meta.model.objects.all())
+        qs = FilterSet(available_filters, **lookups).apply(qs)
+
+        meta_base.abort_request_if_timedout()  # can cause a TimeoutExit
+
+        return aggregate_qs(NodeType, qs, group_by, aggregates)
+
+    return aggregate_resolver
+
+
 def getattr_resolver_factory(attr):
     """Create a simple getattr resolver method with default return value None."""
 
@@ -122,3 +281,31 @@ def getattr_resolver_factory(attr):
         return getattr(obj, attr, None)
 
     return getattr_resolver
+
+
+def fk_loader_resolver_factory(field):
+    """
+    Create a ForeignKey/OneToOneField resolver batching the related objects of all sibling rows.
+
+    Objects prefetched by the root qs_resolver or cached on the instance (i.e. by `select_related`) are returned
+    without touching the loader.
+    """
+
+    def fk_loader_resolver(obj, info):
+        attr = prefetch_attr(info.path[-1])
+        if hasattr(obj, attr):  # planned by the root qs_resolver
+            return getattr(obj, attr)
+        if field.is_cached(obj):
+            return field.get_cached_value(obj)
+
+        key = getattr(obj, field.attname)
+        if key is None:
+            return None
+
+        def _cache(related):
+            field.set_cached_value(obj, related)
+            return related
+
+        return get_loader(field).load(key).then(_cache)
+
+    return fk_loader_resolver
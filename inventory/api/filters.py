@@ -1,11 +1,15 @@
+import base64
 import graphene
+import json
 import re
 
 from .parsing import DjangoLookup
 from utils.misc import eval_or_none
 from utils.string import camel_to_snake
 
-from django.db.models import QuerySet
+from django.core.exceptions import FieldDoesNotExist
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import F, Q, QuerySet
 
 
 class PaginationFilter:
@@ -26,6 +30,121 @@ class PaginationFilter:
         return qs[offset:]
 
 
+class CursorPaginationFilter:
+    """
+    Keyset pagination, pages continue after the ordering key of the last row instead of skipping `offset` rows.
+
+    The ordering is the `order_by` of the DjangoFilter or the model's default ordering, completed with the primary key,
+    so every row has a unique key. A page after `cursor` is `WHERE (uuid, id) > (cursor uuid, cursor id)` in the
+    index order, deep pages cost the same as the first one and concurrent inserts don't shift them.
+    The keys of every row are annotated (`_cursor_0`, ...), `get_cursor` encodes them into the cursor of a row.
+    NULLs sort last ascending and first descending on all backends.
+    """
+    class CursorInput(graphene.InputObjectType):
+        first = graphene.Int(description="Limit the results to the first ``n`` after the cursor.")
+        after = graphene.String(description="Return the results after this cursor, the ``endCursor`` of the previous page.")
+
+    input = CursorInput()
+
+    ANNOTATION_PREFIX = '_cursor_'
+
+    def apply(self, qs, cursor_object):
+        keys = get_keyset_ordering(qs)
+
+        qs = qs.annotate(**{f'{self.ANNOTATION_PREFIX}{i}': F(path) for i, (path, _) in enumerate(keys)})
+        qs = qs.order_by(*[F(path).desc(nulls_first=True) if descending else F(path).asc(nulls_last=True) for path, descending in keys])
+
+        if cursor_object.get('after'):
+            qs = qs.filter(keyset_after(qs.model, keys, decode_cursor(cursor_object['after'])))
+        if cursor_object.get('first') is not None:
+            qs = qs[:int(cursor_object['first'])]
+        return qs
+
+    @classmethod
+    def get_cursor(cls, qs, row):
+        """Return the cursor of `row`, a model instance or a dict of `qs` paginated by this filter."""
+        names = [name for name in qs.query.annotations if name.startswith(cls.ANNOTATION_PREFIX)]
+        values = [row[name] if isinstance(row, dict) else getattr(row, name) for name in names]
+        return encode_cursor(values)
+
+
+def encode_cursor(values):
+    return base64.urlsafe_b64encode(json.dumps(values, cls=DjangoJSONEncoder).encode('utf-8')).decode('ascii')
+
+
+def decode_cursor(cursor):
+    try:
+        values = json.loads(base64.urlsafe_b64decode(cursor.encode('ascii')))
+    except ValueError:  # binascii, JSON and non-ASCII errors are all ValueErrors
+        values = None
+    if not isinstance(values, list):
+        raise ValueError(f'Invalid cursor {cursor}.')
+    return values
+
+
+def get_keyset_ordering(qs):
+    """Return [(field path, descending)] ordering `qs`, ending with the primary key."""
+    ordering = qs.query.order_by or (qs.model._meta.ordering if qs.query.default_ordering else ())
+    keys = []
+    for item in ordering:
+        if not isinstance(item, str) or item == '?':
+            raise ValueError(f'Cursor pagination can only order by fields, found {item}.')
+        keys.append((item.lstrip('-'), item.startswith('-')))
+
+    if not any(path in ('pk', qs.model._meta.pk.name) for path, _ in keys):
+        keys.append(('pk', False))
+    return keys
+
+
+def is_nullable(Model, path):
+    """Whether the field at `path` (i.e. 'part__comp_magnitude') can be NULL, following nullable relations too."""
+    for name in path.split('__'):
+        if name == 'pk':
+            return False
+        try:
+            field = Model._meta.get_field(name)
+        except FieldDoesNotExist:
+            return True
+        if field.null or (field.is_relation and not field.concrete):
+            return True
+        Model = field.related_model or Model
+    return False
+
+
+def keyset_after(Model, keys, values):
+    """Q of the rows following `values` of the ordering `keys`, `(a, b) > (x, y)` is `a > x OR (a = x AND b > y)`."""
+    if len(values) != len(keys):
+        raise ValueError('The cursor belongs to another ordering.')
+
+    after = None
+    equal = Q()
+    for (path, descending), value in zip(keys, values):
+        if value is None:
+            strictly_after = Q(**{f'{path}__isnull': False}) if descending else None  # NULLs are first descending, last ascending
+            same = Q(**{f'{path}__isnull': True})
+        else:
+            strictly_after = Q(**{f'{path}__{"lt" if descending else "gt"}': value})
+            if not descending and is_nullable(Model, path):
+                strictly_after |= Q(**{f'{path}__isnull': True})
+            same = Q(**{path: value})
+
+        if strictly_after is not None:
+            after = equal & strictly_after if after is None else after | (equal & strictly_after)
+        equal &= same
+
+    if after is None:
+        return Q(pk__in=[])
+
+    # bound the leading key, so the rows come from an index range scan
+    path, descending = keys[0]
+    if values[0] is not None and not is_nullable(Model, path):
+        after &= Q(**{f'{path}__{"lte" if descending else "gte"}': values[0]})
+    return after
+
+
+PAGINATION_FILTERS = PaginationFilter, CursorPaginationFilter
+
+
 class FilterSet:
     """Represents a set of filters for one GraphQL selection or sub-selection."""
     def __init__(self, filters, **kwargs):
@@ -37,20 +156,20 @@ class FilterSet:
         return f"<Filter {self.filters}, {self.kwargs}>"
 
     def apply(self, qs):
-        pagination = None
+        paginations = []
 
         for filter_field, Filter in self.filters.items():
             value = self.kwargs.pop(filter_field, None)
 
             # Save pagination as the last filter that applies
-            if Filter == PaginationFilter:
-                pagination = Filter, value
+            if Filter in PAGINATION_FILTERS:
+                paginations.append((Filter, value))
             else:
                 qs = self._apply_single(qs, Filter, value)
 
         qs = qs.filter(**self.kwargs)
 
-        if pagination:
+        for pagination in sorted(paginations, key=lambda pagination: pagination[0] == PaginationFilter):  # cursor first, slicing last
             qs = self._apply_single(qs, *pagination)
 
         return qs
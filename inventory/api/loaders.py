@@ -0,0 +1,44 @@
+
+
+from promise import Promise
+from promise.dataloader import DataLoader
+
+from .meta import meta_base
+
+
+"""
+Loaders
+
+Request scoped DataLoaders for foreign key fields. Every `part { ... }` of a list of order parts asks the
+same loader for its id, graphql-core resolves siblings before it runs the queued promises, so the loader
+gets all ids of one level at once and fetches them with a single `id__in` query.
+
+A query nesting foreign keys N levels deep sends N queries on top of the root one, whatever the row count.
+Loaders live on MetaBase, so they're dropped with the rest of the request context by MetaCleanupMiddleware.
+"""
+
+
+class ForeignKeyLoader(DataLoader):
+    """Load the related objects of a ForeignKey/OneToOneField by the values of its column."""
+
+    def __init__(self, field):
+        super().__init__()
+        self.field = field
+        self.Model = field.related_model
+        self.target = field.target_field.attname
+
+    def __repr__(self):
+        return f"<ForeignKeyLoader {self.field.model.__name__}.{self.field.name}>"
+
+    def batch_load_fn(self, keys):
+        objects = self.Model._base_manager.filter(**{f'{self.target}__in': set(keys)})
+        objects = {getattr(obj, self.target): obj for obj in objects}
+        return Promise.resolve([objects.get(key) for key in keys])
+
+
+def get_loader(field):
+    """Return the ForeignKeyLoader of `field` for the current request."""
+    key = field.model, field.name
+    if key not in meta_base.loaders:
+        meta_base.loaders[key] = ForeignKeyLoader(field)
+    return meta_base.loaders[key]
@@ -1,5 +1,7 @@
 import time
-from threading import local
+
+from contextlib import contextmanager
+from contextvars import ContextVar
 
 from django.conf import settings
 
@@ -16,6 +18,12 @@ Purpose:
     1) handle anonymised end-user context in a form of attributes. i.e. language, diets, age...
     2) incorporate this context as a part of the schema for readability
     3) handle different context for each operation run in a single graphql query (support multiple operations)
+
+The state of a request (operation metas, start time of the timeout, warnings and loaders) is a RequestContext
+held in a context variable, each thread and each asyncio task sees its own. `request_context()` creates a fresh one
+for a request and restores the previous one when it ends, MetaCleanupMiddleware wraps every Django request in it,
+api.events.EventHandler every Lambda invocation. Code outside of a request (shell, management commands) gets a context
+of its own on first use, `reset_meta` starts it over.
 """
 
 def popmeta(function):
@@ -29,21 +37,61 @@ def popmeta(function):
     return _popmeta
 
 
-class MetaBase(local, metaclass=Singleton):
+class RequestContext:
+    """State of a single request."""
+
+    def __init__(self):
+        self.query_meta_dict = {'default': QueryMeta()}
+        self.active_query = None
+        self.start_time = time.time()
+        self.warnings = []
+        self.loaders = {}  # {(model, field name): ForeignKeyLoader} of the request
+
+
+_request_context = ContextVar('request_context', default=None)
+
+
+def get_request_context():
+    """Return the RequestContext of the current request, create one outside of a request."""
+    context = _request_context.get()
+    if context is None:
+        context = RequestContext()
+        _request_context.set(context)
+    return context
+
+
+@contextmanager
+def request_context():
+    """Run the block in a fresh RequestContext, the previous one is restored afterwards."""
+    token = _request_context.set(RequestContext())
+    try:
+        yield _request_context.get()
+    finally:
+        _request_context.reset(token)
+
+
+class MetaBase(metaclass=Singleton):
     """
     Meta base class.
 
-    MetaBase holds a single QueryMeta per graphene operation in a single request.
+    MetaBase holds a single QueryMeta per graphene operation in a single request, in the RequestContext of the request.
     """
 
-    _query_meta_dict = {}
-    _active_query = None
-    cache_key_prefix = None
-    warnings = []
+    @property
+    def context(self):
+        return get_request_context()
 
-    def __init__(self):
-        self._query_meta_dict['default'] = QueryMeta()
-        self._start_time = time.time()
+    @property
+    def _query_meta_dict(self):
+        return self.context.query_meta_dict
+
+    @property
+    def warnings(self):
+        return self.context.warnings
+
+    @property
+    def loaders(self):
+        return self.context.loaders
 
     def to_dict(self):
         return [{
@@ -55,22 +103,19 @@ class MetaBase(local, metaclass=Singleton):
         self._query_meta_dict[query_name] = meta
 
     def get_meta(self):
-        try:
-            return self._query_meta_dict.get(self._active_query, self._query_meta_dict['default'])
-        except KeyError:
-            self._query_meta_dict['default'] = QueryMeta()
-            return self._query_meta_dict['default']
+        context = self.context
+        return context.query_meta_dict.get(context.active_query, context.query_meta_dict['default'])
 
     def activate_query(self, query_name):
         if query_name not in self._query_meta_dict:
             raise KeyError(f"Meta activation error, cannot find meta for operation: {query_name}.")
-        self._active_query = query_name
+        self.context.active_query = query_name
 
     def active_query(self):
-        return self._active_query
+        return self.context.active_query
 
     def execution_time(self):
-        return (time.time() - self._start_time) * 1000
+        return (time.time() - self.context.start_time) * 1000
 
     def abort_request_if_timedout(self):
         """
@@ -85,15 +130,10 @@ class MetaBase(local, metaclass=Singleton):
             raise TimeoutExit()
 
     def reset_execution_time(self):
-        self._start_time = time.time()
+        self.context.start_time = time.time()
 
     def reset(self):
-        self._query_meta_dict = {}
-        self._active_query = None
-        self._query_meta_dict['default'] = QueryMeta()
-        self.reset_execution_time()
-        self.cache_key_prefix = None
-        self.warnings = []
+        _request_context.set(RequestContext())
 
     def add_warning(self, warning):
         self.warnings.append(warning)
@@ -1,5 +1,5 @@
 
-from .meta import QueryMeta, reset_meta, meta_base
+from .meta import QueryMeta, meta_base, request_context
 from .parsing import get_operation_name
 from .utils import is_root_info
 
@@ -42,12 +42,10 @@ class TimeoutMiddleware:
 
 
 class MetaCleanupMiddleware:
-    """Resets BaseMeta when request is fullfiled."""
+    """Runs every request in a fresh RequestContext of MetaBase, dropped when the request is fullfiled."""
     def __init__(self, get_response):
         self.get_response = get_response
 
     def __call__(self, request):
-        reset_meta()
-        response = self.get_response(request)
-        reset_meta()
-        return response
+        with request_context():
+            return self.get_response(request)
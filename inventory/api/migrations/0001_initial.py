@@ -0,0 +1,29 @@
+# Generated by Django 3.2.9 on 2026-10-18 19:05
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PersistedQuery',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created', models.DateTimeField(default=django.utils.timezone.now)),
+                ('modified', models.DateTimeField(default=django.utils.timezone.now)),
+                ('hash', models.CharField(editable=False, max_length=64, unique=True)),
+                ('name', models.CharField(blank=True, max_length=256)),
+                ('query', models.TextField()),
+            ],
+            options={
+                'verbose_name_plural': 'persisted queries',
+            },
+        ),
+    ]
@@ -0,0 +1,65 @@
+
+
+import hashlib
+
+from django.core.exceptions import ValidationError
+from django.db import models
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from graphql.error import GraphQLError
+
+from core.models import TimestampModel
+
+
+class PersistedQuery(TimestampModel):
+    """A GraphQL document registered ahead of time, clients send its `hash` instead of the query."""
+
+    hash = models.CharField(max_length=64, unique=True, editable=False)
+    name = models.CharField(max_length=256, blank=True)
+    query = models.TextField()
+
+    class Meta:
+        verbose_name_plural = 'persisted queries'
+
+    def __str__(self):
+        return f"{self.name or 'anonymous'} ({self.hash[:12]})"
+
+    def clean(self):
+        from api.persisted import validate_query
+        try:
+            validate_query(self.query)
+        except GraphQLError as e:
+            raise ValidationError({'query': str(e)})
+
+    def save(self, *args, **kwargs):
+        self.hash = self.get_hash(self.query)
+        return super().save(*args, **kwargs)
+
+    @classmethod
+    def get_hash(cls, query):
+        """sha256 hex digest of the document, as sent by Apollo clients in `extensions.persistedQuery.sha256Hash`."""
+        return hashlib.sha256(query.encode('utf-8')).hexdigest()
+
+    @classmethod
+    def persist(cls, query, name=''):
+        """Validate `query` against the schema and register it, return the PersistedQuery."""
+        from api.persisted import validate_query
+
+        operation_names = validate_query(query)
+        persisted_query, _ = cls.objects.update_or_create(hash=cls.get_hash(query), defaults={
+            'query': query,
+            'name': name or ', '.join(operation_names),
+        })
+        return persisted_query
+
+
+@receiver([post_save, post_delete], sender=PersistedQuery)
+def _persisted_queries_changed(sender, raw=False, **kwargs):
+    if raw: return
+    from api.persisted import invalidate_catalogue
+    invalidate_catalogue()
+
+
+# connect the response cache invalidation signals
+from . import cache  # noqa
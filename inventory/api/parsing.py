@@ -5,7 +5,34 @@ from utils.misc import eval_or_none
 from utils.string import camel_to_snake
 
 from django.db.models import Q, QuerySet
-from graphql.language.ast import Field, FragmentSpread, ListValue, Variable, ObjectValue
+from graphql.language.ast import Field, FragmentSpread, InlineFragment, ListValue, Variable, ObjectValue
+
+
+class VariablePlaceholder:
+    """Stands for a variable in the filters of a Selection template, replaced by its value in `Selection.bind`."""
+
+    def __init__(self, name):
+        self.name = name
+
+    def __repr__(self):
+        return f"<VariablePlaceholder ${self.name}>"
+
+
+class PlaceholderVariables:
+    """Variable values parsing a Selection template, every variable parses into its placeholder."""
+
+    def get(self, name, default=None):
+        return VariablePlaceholder(name)
+
+
+def bind_value(value, variable_values):
+    if isinstance(value, VariablePlaceholder):
+        return variable_values.get(value.name)
+    if isinstance(value, dict):
+        return {key: bind_value(item, variable_values) for key, item in value.items()}
+    if isinstance(value, list):
+        return [bind_value(item, variable_values) for item in value]
+    return value
 
 
 class Selection:
@@ -15,6 +42,22 @@ class Selection:
         self.filters = filters
         self.sub_selections = sub_selections
         self.alias = alias
+        self.template = None  # the Selection template this one was bound from
+        self.plans = {}  # {NodeType: SelectionPlan} of a template, see api.factories.get_plan
+
+    def bind(self, variable_values):
+        """Return a copy of a template with its variables replaced by `variable_values`, filters bound to None are dropped."""
+        filters = {key: bind_value(value, variable_values or {}) for key, value in self.filters.items()}
+        filters = {key: value for key, value in filters.items() if value is not None}
+        sub_selections = [sub_selection.bind(variable_values) for sub_selection in self.sub_selections]
+
+        selection = Selection(self.attribute, filters, sub_selections, alias=self.alias)
+        selection.template = self.get_template()
+        return selection
+
+    def get_template(self):
+        """Return the Selection template of a bound selection, selections parsed with their variables are their own."""
+        return self.template or self
 
     def _debug_print_body(self, depth=0):  # pragma: no cover
         t = ''.join(['  '] * depth)
@@ -35,9 +78,66 @@ class Selection:
 
 
 def selection_from_info(info, lookups=None):
+    """
+    Return the Selection of the root field being resolved, nested fields are prefetched by its resolver.
+
+    Operations compiled ahead of time (persisted queries) only bind the variables to their templates.
+    """
+    template = get_compiled_templates(info.operation).get(info.path[0])
+    if template:
+        return template.bind(info.variable_values)
     return get_selection(info.operation.selection_set, info.variable_values, info.fragments, lookups=lookups, operation_name=info.path[0])
 
 
+_compiled_operations = {}  # {operation id: (operation, {root response key: Selection template})}
+
+
+def compile_operation(operation, fragments=None):
+    """
+    Parse the Selection templates of all root fields of an operation (i.e. a persisted query) ahead of time.
+
+    Arguments given by variables are left as placeholders, `selection_from_info` only binds the variable values
+    of the request to the templates. The operation has to stay the same object, it's looked up by identity.
+    """
+    templates = {}
+    for field in expand_fragments(operation.selection_set.selections, fragments):
+        if field.selection_set:
+            response_key = rgetattr(field, 'alias.value', field.name.value)
+            templates[response_key] = get_selection(operation.selection_set, PlaceholderVariables(), fragments, operation_name=response_key)
+
+    _compiled_operations[id(operation)] = operation, templates
+    return templates
+
+
+def get_compiled_templates(operation):
+    """Return {root response key: Selection template} of a compiled operation, empty if it wasn't compiled."""
+    compiled_operation, templates = _compiled_operations.get(id(operation), (None, {}))
+    return templates if compiled_operation is operation else {}
+
+
+def forget_compiled_operations():
+    _compiled_operations.clear()
+
+
+def expand_fragments(selections, fragments=None, _spread=()):
+    """
+    Return the fields of `selections` with fragment spreads and inline fragments replaced by their fields.
+    Type conditions are ignored, unknown and cyclic fragment spreads are dropped (validation reports them).
+    """
+    out = []
+    for selection in selections:
+        if isinstance(selection, FragmentSpread):
+            name = selection.name.value
+            fragment = (fragments or {}).get(name)
+            if fragment is not None and name not in _spread:
+                out += expand_fragments(fragment.selection_set.selections, fragments, (*_spread, name))
+        elif isinstance(selection, InlineFragment):
+            out += expand_fragments(selection.selection_set.selections, fragments, _spread)
+        else:
+            out.append(selection)
+    return out
+
+
 def get_selection(selection_set, variable_values=None, fragments=None, lookups=None, operation_name=None):
 
     def _argument_to_key_value_pair(argument):
@@ -66,17 +166,6 @@ def get_selection(selection_set, variable_values=None, fragments=None, lookups=N
         filters = dict(key_value_pairs)
         return filters
 
-    def _fragment_spread_to_fields(fragment_spread):
-        """Fetch the fragment and return its field selection."""
-        name = fragment_spread.name.value
-        fragment = fragments.get(name)
-        return fragment.selection_set.selections
-
-    def _unpack_fragments(selections):
-        """Get Fragment from a FragmentSpread and unpack its selection set."""
-        selections = [[selection] if not isinstance(selection, FragmentSpread) else _fragment_spread_to_fields(selection) for selection in selections]
-        return [item for sublist in selections for item in sublist]  # flatten
-
     def _parse_selection(selection):
 
         attribute = selection.name.value
@@ -85,18 +174,17 @@ def get_selection(selection_set, variable_values=None, fragments=None, lookups=N
         sub_selections = []
 
         if selection.selection_set:
-            fields = selection.selection_set.selections
-            fields = _unpack_fragments(fields)
-            for field in fields:
+            for field in expand_fragments(selection.selection_set.selections, fragments):
                 sub_selections.append(_parse_selection(field))
 
         return Selection(attribute, filters, sub_selections, alias=alias)
 
-    for selection in selection_set.selections:
+    root_fields = expand_fragments(selection_set.selections, fragments)
+    for selection in root_fields:
         if rgetattr(selection, 'alias.value', rgetattr(selection, 'name.value')) == operation_name:
             break  # we keep the `selection` variable that the loop breaks at
     else:
-        selection = selection_set.selections[0]
+        selection = root_fields[0] if root_fields else None
 
     if type(selection) == Field and selection.selection_set:
         return _parse_selection(selection)
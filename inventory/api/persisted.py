@@ -0,0 +1,156 @@
+
+
+import json
+import time
+
+from threading import Lock
+
+from django.conf import settings
+from django.db import transaction
+from graphene_django.settings import graphene_settings
+from graphql.language.ast import FragmentDefinition, OperationDefinition
+from graphql.language.base import parse
+from graphql.validation import validate
+
+from utils.core import rget
+from utils.django import bump_cache_generation, get_cache_generation
+
+from .backend import document_backend, document_cache
+from .exceptions import PersistedQueryNotFound
+from .models import PersistedQuery
+from .parsing import compile_operation, forget_compiled_operations
+
+
+"""
+Persisted queries
+
+Clients register their GraphQL documents ahead of time (`manage.py persist_queries`, or the admin) and send
+the sha256 hash of the document instead of the query, either as the `id` parameter or the way Apollo does,
+`{"extensions": {"persistedQuery": {"sha256Hash": ...}}}`. Only the variables travel with the request.
+
+Every worker keeps a catalogue of the persisted queries, each one parsed and validated once and pinned in the
+document cache, its operations compiled to Selection templates (api.parsing.compile_operation). The query
+planner keeps the SelectionPlans of a template on it, so at request time only the variables get bound.
+A hash missing from the catalogue is looked up in the database before it's refused, so a query persisted through
+another worker is served right away. Deletions reach the catalogue with its generation (see
+`utils.django.get_cache_generation` for other workers), the catalogue is rebuilt every
+`GRAPHQL_PERSISTED_QUERIES_TTL` seconds anyway, so a revoked query is served that long at most.
+
+With `GRAPHQL_PERSISTED_QUERIES_STRICT` the view rejects everything that isn't persisted, the catalogue is then
+the complete list of queries the API serves.
+"""
+
+GENERATION_KEY = 'api:persisted_queries:generation'
+
+
+def get_schema():
+    return graphene_settings.SCHEMA  # the schema of the GraphQLView
+
+
+def validate_query(query):
+    """Return the names of the operations of `query`, raise the first GraphQLError if it isn't valid against the schema."""
+    document_ast = parse(query)
+    errors = validate(get_schema(), document_ast)
+    if errors:
+        raise errors[0]
+    return [definition.name.value for definition in document_ast.definitions if isinstance(definition, OperationDefinition) and definition.name]
+
+
+class PersistedPlan:
+    """A persisted query parsed, validated and compiled against the schema."""
+
+    def __init__(self, persisted_query, schema):
+        self.hash = persisted_query.hash
+        self.name = persisted_query.name
+        self.query = persisted_query.query
+
+        self.document = document_backend.document_from_string(schema, self.query)
+        document_cache.pin(document_cache.get_key(self.query), self.document)
+
+        definitions = self.document.document_ast.definitions
+        fragments = {definition.name.value: definition for definition in definitions if isinstance(definition, FragmentDefinition)}
+        for operation in definitions:
+            if isinstance(operation, OperationDefinition):
+                compile_operation(operation, fragments)
+
+    def __repr__(self):
+        return f"<PersistedPlan {self.name} ({self.hash[:12]})>"
+
+
+class Catalogue:
+    """{hash: PersistedPlan} of all persisted queries."""
+
+    def __init__(self):
+        document_cache.unpin_all()
+        forget_compiled_operations()
+
+        schema = get_schema()
+        self.plans = {persisted_query.hash: PersistedPlan(persisted_query, schema) for persisted_query in PersistedQuery.objects.all()}
+
+    def __repr__(self):
+        return f"<Catalogue {len(self.plans)} persisted queries>"
+
+    def get(self, query_hash):
+        """Return the PersistedPlan of `query_hash`, look it up in the database if it was persisted after the build."""
+        plan = self.plans.get(query_hash)
+        if plan is None:
+            persisted_query = PersistedQuery.objects.filter(hash=query_hash).first()
+            if persisted_query:
+                plan = self.plans[query_hash] = PersistedPlan(persisted_query, get_schema())
+        return plan
+
+
+_catalogue = None
+_catalogue_version = None
+_catalogue_expires = 0
+_catalogue_lock = Lock()
+
+
+def get_catalogue():
+    """Return the Catalogue of this worker, rebuild it if the persisted queries or the schema changed since it was built or it expired."""
+    global _catalogue, _catalogue_version, _catalogue_expires
+
+    version = get_cache_generation(GENERATION_KEY), document_cache.schema_version
+    with _catalogue_lock:
+        if _catalogue is None or _catalogue_version != version or time.monotonic() >= _catalogue_expires:
+            _catalogue, _catalogue_version = Catalogue(), version
+            _catalogue_expires = time.monotonic() + settings.GRAPHQL_PERSISTED_QUERIES_TTL
+        return _catalogue
+
+
+def invalidate_catalogue():
+    """Drop the Catalogue of all workers once the current transaction commits."""
+    transaction.on_commit(lambda: bump_cache_generation(GENERATION_KEY))
+
+
+def get_query_hash(request, data):
+    """Return the persisted query hash sent by an Apollo client, None if there's none."""
+    extensions = request.GET.get('extensions') or data.get('extensions')
+    if isinstance(extensions, str):
+        try:
+            extensions = json.loads(extensions)
+        except ValueError:
+            return None
+    return rget(extensions, 'persistedQuery.sha256Hash') if isinstance(extensions, dict) else None
+
+
+def resolve_persisted_query(query, query_hash=None):
+    """
+    Return the query string to execute.
+
+    A known `query_hash` gives its persisted query, an unknown one is only accepted along with the query itself,
+    except in strict mode, which also refuses queries sent as text unless they're persisted.
+    Raises PersistedQueryNotFound.
+    """
+    strict = settings.GRAPHQL_PERSISTED_QUERIES_STRICT
+
+    if not query_hash and not (strict and query):
+        return query
+
+    query_hash = query_hash or PersistedQuery.get_hash(query)
+    plan = get_catalogue().get(query_hash)
+    if plan:
+        return plan.query
+    if query and not strict:
+        return query
+    raise PersistedQueryNotFound(query_hash)
@@ -1,14 +1,17 @@
 import graphene
 import inspect
+import time
 
 from functools import reduce
 from pydoc import locate
+from threading import RLock
 
+from .backend import document_cache
 from .exceptions import NodeNotFound
-from .factories import qs_resolver_factory, getattr_resolver_factory
+from .factories import aggregate_resolver_factory, qs_resolver_factory, getattr_resolver_factory
 from .fields import NestedField
 from .meta import popmeta
-from .types import BaseType  # QueryMeta as QueryMetaInput
+from .types import BaseType, ModelObjectType  # QueryMeta as QueryMetaInput
 from .utils import lockable
 from .validators import validate_type_meta
 
@@ -17,7 +20,6 @@ from utils.string import camel_to_snake
 
 from django.db.models import Model
 from graphene_django.registry import reset_global_registry
-from graphene_django.types import DjangoObjectType
 
 
 def register_type(typename=None):
@@ -132,24 +134,68 @@ class RegisteredNode:
 
 
 class NodeSet(set):
-    """A set of nodes addressable by Type."""
+    """
+    A set of nodes addressable by Type.
+
+    Nodes are indexed by every key `Registry.get_type` looks them up by, {key: [nodes]} by their Type and GrapheneType,
+    model, typename and class name. A node keyed by something that changes after it's added (its Type, GrapheneType
+    or the class name) has to be reindexed.
+    """
+
+    def __init__(self, *args):
+        super().__init__(*args)
+        self.by_type = {}
+        self.by_model = {}
+        self.by_typename = {}
+        self.by_class_name = {}
+        self._node_keys = {}  # {id(node): [(index, key)]} to unindex a node
 
     def __getitem__(self, Type):
-        for node in self:
+        for node in self.by_type.get(Type, []):
             if node.Type == Type:
                 return node
         raise KeyError(f"Type {Type} not found in the NodeSet.")
 
+    def _index(self, node):
+        keys = (
+            (self.by_type, node.Type),
+            (self.by_type, node.GrapheneType),
+            (self.by_model, node.model),
+            (self.by_typename, node.typename),
+            (self.by_class_name, getattr(node.Type, '__name__', None)),
+        )
+        for index, key in keys:
+            if key is not None and not any(item is node for item in index.get(key, [])):
+                index.setdefault(key, []).append(node)
+                self._node_keys.setdefault(id(node), []).append((index, key))
+
+    def _unindex(self, node):
+        for index, key in self._node_keys.pop(id(node), []):
+            index[key] = [item for item in index[key] if item is not node]
+            if not index[key]:
+                del index[key]
+
+    def reindex(self, node):
+        self._unindex(node)
+        self._index(node)
+
     def update_type(self, Type):
-        self[Type].Type = Type
+        node = self[Type]
+        node.Type = Type
+        self.reindex(node)
 
     def add(self, item):
         assert type(item) == RegisteredNode, "You can only add type RegisteredNode into Registry NodeSet."
-        return super().add(item)
+        if item in self:
+            return  # a node of the same Type, typename or model is registered already
+        super().add(item)
+        self._index(item)
 
     def add_graphene_type(self, Type, GrapheneType):
-        self[Type].GrapheneType = GrapheneType
+        node = self[Type]
+        node.GrapheneType = GrapheneType
         self.GrapheneType = GrapheneType
+        self._index(node)
 
     def __setitem__(self, key, item):
         if key not in self:
@@ -181,6 +227,14 @@ class Registry(metaclass=Singleton):
             setattr(cls, node_name, node_list)
             setattr(cls, resolver_name, resolver)
 
+            setattr(cls, f'{node_name}_aggregate', NodeType.as_graphene_aggregate())
+            setattr(cls, f'resolve_{node_name}_aggregate', aggregate_resolver_factory(NodeType))
+
+            # a `<name>_page` field for types paginated by cursor
+            if NodeType.get_cursor_filter():
+                setattr(cls, f'{node_name}_page', NodeType.as_graphene_page())
+                setattr(cls, f'resolve_{node_name}_page', qs_resolver_factory(NodeType, page=True))
+
         @classmethod
         def _reset_attributes(cls):
             to_delete = []
@@ -199,6 +253,8 @@ class Registry(metaclass=Singleton):
         self.mutations = []
         self.nodes = NodeSet()
         self.schema = None
+        self.timings = {}  # {schema construction step: ms}, see the profile_startup command
+        self._schema_lock = RLock()  # the first requests of threaded workers build the schema concurrently
 
     def _lock(self):
         """Lock to not allow adding nodes."""
@@ -220,7 +276,6 @@ class Registry(metaclass=Singleton):
 
     def get_type(self, model=None, Type=None, typename=None, include_custom=True):
         """Universal type get based on - Schema name, Type or Django model (also accepts strings)."""
-        nodes = (self.get_model_nodes(), self.get_custom_nodes())[include_custom]
 
         if Type:
             assert isinstance(Type, type), f"Schema Type type must be type. Found {Type} of type {type(Type)}"
@@ -229,18 +284,19 @@ class Registry(metaclass=Singleton):
         if model:
             assert Model in model.mro(), f"Schema model must be Django model. Found {model} of type {type(model)}"
 
-        for node in nodes:
-            if any((
-                model and node.model == model,
-                typename and node.typename == typename,
-                typename and node.Type.__name__ == typename,
-                Type and node.typename == Type,
-                Type and node.Type == Type,
-                Type and node.model == rgetattr(Type, 'Meta.model', ''),
-                Type and node.Type.__name__ == Type,
-                Type and node.Type.__name__ == getattr(Type, '__name__', ''),
-                Type and node.GrapheneType == Type
-            )):
+        # candidates from the indexes, model nodes or custom nodes only like get_model_nodes and get_custom_nodes
+        candidates = []
+        if model:
+            candidates += self.nodes.by_model.get(model, [])
+        if typename:
+            candidates += self.nodes.by_typename.get(typename, []) + self.nodes.by_class_name.get(typename, [])
+        if Type:
+            candidates += self.nodes.by_type.get(Type, [])
+            candidates += self.nodes.by_model.get(rgetattr(Type, 'Meta.model', None), [])
+            candidates += self.nodes.by_class_name.get(getattr(Type, '__name__', None), [])
+
+        for node in candidates:
+            if node.is_model_node != include_custom:
                 return node.Type
 
         msg = f'egistry.get_type(model={repr(model)}, Type={repr(Type)}, typename={repr(typename)}, include_custom={repr(include_custom)})'
@@ -263,15 +319,19 @@ class Registry(metaclass=Singleton):
     def get_schema(self):
         """Construct schema if it doesn't exist and return existing/created one."""
         if not self.schema:
-            self._construct_schema()
+            with self._schema_lock:
+                if not self.schema:
+                    self._construct_schema()
         return self.schema
 
     def reset(self):
-        """Remove all nodes, mutation and the existing schema."""
+        """Remove all nodes, mutation and the existing schema, cached documents were validated against it."""
         self.mutations = []
         self.nodes = NodeSet()
         self.schema = None
+        self.timings = {}
         self.Query._reset_attributes()
+        document_cache.invalidate()
 
     def register_mutation(self, TargetMutation):
         """Add a Mutation to attach it to the Root Mutation."""
@@ -284,11 +344,17 @@ class Registry(metaclass=Singleton):
         TargetType = self._register_django_type(TargetType, typename) if is_django_schema else self._register_custom_type(TargetType, typename)
         return TargetType
 
+    def _timed(self, step, function, *args, **kwargs):
+        start = time.perf_counter()
+        out = function(*args, **kwargs)
+        self.timings[step] = (time.perf_counter() - start) * 1000
+        return out
+
     def _construct_schema(self):
         """Force all registered schemas and mutations to inherit from graphene object types and return graphene.Schema."""
         Query = self._construct_root_query()
-        Mutation = self._construct_root_mutation() if self.mutations else None
-        self.schema = graphene.Schema(query=Query, mutation=Mutation)
+        Mutation = self._timed('construct root mutation', self._construct_root_mutation) if self.mutations else None
+        self.schema = self._timed('build graphene schema', graphene.Schema, query=Query, mutation=Mutation)
 
     def _construct_root_mutation(self):
         """Return a graphene.Mutation class with all the registered mutations attached as attributes."""
@@ -302,11 +368,11 @@ class Registry(metaclass=Singleton):
         if not self.get_model_nodes():
             raise Exception('No registered types found during schema creation.')
 
-        self._tranform_reverse_to_nested_fields()  # Make reverse fields into nested fields on the referenced Nodes
-        self._register_nested_types()
+        self._timed('transform reverse fields', self._tranform_reverse_to_nested_fields)  # Make reverse fields into nested fields on the referenced Nodes
+        self._timed('register nested types', self._register_nested_types)
         self._lock()  # prevent the nodes to be changed from now
-        self._attach_nodes()  # Construct nested fields into Node attributes and attach them to Query
-        Query = inherit_from(self.Query, graphene.ObjectType)  # Initialize as a Graphene object, can't change attributes after this
+        self._timed('attach nodes', self._attach_nodes)  # Construct nested fields into Node attributes and attach them to Query
+        Query = self._timed('construct root query', inherit_from, self.Query, graphene.ObjectType)  # Initialize as a Graphene object, can't change attributes after this
 
         return Query
 
@@ -349,7 +415,8 @@ class Registry(metaclass=Singleton):
 
             node.Type.__name__ = node.typename  # setup for graphene
             node.Type.Meta.name = node.typename  # setup for graphene
-            GrapheneType = inherit_from(node.Type, DjangoObjectType, persist_meta=True)
+            self.nodes.reindex(node)
+            GrapheneType = inherit_from(node.Type, ModelObjectType, persist_meta=True)
 
             assert hasattr(GrapheneType, '_meta')
 
@@ -0,0 +1,462 @@
+import base64
+import json
+
+from tempfile import TemporaryDirectory
+from unittest.mock import patch
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.exceptions import ImproperlyConfigured
+from django.test import Client, TestCase, override_settings
+from graphql.language.base import parse
+from graphql_jwt.settings import jwt_settings
+from graphql_jwt.shortcuts import get_token
+
+from orders.models import Order, OrderPart
+from parts.models import Part
+from parts.schema import PartType
+
+from . import persisted
+from .aggregates import aggregate_qs
+from .cache import LocalResponseCache, ResponseCache, get_response_cache
+from .cost import analyze_query
+from .events import EventHandler
+from .exceptions import NodeNotFound, PersistedQueryNotFound
+from .filters import CursorPaginationFilter, decode_cursor, encode_cursor
+from .models import PersistedQuery
+from .persisted import get_catalogue, get_schema, resolve_persisted_query
+from .registry import Registry, get_global_registry
+
+
+QUERY = 'query Typename { __typename }'
+
+
+class PersistedQueryTest(TestCase):
+
+    def setUp(self):
+        persisted._catalogue = None
+        get_catalogue()  # built before the query is persisted, its generation bump is left to on_commit
+
+    def test_query_persisted_after_the_build(self):
+        persisted_query = PersistedQuery.persist(QUERY)
+        self.assertEqual(resolve_persisted_query(None, persisted_query.hash), QUERY)
+        self.assertIn(persisted_query.hash, get_catalogue().plans)
+
+    @override_settings(GRAPHQL_PERSISTED_QUERIES_STRICT=True)
+    def test_query_persisted_after_the_build_strict(self):
+        PersistedQuery.persist(QUERY)
+        self.assertEqual(resolve_persisted_query(QUERY), QUERY)
+        with self.assertRaises(PersistedQueryNotFound):
+            resolve_persisted_query('{ __typename }')
+
+    def test_unknown_hash(self):
+        with self.assertRaises(PersistedQueryNotFound):
+            resolve_persisted_query(None, PersistedQuery.get_hash(QUERY))
+        self.assertEqual(resolve_persisted_query(QUERY, PersistedQuery.get_hash(QUERY)), QUERY)
+
+    def test_deleted_query(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            persisted_query = PersistedQuery.persist(QUERY)
+        self.assertEqual(resolve_persisted_query(None, persisted_query.hash), QUERY)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            persisted_query.delete()
+        with self.assertRaises(PersistedQueryNotFound):
+            resolve_persisted_query(None, persisted_query.hash)
+
+
+    @override_settings(GRAPHQL_PERSISTED_QUERIES_TTL=3600)
+    def test_deleted_query_is_kept_until_a_bump(self):
+        persisted._catalogue = None  # built by setUp with the default TTL
+        persisted_query = PersistedQuery.persist(QUERY)
+        resolve_persisted_query(None, persisted_query.hash)
+        persisted_query.delete()  # its bump is left to on_commit, as another worker's would be
+        self.assertEqual(resolve_persisted_query(None, persisted_query.hash), QUERY)
+
+    @override_settings(GRAPHQL_PERSISTED_QUERIES_TTL=0, GRAPHQL_PERSISTED_QUERIES_STRICT=True)
+    def test_deleted_query_expires_without_a_bump(self):
+        persisted._catalogue = None  # built by setUp with the default TTL
+        persisted_query = PersistedQuery.persist(QUERY)
+        resolve_persisted_query(None, persisted_query.hash)
+        persisted_query.delete()
+        with self.assertRaises(PersistedQueryNotFound):
+            resolve_persisted_query(QUERY)
+
+
+class ResponseCacheTest(TestCase):
+
+    def setUp(self):
+        self.part = Part.objects.create(uuid=1, name='10k / 0603', category='resistors')
+        self.order = Order.objects.create(name='order')
+        self.cache = ResponseCache(LocalResponseCache())
+
+    def store(self, *models):
+        self.cache.set('key', {'data': {}}, self.cache.get_versions(models))
+        self.assertIsNotNone(self.cache.get('key'))
+
+    def test_save(self):
+        self.store(Part)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.part.save()
+        self.assertIsNone(self.cache.get('key'))
+
+    def test_delete(self):
+        self.store(Part)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.part.delete()
+        self.assertIsNone(self.cache.get('key'))
+
+    def test_update(self):
+        self.store(Part)
+        with self.captureOnCommitCallbacks(execute=True):
+            Part.objects.filter(id=self.part.id).update(name='4k7 / 0603')
+        self.assertIsNone(self.cache.get('key'))
+
+    def test_bulk_create_of_children(self):
+        self.store(Order)
+        with self.captureOnCommitCallbacks(execute=True):
+            OrderPart.objects.bulk_create([OrderPart(order=self.order, part=self.part, count=1)])
+        self.assertIsNone(self.cache.get('key'))
+
+    def test_other_models(self):
+        self.store(Order)
+        with self.captureOnCommitCallbacks(execute=True):
+            Part.objects.update(name='4k7 / 0603')
+        self.assertIsNotNone(self.cache.get('key'))
+
+    def test_not_before_the_commit(self):
+        self.store(Part)
+        with self.captureOnCommitCallbacks(execute=False):
+            Part.objects.update(name='4k7 / 0603')
+        self.assertIsNotNone(self.cache.get('key'))
+
+
+class GetResponseCacheTest(TestCase):
+    config = {'BACKEND': 'api.cache.SharedResponseCache', 'OPTIONS': {'alias': 'responses'}}
+
+    def test_off(self):
+        with override_settings(GRAPHQL_RESPONSE_CACHE=None):
+            self.assertIsNone(get_response_cache())
+
+    def test_per_process_default_cache(self):
+        with override_settings(GRAPHQL_RESPONSE_CACHE=self.config, CACHES={
+            'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'},
+            'responses': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'},
+        }):
+            with self.assertRaises(ImproperlyConfigured):
+                get_response_cache()
+
+    def test_shared_caches(self):
+        with TemporaryDirectory() as directory:
+            shared = {'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache', 'LOCATION': directory}
+            with override_settings(GRAPHQL_RESPONSE_CACHE=self.config, CACHES={'default': shared, 'responses': shared}):
+                self.assertIsInstance(get_response_cache(), ResponseCache)
+            with override_settings(GRAPHQL_RESPONSE_CACHE=self.config, CACHES={
+                'default': shared,
+                'responses': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'},
+            }):
+                with self.assertRaises(ImproperlyConfigured):
+                    get_response_cache()
+
+
+class CostAnalysisTest(TestCase):
+
+    def setUp(self):
+        self.client = Client()
+        self.client.force_login(get_user_model().objects.create_user('user', password='password'))
+        Part.objects.create(uuid=1, name='10k / 0603', category='resistors')
+
+    def post(self, query):
+        return self.client.post('/graphql/', json.dumps({'query': query}), content_type='application/json')
+
+    def cost(self, query):
+        return analyze_query(get_schema(), parse(query))
+
+    def test_root_fragments(self):
+        cost = self.cost('{ parts { name } }')
+        self.assertGreater(cost.cost, 0)
+        for query in (
+            '{ ... on Query { parts { name } } }',
+            '{ ...Parts } fragment Parts on Query { parts { name } }',
+            '{ ...Parts } fragment Parts on Query { ... on Query { parts { name } } }',
+        ):
+            self.assertEqual(self.cost(query).fields, cost.fields, query)
+            self.assertEqual(self.post(query).json()['data'], {'parts': [{'name': '10k / 0603'}]}, query)
+
+    def test_unknown_and_cyclic_fragments(self):
+        self.assertEqual(self.cost('{ ...Parts }').fields, {})
+        self.assertEqual(self.post('{ ...Parts }').status_code, 400)
+
+        query = '{ ...Parts } fragment Parts on Query { ...Parts parts { name } }'
+        self.assertEqual(self.cost(query).fields, self.cost('{ parts { name } }').fields)
+        self.assertEqual(self.post(query).status_code, 400)
+
+    def test_syntax_error(self):
+        response = self.post('{ parts { edges')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('Syntax Error', response.json()['errors'][0]['message'])
+
+    def test_invalid_document(self):
+        response = self.post('{ parts(bogus: 1) { edges { node { nope } } } }')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('errors', response.json())
+
+    @patch('api.views.analyze_query', side_effect=KeyError('cost'))
+    def test_analysis_errors_surface(self, analyze_query):
+        with self.assertRaises(KeyError):
+            self.post('{ __typename }')
+
+
+class CursorPaginationTest(TestCase):
+
+    CLASSES = 'b', None, 'a', 'b', None, 'a', 'b'  # ties and NULLs
+
+    def setUp(self):
+        for uuid, comp_class in enumerate(self.CLASSES, 1):
+            Part.objects.create(uuid=uuid, name=f'part {uuid}', category='resistors', comp_class=comp_class)
+
+    def paginate(self, qs, first=2):
+        """Return the rows of every page of `qs` after each other."""
+        rows, after = [], None
+        while True:
+            page = list(CursorPaginationFilter().apply(qs, {'first': first, 'after': after}))
+            rows += page
+            if len(page) < first:
+                return rows
+            after = CursorPaginationFilter.get_cursor(CursorPaginationFilter().apply(qs, {}), page[-1])
+
+    def expected(self, descending):
+        parts = Part.objects.order_by('id')
+        if descending:  # NULLs first, ties by id
+            parts = sorted(parts, key=lambda part: part.comp_class or '', reverse=True)
+            return sorted(parts, key=lambda part: part.comp_class is not None)
+        return sorted(parts, key=lambda part: (part.comp_class is None, part.comp_class or ''))
+
+    def test_ascending(self):
+        rows = self.paginate(Part.objects.order_by('comp_class'))
+        self.assertEqual([part.id for part in rows], [part.id for part in self.expected(descending=False)])
+
+    def test_descending(self):
+        rows = self.paginate(Part.objects.order_by('-comp_class'))
+        self.assertEqual([part.id for part in rows], [part.id for part in self.expected(descending=True)])
+
+    def test_dict_rows(self):
+        for ordering, descending in (('comp_class', False), ('-comp_class', True)):
+            rows = self.paginate(Part.objects.order_by(ordering).values('id', 'comp_class'), first=3)
+            self.assertEqual([row['id'] for row in rows], [part.id for part in self.expected(descending)], ordering)
+
+    def test_invalid_cursor(self):
+        for cursor in ('MQ==', encode_cursor({'id': 1}), 'not base64!', 'ž'):
+            with self.assertRaisesMessage(ValueError, 'Invalid cursor'):
+                decode_cursor(cursor)
+        self.assertEqual(decode_cursor(encode_cursor([None, 1])), [None, 1])
+
+    def test_page_info(self):
+        client = Client()
+        client.force_login(get_user_model().objects.create_user('user', password='password'))
+        query = 'query ($after: String) { partsPage(cursor: {first: 3, after: $after}) { items { uuid } pageInfo { endCursor hasNextPage } } }'
+
+        def page(after=None):
+            response = client.post('/graphql/', json.dumps({'query': query, 'variables': {'after': after}}), content_type='application/json')
+            return response.json()
+
+        pages = []
+        after = None
+        while True:
+            result = page(after)['data']['partsPage']
+            pages.append(([item['uuid'] for item in result['items']], result['pageInfo']['hasNextPage']))
+            after = result['pageInfo']['endCursor']
+            if not result['pageInfo']['hasNextPage']:
+                break
+        self.assertEqual(pages, [([1, 2, 3], True), ([4, 5, 6], True), ([7], False)])
+        self.assertEqual(page(after)['data']['partsPage'], {'items': [], 'pageInfo': {'endCursor': after, 'hasNextPage': False}})
+
+        response = page('MQ==')
+        self.assertIn('Invalid cursor', response['errors'][0]['message'])
+
+
+class AggregateTest(TestCase):
+
+    def setUp(self):
+        Part.objects.create(uuid=1, name='1N4148', category='diodes', stock=10, current_price=0.5)
+        Part.objects.create(uuid=2, name='1N4007', category='diodes', stock=20, current_price=0.25)
+        Part.objects.create(uuid=3, name='10k / 0603', category='resistors', stock=100, current_price=0.01)
+
+    def aggregate(self, group_by, aggregates):
+        return aggregate_qs(PartType, Part.objects.all(), group_by, aggregates)
+
+    def test_group(self):
+        rows = self.aggregate(['category'], [{'function': 'sum', 'field': 'stock'}, {'function': 'sum', 'field': 'stockValue'}])
+        self.assertEqual(rows, [
+            {'group': {'category': 'DIODES'}, 'values': {'sumStock': 30, 'sumStockValue': 10.0}},
+            {'group': {'category': 'RESISTORS'}, 'values': {'sumStock': 100, 'sumStockValue': 1.0}},
+        ])
+
+    def test_no_group(self):
+        rows = self.aggregate([], [{'function': 'max', 'field': 'currentPrice', 'alias': 'top'}, {'function': 'count'}])
+        self.assertEqual(rows, [{'group': {}, 'values': {'top': 0.5, 'count': 3}}])
+
+    def test_count_without_a_field(self):
+        rows = self.aggregate(['category'], [{'function': 'count'}])
+        self.assertEqual([row['values'] for row in rows], [{'count': 2}, {'count': 1}])
+        with self.assertRaisesMessage(ValueError, 'Aggregate sum needs a field.'):
+            self.aggregate([], [{'function': 'sum'}])
+
+    def test_whitelists(self):
+        with self.assertRaisesMessage(ValueError, "can't be grouped by name"):
+            self.aggregate(['name'], [{'function': 'count'}])
+        with self.assertRaisesMessage(ValueError, "can't aggregate uuid"):
+            self.aggregate([], [{'function': 'sum', 'field': 'uuid'}])
+
+    def test_aliases(self):
+        for aggregates in (
+            [{'function': 'count', 'alias': 'not valid'}],
+            [{'function': 'count', 'alias': '1count'}],
+            [{'function': 'count'}, {'function': 'sum', 'field': 'stock', 'alias': 'count'}],
+        ):
+            with self.assertRaisesMessage(ValueError, 'Invalid or duplicate aggregate alias'):
+                self.aggregate([], aggregates)
+
+    def test_group_matches_the_list(self):
+        client = Client()
+        client.force_login(get_user_model().objects.create_user('user', password='password'))
+        query = '{ parts(uuid: 1) { category } partsAggregate(groupBy: ["category"], aggregates: [{function: COUNT}]) { group } }'
+        data = client.post('/graphql/', json.dumps({'query': query}), content_type='application/json').json()['data']
+        self.assertEqual(data['parts'][0]['category'], data['partsAggregate'][0]['group']['category'])
+
+
+def linear_get_type(registry, model=None, Type=None, typename=None, include_custom=True):
+    """The Types Registry.get_type matched before its indexes, a scan of every node."""
+    nodes = (registry.get_model_nodes(), registry.get_custom_nodes())[include_custom]
+    return {node.Type for node in nodes if any((
+        model and node.model == model,
+        typename and node.typename == typename,
+        typename and node.Type.__name__ == typename,
+        Type and node.typename == Type,
+        Type and node.Type == Type,
+        Type and node.model == getattr(getattr(Type, 'Meta', None), 'model', ''),
+        Type and node.Type.__name__ == Type,
+        Type and node.Type.__name__ == getattr(Type, '__name__', ''),
+        Type and node.GrapheneType == Type
+    ))}
+
+
+class RegistryIndexTest(TestCase):
+
+    def assertLookupsAgree(self, registry, **lookup):
+        for include_custom in (True, False):
+            expected = linear_get_type(registry, include_custom=include_custom, **lookup)
+            if expected:
+                self.assertIn(registry.get_type(include_custom=include_custom, **lookup), expected, lookup)
+            else:
+                with self.assertRaises(NodeNotFound, msg=lookup):
+                    registry.get_type(include_custom=include_custom, **lookup)
+
+    def assertRegistryAgrees(self, registry, names=()):
+        for node in registry.nodes:
+            if node.model:
+                self.assertLookupsAgree(registry, model=node.model)
+            for Type in (node.Type, node.GrapheneType):
+                if Type is not None:
+                    self.assertLookupsAgree(registry, Type=Type)
+            self.assertIs(registry.nodes[node.Type], next(item for item in registry.nodes if item.Type == node.Type))
+            for name in (node.typename, node.Type.__name__, *names):
+                self.assertLookupsAgree(registry, typename=name)
+
+    def test_schema(self):
+        """The types renamed and inherited from graphene while attaching the nodes."""
+        get_schema()
+        registry = get_global_registry()
+        self.assertTrue(registry.schema)
+        self.assertRegistryAgrees(registry, names=['PartType', 'OrderPartType', 'Unknown'])
+
+    def test_add_update_and_reset(self):
+        registry = object.__new__(Registry)  # not the global singleton
+        registry.__init__()
+
+        PartNode = type('PartNode', (), {'Meta': type('Meta', (), {'model': Part})})
+        OtherPartNode = type('OtherPartNode', (), {'Meta': type('Meta', (), {'model': Part})})
+        OrderNode = type('OrderNode', (), {'Meta': type('Meta', (), {'model': Order})})
+        Custom = type('Custom', (), {})
+
+        registry.add_node(PartNode)
+        registry.add_node(OtherPartNode)  # a duplicate of the Part model, ignored
+        registry.add_node(OrderNode, typename='Order')
+        registry.add_node(Custom)
+        self.assertEqual(len(registry.nodes), 3)
+        self.assertRegistryAgrees(registry, names=['OtherPartNode', 'Order', 'OrderNode'])
+        self.assertLookupsAgree(registry, Type=OtherPartNode)
+
+        GraphenePart = type('GraphenePart', (), {})
+        registry.nodes.add_graphene_type(PartNode, GraphenePart)
+        self.assertRegistryAgrees(registry)
+        self.assertIs(registry.get_type(Type=GraphenePart, include_custom=False), PartNode)
+
+        node = registry.nodes[OrderNode]  # renamed like in Registry._attach_nodes
+        OrderNode.__name__ = node.typename
+        registry.nodes.reindex(node)
+        self.assertRegistryAgrees(registry, names=['OrderNode'])
+
+        with patch.object(Registry.Query, '_reset_attributes'):  # the root Query attributes are shared with the schema
+            registry.reset()
+        for Type in (PartNode, GraphenePart, OrderNode, Custom):
+            self.assertLookupsAgree(registry, Type=Type)
+        self.assertEqual(registry.nodes.by_type, {})
+
+        registry.add_node(OtherPartNode)
+        self.assertRegistryAgrees(registry, names=['PartNode'])
+        self.assertIs(registry.get_type_for_model(Part), OtherPartNode)
+
+
+class EventHandlerTest(TestCase):
+
+    def setUp(self):
+        self.handler = EventHandler()
+        self.token = get_token(get_user_model().objects.create_user('user', password='password'))
+        Part.objects.create(uuid=1, name='10k / 0603', category='resistors', stock=5)
+
+    def event(self, name, **changes):
+        with open(settings.BASE_DIR / 'events' / name, 'r') as file:
+            return {**json.load(file), **changes}
+
+    def call(self, event):
+        response = self.handler(event)
+        return response['statusCode'], json.loads(response['body'])
+
+    def authorized(self, event, token=None):
+        return {**event, 'headers': {**event['headers'], 'authorization': f'JWT {token or self.token}'}}
+
+    def test_anonymous(self):
+        for name in ('parts_post.json', 'suppliers_get.json'):
+            status, body = self.call(self.event(name))
+            self.assertEqual(status, 200, name)
+            self.assertIn('permission', body['errors'][0]['message'], name)
+
+    def test_jwt(self):
+        status, body = self.call(self.authorized(self.event('parts_post.json')))
+        self.assertEqual(status, 200)
+        self.assertEqual(body['data']['parts'], [{'id': str(Part.objects.get().id), 'name': '10k / 0603', 'stock': 5}])
+
+        status, body = self.call(self.authorized(self.event('suppliers_get.json')))
+        self.assertEqual((status, body['data']), (200, {'suppliers': []}))
+
+    def test_invalid_jwt(self):
+        status, body = self.call(self.authorized(self.event('parts_post.json'), token='not.a.token'))
+        self.assertEqual(status, 401)
+        self.assertIn('message', body['errors'][0])
+
+    def test_base64_body(self):
+        event = self.event('parts_post.json')
+        event = self.authorized({**event, 'body': base64.b64encode(event['body'].encode('utf-8')).decode('ascii'), 'isBase64Encoded': True})
+        status, body = self.call(event)
+        self.assertEqual(status, 200)
+        self.assertEqual(body['data']['parts'][0]['name'], '10k / 0603')
+
+    def test_cookies(self):
+        event = self.event('parts_post.json', cookies=['theme=dark', f'{jwt_settings.JWT_COOKIE_NAME}={self.token}'])
+        status, body = self.call(event)
+        self.assertEqual(status, 200)
+        self.assertEqual(body['data']['parts'][0]['name'], '10k / 0603')
+
+        status, body = self.call(self.event('parts_post.json', cookies=[f'{jwt_settings.JWT_COOKIE_NAME}=not.a.token']))
+        self.assertEqual(status, 401)
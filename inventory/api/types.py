@@ -8,12 +8,15 @@ from django.db.models.fields.related_descriptors import (
 )
 
 import graphene
+from graphene_django.types import DjangoObjectType
 
 from api.exceptions import NodeNotFound
 from utils.string import camel_to_snake
 
-from .factories import getattr_resolver_factory, qs_resolver_factory
+from .aggregates import AggregateInput, get_aggregate_type
+from .factories import fk_loader_resolver_factory, getattr_resolver_factory, qs_resolver_factory
 from .fields import NestedField, ReverseField
+from .filters import CursorPaginationFilter, PAGINATION_FILTERS
 
 
 class ListActionEnum(graphene.Enum):
@@ -29,6 +32,22 @@ class IDListInput(graphene.InputObjectType):
     ids = graphene.List(graphene.ID)
 
 
+class PageInfo(graphene.ObjectType):
+    end_cursor = graphene.String(description="Cursor of the last item, pass it as `after` to get the next page.")
+    has_next_page = graphene.Boolean()
+
+
+class ModelObjectType(DjangoObjectType):
+    """DjangoObjectType also accepting `values()` rows, qs_resolver returns those for selections of plain columns."""
+
+    class Meta:
+        abstract = True
+
+    @classmethod
+    def is_type_of(cls, root, info):
+        return isinstance(root, dict) or super().is_type_of(root, info)
+
+
 class BaseType:
 
     class Meta:
@@ -65,6 +84,36 @@ class BaseType:
         lookups = {**dict(getattr(cls.Meta, 'lookups', set())), **custom_filters}  # dictionary merge
         return graphene.List(cls, **lookups, description=getattr(cls.Meta, 'description', None))
 
+    @classmethod
+    def get_cursor_filter(cls):
+        """Return the name of the CursorPaginationFilter in Meta.filters, None if the type has none."""
+        return next((key for key, Filter in getattr(cls.Meta, 'filters', {}).items() if Filter == CursorPaginationFilter), None)
+
+    @classmethod
+    def as_graphene_page(cls):
+        """Return a `<Type>Page` field, the items of a cursor page with their `pageInfo`, taking the same arguments as the list."""
+        assert hasattr(cls, '_meta')
+        custom_filters = cls._get_filter_definitions()
+
+        lookups = {**dict(getattr(cls.Meta, 'lookups', set())), **custom_filters}
+        Page = type(f'{cls.__name__}Page', (graphene.ObjectType,), {'page_of': cls, 'items': graphene.List(cls), 'page_info': graphene.Field(PageInfo)})
+        return graphene.Field(Page, **lookups, description=getattr(cls.Meta, 'description', None))
+
+    @classmethod
+    def as_graphene_aggregate(cls):
+        """Return a `<Type>Aggregate` list field, taking the list lookups and filters except pagination, see api.aggregates."""
+        assert hasattr(cls, '_meta')
+        custom_filters = {key: Filter.input for key, Filter in getattr(cls.Meta, 'filters', {}).items() if Filter not in PAGINATION_FILTERS}
+
+        lookups = {**dict(getattr(cls.Meta, 'lookups', set())), **custom_filters}
+        return graphene.List(
+            get_aggregate_type(cls),
+            group_by=graphene.List(graphene.String),
+            aggregates=graphene.List(AggregateInput, required=True),
+            **lookups,
+            description=f"{cls.__name__} rows grouped by `groupBy`, aggregated in the database.",
+        )
+
     @classmethod
     def get_name(cls):
         name = getattr(cls.Meta, 'verbose', camel_to_snake(cls.__name__).replace('_type', ''))
@@ -148,9 +197,12 @@ class BaseType:
         name = nested_field.get_schema_name()
 
         if not resolver:
-            is_m2m = type(getattr(cls.Meta.model, nested_field.name)) in (ManyToManyDescriptor, ReverseManyToOneDescriptor)
+            descriptor = getattr(cls.Meta.model, nested_field.name)
+            is_m2m = type(descriptor) in (ManyToManyDescriptor, ReverseManyToOneDescriptor)
             if is_m2m:
                 resolver = qs_resolver_factory(NestedType, source_fieldname=name)
+            elif isinstance(descriptor, ForwardManyToOneDescriptor):  # batched over sibling rows, OneToOneField included
+                resolver = fk_loader_resolver_factory(descriptor.field)
             else:
                 resolver = getattr_resolver_factory(nested_field.name)
 
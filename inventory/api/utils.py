@@ -1,12 +1,7 @@
-import hashlib
-
 from django.conf import settings
 
-from .meta import MetaBase
 from utils.core import rgetattr
 
-from cachalot.utils import get_query_cache_key
-
 
 def is_root_info(info):
     root_path = info.path[0]
@@ -54,32 +49,6 @@ class LockableDict(dict):
         return (self.__default_setitem, self.__locked_setitem)[self._locked](key, value)
 
 
-def query_cache_key(*args, **kwargs):
-    """
-    Prepend default cachalot key with a prefix hash.
-
-    The prefix hash is made from the tenant id and roles.
-    It is saved on MetaBase to be quickly available during the whole request.
-    """
-
-    hash_string = get_query_cache_key(*args, **kwargs)
-
-    user, tenant, roles, as_superuser = context.get_context()
-
-    if not tenant or as_superuser:
-        return hash_string
-
-    if not MetaBase().cache_key_prefix:
-        # Should only run a single time
-        prefix = f'{tenant.pk}_{str(",".join(roles))}'
-        MetaBase().cache_key_prefix = prefix
-
-    hash_string = MetaBase().cache_key_prefix + hash_string
-    hash_string = hashlib.sha256(bytes(hash_string, encoding='utf-8')).hexdigest()
-
-    return hash_string
-
-
 def get_registered_node_type(name):
     for NodeType in settings.GRAPHENE_NODES:
         if NodeType.__name__ == name:
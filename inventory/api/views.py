@@ -3,11 +3,18 @@ import json
 # import sentry_sdk
 
 from django.conf import settings
-from django.http import HttpResponse
+from django.http import HttpResponse, HttpResponseBadRequest
 
+from .backend import document_backend
+from .cache import get_document_models, response_cache
+from .cost import analyze_query
+from .exceptions import PersistedQueryNotFound, QueryCostExceeded
 from .meta import TimeoutExit
+from .persisted import get_query_hash, resolve_persisted_query
 
-from graphene_django.views import GraphQLView as DefaultGraphQlView
+from graphene_django.views import GraphQLView as DefaultGraphQlView, HttpError
+from graphql.error import GraphQLError
+from graphql.execution import ExecutionResult
 
 
 SUCCESS = dict((
@@ -18,15 +25,78 @@ SUCCESS = dict((
 ))
 
 
+# Errors of invalid documents: syntax errors, and graphql-core's validation overflowing the stack on cyclic fragments
+DOCUMENT_ERRORS = GraphQLError, RecursionError
+
+
 class GraphQLView(DefaultGraphQlView):
     """Capture original non-gql errors in sentry before returning gql response."""
 
-    def execute_graphql_request(self, *args, **kwargs):
-        result = super().execute_graphql_request(*args, **kwargs)
+    document_backend = document_backend
+
+    def get_backend(self, request):
+        """Parse and validate each query string once, see api.backend."""
+        return self.document_backend
+
+    @staticmethod
+    def get_graphql_params(request, data):
+        """Swap the hash of a persisted query for the query, see api.persisted."""
+        query, variables, operation_name, id = DefaultGraphQlView.get_graphql_params(request, data)
+        try:
+            query = resolve_persisted_query(query, id or get_query_hash(request, data))
+        except PersistedQueryNotFound as e:
+            raise HttpError(HttpResponseBadRequest(str(e)))
+        return query, variables, operation_name, id
+
+    def get_response(self, request, data, show_graphiql=False):
+        """Serve read-only operations from the response cache, see api.cache."""
+        if response_cache is None or self.batch or show_graphiql:
+            return super().get_response(request, data, show_graphiql)
+
+        query, variables, operation_name, _ = self.get_graphql_params(request, data)
+        try:
+            document = self.document_backend.document_from_string(self.schema, query) if query else None
+        except DOCUMENT_ERRORS:
+            document = None  # the default response reports it
+        if document is None or document.get_operation_type(operation_name) != 'query':
+            return super().get_response(request, data, show_graphiql)
+
+        key = response_cache.get_key(query, variables, operation_name, request.user)
+        response = response_cache.get(key)
+        if response is not None:
+            return response
+
+        versions = response_cache.get_versions(get_document_models(self.schema, document.document_ast))
+        response = super().get_response(request, data, show_graphiql)
+        if getattr(self, '_cacheable', False):
+            response_cache.set(key, response, versions)
+        return response
+
+    def execute_graphql_request(self, request, data, query, variables, operation_name, show_graphiql=False):
+        """Reject queries over the cost budget before executing them, see api.cost."""
+        self._cost_report = None
+        cost = self._analyze_cost(query, variables, operation_name)
+        if cost is not None and cost.is_over_budget:
+            self._cost_report = cost.report
+            self._cacheable = False
+            return ExecutionResult(errors=[QueryCostExceeded(cost.report)], invalid=True)
+
+        result = super().execute_graphql_request(request, data, query, variables, operation_name, show_graphiql)
+        self._cacheable = result is not None and not result.errors and not result.invalid
         # if result.errors:
         #     self._sentry_capture(result.errors)
         return result
 
+    def _analyze_cost(self, query, variables, operation_name):
+        if not query:
+            return None
+        try:
+            document = self.document_backend.document_from_string(self.schema, query)
+        except DOCUMENT_ERRORS:
+            return None  # execution reports it
+        # invalid documents are analyzed as far as they're known to the schema, validation reports the rest in execution
+        return analyze_query(self.schema, document.document_ast, variables, operation_name)
+
     # def _sentry_capture(self, errors):
     #     for error in errors:
     #         sentry_sdk.capture_exception(getattr(error, 'original_error', error))
@@ -62,4 +132,6 @@ class GraphQLView(DefaultGraphQlView):
             success = SUCCESS['TIMEOUT']
 
         result = self._add_response_field(result, 'success', success)
+        if getattr(self, '_cost_report', None) and not self.batch:
+            result = self._add_response_field(result, 'extensions', {'cost': self._cost_report})
         return result
@@ -11,6 +11,10 @@ import os
 
 from django.core.asgi import get_asgi_application
 
+from config.startup import preload
+
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'config.settings.base')
 
 application = get_asgi_application()
+
+preload()  # build the schema before the workers fork, see config.startup
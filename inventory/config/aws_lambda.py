@@ -0,0 +1,13 @@
+import os
+import django
+
+from config.startup import preload
+
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "config.settings.base")
+
+django.setup()
+preload()  # build the schema in the Lambda init phase, see config.startup
+
+from api.events import EventHandler  # noqa: E402, needs the apps loaded
+
+handler = EventHandler()  # Lambda handler `config.aws_lambda.handler`, see api.events
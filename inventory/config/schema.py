@@ -3,6 +3,14 @@ from api.registry import get_global_registry
 
 # Import schema files from newly registered apps
 # Sorted from core apps to more dependent apps, NOT ALPHABETICALLY
+import parts.schema  # noqa
+import suppliers.schema  # noqa
+import modules.schema  # noqa
+import orders.schema  # noqa
 
 
-schema = get_global_registry().get_schema()
+def __getattr__(name):
+    """Build the schema on first access of `config.schema.schema` (GRAPHENE['SCHEMA']), not on import."""
+    if name == 'schema':
+        return get_global_registry().get_schema()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
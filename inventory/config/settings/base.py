@@ -129,6 +129,33 @@ GRAPHENE = {
 GRAPHENE_MUTATIONS = []
 GRAPHENE_NODE_DICT = {}
 GRAPHQL_TIMEOUT = 1000
+GRAPHQL_SCHEMA_PRELOAD = True  # build the schema when the WSGI/ASGI application loads, before workers fork, see config.startup
+GRAPHQL_DOCUMENT_CACHE_SIZE = 256  # parsed and validated documents kept by api.backend.document_cache
+GRAPHQL_PERSISTED_QUERIES_STRICT = False  # serve persisted queries only, see api.persisted
+GRAPHQL_PERSISTED_QUERIES_TTL = 60  # seconds before the persisted query catalogue of a worker is rebuilt
+GRAPHQL_COST = {  # static query cost analysis rejecting queries over budget before execution, see api.cost, None turns it off
+    'MAX_COST': 100000,
+    'MAX_DEPTH': 10,
+    'WEIGHTS': {},  # {typename: cost of one object}, 1 by default
+    'FILTER_SELECTIVITY': 0.1,  # share of the rows left by each lookup or filter
+    'AGGREGATE_ROW_WEIGHT': 0.01,
+    'STATISTICS_TIMEOUT': 300,  # seconds the row counts of tables are cached
+}
+GRAPHQL_EVENTS_CONNECTION_CHECK_AFTER = 60  # seconds idle after which the Lambda handler checks its DB connections, see api.events
+GRAPHQL_RESPONSE_CACHE = None  # responses of read-only operations, see api.cache, needs a shared CACHES['default']
+# GRAPHQL_RESPONSE_CACHE = {
+#     'BACKEND': 'api.cache.SharedResponseCache',  # or 'api.cache.LocalResponseCache' with OPTIONS {'maxsize': ..., 'timeout': ...}
+#     'OPTIONS': {'alias': 'default', 'timeout': 300},
+# }
+
+
+# Parts
+PART_AVAILABILITY_SNAPSHOT_TTL = 10  # seconds the admin availability snapshot keeps rows, see parts.availability
+PART_SEARCH_INDEX_TTL = 60  # seconds before the search index of non-PostgreSQL backends is rebuilt, see parts.search
+
+
+# Modules
+MODULE_BOM_TTL = 60  # seconds before the bill of materials of a worker is reloaded, see modules.bom
 
 
 # Password validation
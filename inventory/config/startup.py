@@ -0,0 +1,47 @@
+
+
+import time
+
+from django.conf import settings
+from django.urls import get_resolver
+
+
+"""
+Warm-up
+
+A fresh worker imports the URLconf, builds the GraphQL schema (`Registry._construct_schema`) and
+parses graphql-core's validation machinery on its first request, which makes the first request
+of every worker and every serverless cold start wait for all of it.
+
+`warm_up` does that work up front. `config.wsgi` and `config.asgi` call it at import when `GRAPHQL_SCHEMA_PRELOAD`
+is set, so servers preloading the application before forking (gunicorn --preload, uWSGI without lazy-apps)
+build the schema once in the master and every worker starts with it in copy-on-write memory,
+and Lambda runs it in the init phase instead of the first invocation.
+
+It doesn't touch the database, connections opened before a fork would be shared by the workers.
+"""
+
+
+def _timed(timings, step, function):
+    start = time.perf_counter()
+    out = function()
+    timings[step] = (time.perf_counter() - start) * 1000
+    return out
+
+
+def warm_up():
+    """Import the URLconf, build the schema and validate a document against it, return {step: ms}."""
+    from graphene_django.settings import graphene_settings
+    from api.backend import document_backend
+
+    timings = {}
+    _timed(timings, 'urls', lambda: get_resolver().url_patterns)
+    schema = _timed(timings, 'schema', lambda: graphene_settings.SCHEMA)
+    _timed(timings, 'middleware', lambda: graphene_settings.MIDDLEWARE)
+    _timed(timings, 'validation', lambda: document_backend.document_from_string(schema, '{ __typename }'))
+    return timings
+
+
+def preload():
+    if getattr(settings, 'GRAPHQL_SCHEMA_PRELOAD', False):
+        warm_up()
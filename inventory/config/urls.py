@@ -9,6 +9,7 @@ from django.urls import path
 from django.views.decorators.csrf import csrf_exempt
 
 from api.views import GraphQLView
+from parts.views import export_parts
 
 
 urlpatterns = [
@@ -18,6 +19,9 @@ urlpatterns = [
     path("graphql", csrf_exempt(GraphQLView.as_view(graphiql=True))),
     path("graphql/", csrf_exempt(GraphQLView.as_view(graphiql=True))),
 
+    # Exports
+    url(r'^export/parts\.(?P<fmt>csv|tsv)$', export_parts),
+
 ] + static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)  # + app_url_patterns
 
 admin.autodiscover()
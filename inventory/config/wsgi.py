@@ -1,6 +1,10 @@
 import os
 from django.core.wsgi import get_wsgi_application
 
+from config.startup import preload
+
 os.environ.setdefault("DJANGO_SETTINGS_MODULE", "config.settings.base")
 
 application = get_wsgi_application()
+
+preload()  # build the schema before the workers fork, see config.startup
@@ -0,0 +1,61 @@
+import io
+import json
+import time
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.core.handlers.wsgi import WSGIHandler
+from django.test import Client, RequestFactory
+from graphql_jwt.shortcuts import get_token
+
+from api.events import EventHandler
+
+
+QUERY = '{ __typename }'
+
+
+class Command(BaseCommand):
+    help = "Benchmark the overhead of a Lambda handler invocation against the GraphQLView behind Django's request cycle."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--query', default=QUERY, help="The query of both, a trivial one measures the overhead only.")
+        parser.add_argument('--repeat', type=int, default=1000)
+
+    def _timed(self, label, function, repeat):
+        function()  # the first request of each builds what's cached per worker
+        start = time.perf_counter()
+        for _ in range(repeat):
+            function()
+        self.stdout.write(f"{label:<24}{(time.perf_counter() - start) * 1000 / repeat:>10.3f} ms")
+
+    def handle(self, *args, **options):
+        repeat = options['repeat']
+        body = json.dumps({'query': options['query']})
+        user = get_user_model().objects.filter(is_superuser=True).first()
+        settings.ALLOWED_HOSTS = [*settings.ALLOWED_HOSTS, 'testserver']
+
+        client = Client()
+        if user:
+            client.force_login(user)  # a session, as a browser would have
+        wsgi = WSGIHandler()  # the application of config.wsgi, without the test client
+        environ = RequestFactory().post('/graphql/', body, content_type='application/json', HTTP_COOKIE=client.cookies.output(header='', sep=';')).environ
+
+        def _django_request():
+            response = wsgi({**environ, 'wsgi.input': io.BytesIO(body.encode('utf-8'))}, lambda *args: None)
+            response.close()  # sends request_finished
+
+        handler = EventHandler()
+        event = {
+            'version': '2.0',
+            'rawPath': '/graphql/',
+            'rawQueryString': '',
+            'headers': {'content-type': 'application/json', **({'authorization': f'JWT {get_token(user)}'} if user else {})},
+            'requestContext': {'http': {'method': 'POST', 'path': '/graphql/'}},
+            'body': body,
+            'isBase64Encoded': False,
+        }
+
+        self.stdout.write(f"{repeat} requests of {options['query']!r}{' as ' + user.username if user else ''}.")
+        self._timed('django request', _django_request, repeat)
+        self._timed('lambda event', lambda: handler(event), repeat)
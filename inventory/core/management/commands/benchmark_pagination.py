@@ -0,0 +1,55 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from api.filters import CursorPaginationFilter, FilterSet, PaginationFilter
+from parts.models import Part
+
+
+class Command(BaseCommand):
+    help = "Benchmark offset against cursor pagination of parts, an early and a deep page. Everything runs in a transaction that is rolled back."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=50000, help="Number of parts.")
+        parser.add_argument('--page-size', type=int, default=50)
+        parser.add_argument('--page', type=int, default=500, help="The deep page to fetch.")
+        parser.add_argument('--repeat', type=int, default=20)
+
+    def _timed(self, label, function, repeat):
+        start = time.perf_counter()
+        for _ in range(repeat):
+            function()
+        self.stdout.write(f"{label:<24}{(time.perf_counter() - start) * 1000 / repeat:>10.2f} ms")
+
+    def handle(self, *args, **options):
+        rows, page_size, repeat = options['rows'], options['page_size'], options['repeat']
+        filters = {'pagination': PaginationFilter, 'cursor': CursorPaginationFilter}
+
+        with transaction.atomic():
+            missing = rows - Part.objects.count()
+            if missing > 0:
+                first_uuid = (Part.objects.order_by('-uuid').values_list('uuid', flat=True).first() or 0) + 1
+                Part.objects.bulk_create([
+                    Part(uuid=uuid, name=f"benchmark-{uuid}", category='misc') for uuid in range(first_uuid, first_uuid + missing)
+                ], batch_size=1000)
+
+            page = min(options['page'], Part.objects.count() // page_size)
+            self.stdout.write(f"Fetching pages of {page_size} parts, page 2 and page {page}.")
+
+            def _offset(page):
+                return lambda: list(FilterSet(filters, pagination={'limit_to': page_size, 'offset': (page - 1) * page_size}).apply(
+                    Part.objects.values('id', 'uuid', 'name')))
+
+            def _cursor(page):
+                # the cursor of the last row of the previous page, as a client paging through would have it
+                qs = FilterSet(filters, cursor={}).apply(Part.objects.values('id', 'uuid', 'name'))
+                after = CursorPaginationFilter.get_cursor(qs, qs[(page - 1) * page_size - 1])
+                return lambda: list(FilterSet(filters, cursor={'first': page_size, 'after': after}).apply(
+                    Part.objects.values('id', 'uuid', 'name')))
+
+            for paginate in (_offset, _cursor):
+                for page_number in (2, page):
+                    self._timed(f'{paginate.__name__[1:]} page {page_number}', paginate(page_number), repeat)
+
+            transaction.set_rollback(True)
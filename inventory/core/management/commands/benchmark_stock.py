@@ -0,0 +1,44 @@
+
+
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from parts.models import Part
+
+
+class Command(BaseCommand):
+    help = "Benchmark Part.objects.adjust_stock against per-row saves. Everything runs in a transaction that is rolled back."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--lines', type=int, default=10000, help="Number of {part_id: delta} lines.")
+
+    def _timed(self, label, function):
+        start = time.perf_counter()
+        function()
+        self.stdout.write(f"{label:<24}{(time.perf_counter() - start) * 1000:>10.1f} ms")
+
+    def handle(self, *args, **options):
+        lines = options['lines']
+
+        with transaction.atomic():
+            missing = lines - Part.objects.count()
+            if missing > 0:
+                first_uuid = (Part.objects.order_by('-uuid').values_list('uuid', flat=True).first() or 0) + 1
+                Part.objects.bulk_create([
+                    Part(uuid=uuid, name=f"benchmark-{uuid}", category='misc') for uuid in range(first_uuid, first_uuid + missing)
+                ], batch_size=1000)
+
+            part_deltas = {part_id: (part_id % 7) + 1 for part_id in Part.objects.values_list('id', flat=True)[:lines]}
+            self.stdout.write(f"Adjusting stock of {len(part_deltas)} parts.")
+
+            def _per_row():
+                for part in Part.objects.filter(id__in=list(part_deltas)):
+                    part.stock += part_deltas[part.id]
+                    Part.objects.filter(id=part.id).update(stock=part.stock)  # plain UPDATE, skips the journal in save()
+
+            self._timed('per-row updates', _per_row)
+            self._timed('adjust_stock', lambda: Part.objects.adjust_stock(part_deltas))
+
+            transaction.set_rollback(True)
@@ -0,0 +1,22 @@
+
+
+from django.core.management.base import BaseCommand
+
+from parts.export import DELIMITERS, export_lines
+
+
+class Command(BaseCommand):
+    help = "Stream the part catalog with stock, demand, ordered and missing counts and supplier codes as CSV/TSV."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--format', choices=DELIMITERS, default='csv')
+        parser.add_argument('--output', help="File to write, stdout by default.")
+
+    def handle(self, *args, **options):
+        if not options['output']:
+            for line in export_lines(options['format']):
+                self.stdout.write(line, ending='')
+            return
+
+        with open(options['output'], 'w', newline='') as file:
+            file.writelines(export_lines(options['format']))
@@ -0,0 +1,34 @@
+import json
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from graphql_jwt.shortcuts import get_token
+
+from api.events import EventHandler
+
+
+class Command(BaseCommand):
+    help = "Run recorded API Gateway events (config/events/*.json) through the Lambda handler and print the responses."
+
+    def add_arguments(self, parser):
+        parser.add_argument('paths', nargs='+', help="Files with one API Gateway v2 event each.")
+        parser.add_argument('--user', help="Username to authenticate as, sends a fresh JWT in the Authorization header.")
+
+    def handle(self, *args, **options):
+        handler = EventHandler()
+        token = None
+        if options['user']:
+            try:
+                token = get_token(get_user_model().objects.get_by_natural_key(options['user']))
+            except get_user_model().DoesNotExist:
+                raise CommandError(f"Unknown user {options['user']}.")
+
+        for path in options['paths']:
+            with open(path, 'r') as file:
+                event = json.load(file)
+            if token:
+                event['headers'] = {**event.get('headers', {}), 'authorization': f'JWT {token}'}
+
+            response = handler(event)
+            self.stdout.write(f"{path}  {response['statusCode']}")
+            self.stdout.write(response['body'])
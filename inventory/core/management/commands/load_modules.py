@@ -1,46 +1,155 @@
 
 
-from django.core.management.base import BaseCommand
-from django.db import transaction
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from funcy import chunks
 
-from modules.models import Module, ModulePart
-from parts.models import Part
+from core.signals import bulk_changed
+from core.staging import StagingTable
+from modules.models import Module, ModulePart, ModuleRollup
+from parts.models import Part, PartAvailability
+
+
+COUNTS_OFFSET = 10  # uuid and part info columns preceding the module counts
+
+HEADER_COLUMNS = [
+    ('position', 'integer'),
+    ('name', 'text'),
+]
+
+COUNT_COLUMNS = [
+    ('uuid', 'integer'),
+    ('position', 'integer'),
+    ('count', 'integer'),
+]
+
+TARGET_COLUMNS = [
+    ('module_id', 'integer'),
+    ('part_id', 'integer'),
+    ('count', 'integer'),
+]
+
+
+def read_header(path):
+    with open(path, 'r') as file:
+        return [item.strip() or None for item in file.readline().split('\t')]
+
+
+def read_counts(path):
+    """Lazily yield (uuid, module column, count) for every nonzero count of the BOM matrix."""
+    with open(path, 'r') as file:
+        for i, line in enumerate(file, 1):
+            if i <= 2:  # module names and a summary row
+                continue
+
+            row = [item.strip() or None for item in line.split('\t')]
+            try:
+                uuid = int(row[0])
+                for position, count in enumerate(row[COUNTS_OFFSET:]):
+                    count = int(count.split(',')[0]) if count else None
+                    if count:
+                        yield uuid, position, count
+            except (TypeError, ValueError) as e:
+                raise CommandError(f'Invalid row #{i}\n{type(e)}: {e}\n{row}')
 
 
 class Command(BaseCommand):
+    help = "Stream the module BOM matrix into a staging table and resolve parts and modules with set-based joins."
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', nargs='?', default='inventory/modules.tsv')
+        parser.add_argument(
+            '--upsert', action='store_true',
+            help="Sync an existing BOM: write only new and changed cells, delete cells no longer listed for the modules in the file."
+        )
 
     def handle(self, *args, **options):
+        part_table = connection.ops.quote_name(Part._meta.db_table)
+        module_table = connection.ops.quote_name(Module._meta.db_table)
 
-        with transaction.atomic():
-            data = [row.split('\t') for row in open('inventory/modules.tsv', 'r')]
-            data = [[item.strip() or None for item in row] for row in data]
+        header = read_header(options['path'])
 
-            header = data[0]
-            data = data[2:]
+        with transaction.atomic(), \
+                StagingTable('module_staging', HEADER_COLUMNS) as modules, \
+                StagingTable('module_part_staging', COUNT_COLUMNS) as counts, \
+                StagingTable('module_part_target', TARGET_COLUMNS) as target:
 
-            for name in header:
+            existing = set(Module.objects.values_list('name', flat=True))
+            new_modules = [name for name in dict.fromkeys(header) if name and name not in existing]
+            for name in new_modules:
                 Module.objects.create(name=name)
 
-            module_parts = []
-            module_name_id_dict = {name: pk for pk, name in Module.objects.values_list('id', 'name')}
-            part_uuid_id_dict = {uuid: pk for pk, uuid in Part.objects.values_list('id', 'uuid')}
+            modules.load((position, name) for position, name in enumerate(header) if name)
+            count = counts.load(read_counts(options['path']))
+
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    f"SELECT DISTINCT s.uuid FROM {counts.table} s LEFT JOIN {part_table} p ON p.uuid = s.uuid WHERE p.id IS NULL"
+                )
+                unknown = [uuid for uuid, in cursor.fetchmany(10)]
+                if unknown:
+                    raise CommandError(f"Unknown part uuids: {', '.join(map(str, unknown))}")
+
+                # columns repeating a module name add up into a single line
+                cursor.execute(
+                    f"INSERT INTO {target.table} (module_id, part_id, count) "
+                    f"SELECT m.id, p.id, SUM(s.count) FROM {counts.table} s "
+                    f"JOIN {modules.table} h ON h.position = s.position "
+                    f"JOIN {module_table} m ON m.name = h.name "
+                    f"JOIN {part_table} p ON p.uuid = s.uuid "
+                    f"GROUP BY m.id, p.id"
+                )
+
+                if options['upsert']:
+                    self.upsert(cursor, modules, target)
+                    self.stdout.write(f"Modules: {len(new_modules)} new.")
+                else:
+                    self.insert(cursor, target)
+                    self.stdout.write(f"Loaded {count} counts into {cursor.rowcount} module parts.")
+
+            bulk_changed.send(sender=ModulePart)
+
+    def insert(self, cursor, target):
+        module_part_table = connection.ops.quote_name(ModulePart._meta.db_table)
+
+        cursor.execute(f"INSERT INTO {module_part_table} (module_id, part_id, count) SELECT module_id, part_id, count FROM {target.table}")
+
+        PartAvailability.rebuild()
+        ModuleRollup.rebuild()
+
+    def upsert(self, cursor, modules, target):
+        """Apply the difference between the staged BOM and ModulePart, only the changed lines are written and locked."""
+        module_table = connection.ops.quote_name(Module._meta.db_table)
+        module_part_table = connection.ops.quote_name(ModulePart._meta.db_table)
+        listed_modules = f"SELECT m.id FROM {modules.table} h JOIN {module_table} m ON m.name = h.name"
+        not_listed = (
+            f"NOT EXISTS (SELECT 1 FROM {target.table} t "
+            f"WHERE t.module_id = {module_part_table}.module_id AND t.part_id = {module_part_table}.part_id)"
+        )
 
-            for i, row in enumerate(data):
-                try:
+        changed = (
+            f"FROM {target.table} t LEFT JOIN {module_part_table} mp "
+            f"ON mp.module_id = t.module_id AND mp.part_id = t.part_id WHERE mp.id IS NULL OR mp.count <> t.count"
+        )
 
-                    uuid, counts = int(row[0]), row[10:] + [None] * (len(header) - len(row[1:]))
-                    counts = [int(count.split(',')[0]) if count else None for count in counts]
+        cursor.execute(f"SELECT t.module_id, t.part_id, mp.id {changed}")
+        upserted = cursor.fetchall()
+        cursor.execute(
+            f"SELECT module_id, part_id FROM {module_part_table} WHERE module_id IN ({listed_modules}) AND {not_listed}"
+        )
+        removed = cursor.fetchall()
 
-                    if not any(counts): continue
-                    part_pk = part_uuid_id_dict.pop(uuid)
-                    # print([f"{header}: {uuid} x {count}" for header, count in zip(header, counts) if count])
-                    for count, name in zip(counts, header):
-                        if count:
-                            # print(i, uuid, name, count)
-                            module_parts.append(ModulePart(part_id=part_pk, module_id=module_name_id_dict[name], count=count))
+        # only new and changed lines are proposed, so unchanged rows aren't locked by the conflict check
+        cursor.execute(
+            f"INSERT INTO {module_part_table} (module_id, part_id, count) SELECT t.module_id, t.part_id, t.count {changed} "
+            f"ON CONFLICT (module_id, part_id) DO UPDATE SET count = excluded.count"
+        )
+        cursor.execute(f"DELETE FROM {module_part_table} WHERE module_id IN ({listed_modules}) AND {not_listed}")
 
-                except Exception as e:
-                    print(f'Invalid row #{i}\n{type(e)}: {e}\n{part_pk}:{counts}')
-                    raise e
+        changes = [(module_id, part_id) for module_id, part_id, *_ in upserted + removed]
+        for batch in chunks(1000, changes):
+            PartAvailability.refresh({part_id for _, part_id in batch})
+            ModuleRollup.refresh({module_id for module_id, _ in batch})
 
-            ModulePart.objects.bulk_create(module_parts)
+        new_count = len([line_id for *_, line_id in upserted if line_id is None])
+        self.stdout.write(f"Module parts: {new_count} new, {len(upserted) - new_count} changed, {len(removed)} removed.")
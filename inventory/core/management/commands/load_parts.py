@@ -1,11 +1,16 @@
 
 
 from random import randint
+from uuid import uuid4
 
-from django.core.management.base import BaseCommand
-from django.db import transaction
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.utils import timezone
 
-from parts.models import Part, PartOption
+from core.signals import bulk_changed
+from core.staging import StagingTable, distinct_from
+from parts.models import Part, PartAvailability, PartOption, StockMovement
+from parts.search import invalidate_index
 
 
 CATS = [
@@ -20,50 +25,168 @@ CATS = [
     'misc'
 ]
 
+PART_COLUMNS = [
+    ('uuid', 'integer'),
+    ('name', 'text'),
+    ('category', 'text'),
+    ('title', 'text'),
+    ('description', 'text'),
+    ('tme_type', 'text'),
+    ('farnell_code', 'text'),
+    ('comp_value', 'text'),
+    ('stock', 'bigint'),
+    ('min_price', 'double precision'),
+]
 
-class Command(BaseCommand):
+OPTION_COLUMNS = [
+    ('uuid', 'integer'),
+    ('name', 'text'),
+]
 
-    def handle(self, *args, **options):
 
-        with transaction.atomic():
-            data = [row.split('\t') for row in open('inventory/parts.tsv', 'r')]
-            data = [[item.strip() or None for item in row] for row in data]
+CATALOG_COLUMNS = 'name', 'category', 'title', 'description', 'tme_type', 'farnell_code', 'comp_value'
+
+
+def read_parts(path, seed_stock=True):
+    """
+    Lazily yield part rows in PART_COLUMNS order from the parts TSV, category headers apply to the rows below them.
+    The TSV carries no stock or prices, `seed_stock` fills them with random test values, zeros otherwise.
+    """
+    category = None
+
+    with open(path, 'r') as file:
+        for i, line in enumerate(file, 1):
+            row = [item.strip() or None for item in line.split('\t')]
 
-            parts = []
-            category = data[0][0]
+            if not any(row):
+                continue
+            if row[0] in CATS:
+                category = row[0]
+                continue
 
-            for i, row in enumerate(data, 1):
+            row = row + [None] * (7 - len(row))  # normalize row
+            try:
+                uuid, name, title, desc, tme_type, farnell_code, comp_value = row
+                uuid = int(uuid)
+            except (TypeError, ValueError) as e:
+                raise CommandError(f'Invalid row #{i}\n{type(e)}: {e}\n{row}')
 
-                if row[0] in CATS:
-                    category = row[0]
+            stock, min_price = (randint(0, 10000), randint(0, 200) / 100) if seed_stock else (0, 0)
+            yield uuid, name, category, title, desc, tme_type, farnell_code, comp_value, stock, min_price
+
+
+class Command(BaseCommand):
+    help = "Stream the parts TSV into a staging table and insert parts, options and initial stock movements set-based."
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', nargs='?', default='inventory/parts.tsv')
+        parser.add_argument(
+            '--upsert', action='store_true',
+            help="Sync an existing catalog: insert new uuids, update changed ones, delete the ones no longer listed."
+        )
+
+    def handle(self, *args, **options):
+        upsert = options['upsert']
+
+        with transaction.atomic(), \
+                StagingTable('part_staging', PART_COLUMNS) as parts, \
+                StagingTable('part_option_staging', OPTION_COLUMNS) as part_options:
+
+            count = parts.load(read_parts(options['path'], seed_stock=not upsert))
+            # option names are the '/' separated parts of the name, the file is streamed once more for them
+            part_options.load(
+                (row[0], option.strip())
+                for row in read_parts(options['path'], seed_stock=False)
+                for option in row[1].split('/')
+            )
+
+            with connection.cursor() as cursor:
+                if upsert:
+                    self.upsert(cursor, parts, part_options)
                 else:
-                    row = row + [None] * (7 - len(row))  # normalize row
-                    try:
-                        uuid, name, title, desc, tme_type, farnell_code, comp_value = row
-                    except ValueError as e:
-                        print(f'Invalid row #{i}\n{type(e)}: {e}\n{row}')
-                        return
-
-                    parts.append(Part(
-                        uuid=uuid,
-                        name=name,
-                        category=category,
-                        title=title,
-                        description=desc,
-                        tme_type=tme_type,
-                        farnell_code=farnell_code,
-                        comp_value=comp_value,
-                        stock=randint(0, 10000),
-                        min_price=randint(0, 200) / 100
-                    ))
-
-            Part.objects.bulk_create(parts)
-
-            part_options = []
-
-            for part in Part.objects.all():
-                option_names = [item.strip() for item in part.name.split('/')]
-                for name in option_names:
-                    part_options.append(PartOption(name=name, part_id=part.pk))
-
-            PartOption.objects.bulk_create(part_options)
+                    self.insert(cursor, parts, part_options)
+                    self.stdout.write(f"Loaded {count} parts.")
+
+            transaction.on_commit(invalidate_index)
+            for Model in (Part, PartOption, StockMovement):
+                bulk_changed.send(sender=Model)
+
+    def insert(self, cursor, parts, part_options):
+        part_table = connection.ops.quote_name(Part._meta.db_table)
+        option_table = connection.ops.quote_name(PartOption._meta.db_table)
+        movement_table = connection.ops.quote_name(StockMovement._meta.db_table)
+
+        now = Part._meta.get_field('created').get_db_prep_value(timezone.now(), connection)
+        batch = StockMovement._meta.get_field('batch').get_db_prep_value(uuid4(), connection)
+
+        cursor.execute(
+            f"INSERT INTO {part_table} (uuid, {', '.join(CATALOG_COLUMNS)}, stock, min_price, current_price, created, modified) "
+            f"SELECT uuid, {', '.join(CATALOG_COLUMNS)}, stock, min_price, 0, %s, %s FROM {parts.table}",
+            [now, now]
+        )
+        cursor.execute(
+            f"INSERT INTO {option_table} (name, part_id, created, modified) "
+            f"SELECT s.name, p.id, %s, %s FROM {part_options.table} s JOIN {part_table} p ON p.uuid = s.uuid",
+            [now, now]
+        )
+        cursor.execute(
+            f"INSERT INTO {movement_table} (part_id, kind, delta, reference, batch, created) "
+            f"SELECT p.id, 'adjustment', p.stock, 'load_parts', %s, %s "
+            f"FROM {parts.table} s JOIN {part_table} p ON p.uuid = s.uuid WHERE p.stock <> 0",
+            [batch, now]
+        )
+
+        Part.update_comp_values()
+        PartAvailability.rebuild()
+
+    def upsert(self, cursor, parts, part_options):
+        """Apply the difference between the staged TSV and the catalog, only changed rows are written."""
+        part_table = connection.ops.quote_name(Part._meta.db_table)
+        option_table = connection.ops.quote_name(PartOption._meta.db_table)
+
+        modified = timezone.now()
+        now = Part._meta.get_field('created').get_db_prep_value(modified, connection)
+        changed = ' OR '.join(distinct_from(connection, f"p.{column}", f"s.{column}") for column in CATALOG_COLUMNS)
+
+        cursor.execute(f"SELECT COUNT(*) FROM {parts.table} s LEFT JOIN {part_table} p ON p.uuid = s.uuid WHERE p.id IS NULL")
+        new_count, = cursor.fetchone()
+
+        # only new and changed rows are proposed, so unchanged rows aren't locked by the conflict check
+        cursor.execute(
+            f"INSERT INTO {part_table} (uuid, {', '.join(CATALOG_COLUMNS)}, stock, min_price, current_price, created, modified) "
+            f"SELECT s.uuid, {', '.join(f's.{column}' for column in CATALOG_COLUMNS)}, 0, 0, 0, %s, %s "
+            f"FROM {parts.table} s LEFT JOIN {part_table} p ON p.uuid = s.uuid WHERE p.id IS NULL OR {changed} "
+            f"ON CONFLICT (uuid) DO UPDATE SET {', '.join(f'{column} = excluded.{column}' for column in CATALOG_COLUMNS)}, "
+            f"modified = excluded.modified",
+            [now, now]
+        )
+        changed_count = cursor.rowcount - new_count
+
+        cursor.execute(f"SELECT p.id FROM {part_table} p LEFT JOIN {parts.table} s ON s.uuid = p.uuid WHERE s.uuid IS NULL")
+        removed = Part.objects.filter(id__in=[part_id for part_id, in cursor.fetchall()])
+        kept_count = removed.filter(order_parts__isnull=False).distinct().count()  # deleting would drop order history
+        removed_count = removed.count() - kept_count
+        removed.filter(order_parts=None).delete()
+
+        cursor.execute(
+            f"INSERT INTO {option_table} (name, part_id, created, modified) "
+            f"SELECT DISTINCT s.name, p.id, %s, %s FROM {part_options.table} s JOIN {part_table} p ON p.uuid = s.uuid "
+            f"LEFT JOIN {option_table} o ON o.part_id = p.id AND o.name = s.name WHERE o.id IS NULL",
+            [now, now]
+        )
+        new_option_count = cursor.rowcount
+        cursor.execute(
+            f"DELETE FROM {option_table} WHERE part_id IN (SELECT p.id FROM {part_table} p JOIN {parts.table} s ON s.uuid = p.uuid) "
+            f"AND NOT EXISTS (SELECT 1 FROM {part_options.table} s JOIN {part_table} p ON p.uuid = s.uuid "
+            f"WHERE p.id = {option_table}.part_id AND s.name = {option_table}.name)"
+        )
+        removed_option_count = cursor.rowcount
+
+        Part.update_comp_values(Part.objects.filter(modified=modified))  # new and changed parts
+        PartAvailability.create_missing()  # new parts have no stock nor lines yet, zeros are up to date
+
+        self.stdout.write(
+            f"Parts: {new_count} new, {changed_count} changed, {removed_count} removed"
+            f"{f', {kept_count} kept as still ordered' if kept_count else ''}. "
+            f"Options: {new_option_count} new, {removed_option_count} removed."
+        )
@@ -0,0 +1,24 @@
+from django.core.management.base import BaseCommand, CommandError
+from graphql.error import GraphQLError
+
+from api.models import PersistedQuery
+
+
+class Command(BaseCommand):
+    help = "Register GraphQL documents as persisted queries, clients then send their sha256 hash instead of the query."
+
+    def add_arguments(self, parser):
+        parser.add_argument('paths', nargs='+', help="Files with one GraphQL document each.")
+        parser.add_argument('--name', default='', help="Name of the persisted queries, their operation names by default.")
+
+    def handle(self, *args, **options):
+        for path in options['paths']:
+            with open(path, 'r') as file:
+                query = file.read()
+
+            try:
+                persisted_query = PersistedQuery.persist(query, name=options['name'])
+            except GraphQLError as e:
+                raise CommandError(f"{path}: {e}")
+
+            self.stdout.write(f"{persisted_query.hash}  {persisted_query.name}  {path}")
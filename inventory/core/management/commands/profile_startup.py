@@ -0,0 +1,97 @@
+import json
+import os
+import subprocess
+import sys
+
+from collections import defaultdict
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+
+# Runs in a fresh interpreter under `-X importtime`, prints the phase timings as JSON on its last line
+BOOT_SCRIPT = """
+import json, time
+start = time.perf_counter()
+phases, registry = {}, {}
+
+def _timed(phase, function):
+    global start
+    out = function()
+    phases[phase] = (time.perf_counter() - start) * 1000
+    start = time.perf_counter()
+    return out
+
+import django
+_timed('django setup', django.setup)
+from django.conf import settings
+from django.test import Client
+settings.ALLOWED_HOSTS = [*settings.ALLOWED_HOSTS, 'testserver']
+client = Client()
+start = time.perf_counter()  # the test client isn't a part of a worker
+_timed('middleware', client.handler.load_middleware)  # loaded by get_wsgi_application
+
+if WARM:
+    from config.startup import warm_up
+    _timed('warm up', warm_up)
+
+_timed('first request', lambda: client.post('/graphql/', json.dumps({'query': '{ __typename }'}), content_type='application/json'))
+_timed('second request', lambda: client.post('/graphql/', json.dumps({'query': '{ __typename }'}), content_type='application/json'))
+from api.registry import get_global_registry
+registry = get_global_registry().timings
+print(json.dumps({'phases': phases, 'registry': registry}))
+"""
+
+
+def parse_importtime(lines):
+    """Return [(module, self us, cumulative us)] of `python -X importtime` stderr lines."""
+    out = []
+    for line in lines:
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        self_us, cumulative_us, module = line[len('import time:'):].split('|')
+        out.append((module.strip(), int(self_us), int(cumulative_us)))
+    return out
+
+
+class Command(BaseCommand):
+    help = "Profile the cold start of a worker: the slowest imports, the schema construction steps of the registry and the time to the first request."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--limit', type=int, default=20, help="Number of slowest modules to list.")
+        parser.add_argument('--warm', action='store_true', help="Run config.startup.warm_up before the first request, as a preloaded worker does.")
+
+    def _write_table(self, title, rows, unit='ms'):
+        self.stdout.write(f"\n{title}")
+        for label, value in rows:
+            self.stdout.write(f"  {label:<48}{value:>10.1f} {unit}")
+
+    def handle(self, *args, **options):
+        script = BOOT_SCRIPT.replace('WARM', str(options['warm']))
+        process = subprocess.run(
+            [sys.executable, '-X', 'importtime', '-c', script],
+            cwd=settings.BASE_DIR.parent, env=os.environ.copy(), capture_output=True, text=True,
+        )
+        if process.returncode:
+            raise CommandError(process.stderr[-2000:])
+
+        result = json.loads(process.stdout.strip().splitlines()[-1])
+        imports = parse_importtime(process.stderr.splitlines())
+        limit = options['limit']
+
+        by_self = sorted(imports, key=lambda item: -item[1])[:limit]
+        self._write_table("Slowest modules, self time", [(module, self_us / 1000) for module, self_us, _ in by_self])
+
+        by_cumulative = sorted(imports, key=lambda item: -item[2])[:limit]
+        self._write_table("Slowest modules, including their imports", [(module, cumulative_us / 1000) for module, _, cumulative_us in by_cumulative])
+
+        packages = defaultdict(int)
+        for module, self_us, _ in imports:
+            packages[module.split('.')[0]] += self_us
+        self._write_table("Import time by package", [(package, us / 1000) for package, us in sorted(packages.items(), key=lambda item: -item[1])[:limit]])
+
+        if result['registry']:
+            self._write_table("Schema construction steps", result['registry'].items())
+        self._write_table("Phases", result['phases'].items())
+        first_request = sum(ms for phase, ms in result['phases'].items() if phase != 'second request')
+        self.stdout.write(f"\n  {'time to first request':<48}{first_request:>10.1f} ms")
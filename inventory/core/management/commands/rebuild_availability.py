@@ -0,0 +1,13 @@
+
+
+from django.core.management.base import BaseCommand
+
+from parts.models import PartAvailability
+
+
+class Command(BaseCommand):
+    help = "Rebuild the PartAvailability ledger from scratch (demands, orders and stock of every part)."
+
+    def handle(self, *args, **options):
+        PartAvailability.rebuild()
+        self.stdout.write(f"Rebuilt availability of {PartAvailability.objects.count()} parts.")
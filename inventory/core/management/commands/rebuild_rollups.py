@@ -0,0 +1,15 @@
+
+
+from django.core.management.base import BaseCommand
+
+from modules.models import ModuleRollup
+from orders.models import OrderRollup
+
+
+class Command(BaseCommand):
+    help = "Rebuild the stored price rollups of modules, devices and orders from scratch."
+
+    def handle(self, *args, **options):
+        ModuleRollup.rebuild()
+        OrderRollup.rebuild()
+        self.stdout.write("Rebuilt module, device and order rollups.")
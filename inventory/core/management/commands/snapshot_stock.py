@@ -0,0 +1,20 @@
+
+
+from django.core.management.base import BaseCommand
+
+from parts.models import Part, StockSnapshot
+
+
+class Command(BaseCommand):
+    help = "Take a periodic stock snapshot from the movement journal, optionally re-projecting Part.stock from it."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--refresh', action='store_true', help="Re-project the cached Part.stock column from the journal.")
+
+    def handle(self, *args, **options):
+        StockSnapshot.take()
+
+        if options['refresh']:
+            Part.refresh_stock()
+
+        self.stdout.write(f"Snapshot taken at {StockSnapshot.latest()['created']}.")
@@ -4,6 +4,27 @@ from django.db import models
 from django.utils import timezone
 from graphene.types.datetime import DateTime
 
+from core.signals import bulk_changed
+
+
+class BulkChangedQuerySet(models.QuerySet):
+    """QuerySet sending `core.signals.bulk_changed` after update (bulk_update runs it) and bulk_create, which don't send post_save."""
+
+    def update(self, **kwargs):
+        rows = super().update(**kwargs)
+        if rows:
+            bulk_changed.send(sender=self.model)
+        return rows
+
+    def bulk_create(self, objs, *args, **kwargs):
+        objs = super().bulk_create(objs, *args, **kwargs)
+        if objs:
+            bulk_changed.send(sender=self.model)
+        return objs
+
+
+BulkChangedManager = models.Manager.from_queryset(BulkChangedQuerySet)
+
 
 class TimestampModel(models.Model):
     """An abstract base class model providing self-updating created and modified fields."""
@@ -11,6 +32,8 @@ class TimestampModel(models.Model):
     created = models.DateTimeField(default=timezone.now)
     modified = models.DateTimeField(default=timezone.now)
 
+    objects = BulkChangedManager()
+
     class Meta:
         abstract = True
 
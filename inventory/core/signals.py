@@ -0,0 +1,8 @@
+
+
+from django.dispatch import Signal
+
+
+# Sent with the model class as the sender after writes that don't send post_save/post_delete, so caches of the model's
+# data can be dropped. core.models.BulkChangedQuerySet sends it after update, bulk_create and bulk_update, raw SQL has to.
+bulk_changed = Signal()
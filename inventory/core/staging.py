@@ -0,0 +1,106 @@
+
+
+from itertools import islice
+
+from django.db import connections
+
+
+"""
+Staging tables
+
+Temporary tables loaded from a lazy stream of rows, so imports can be resolved with set-based
+INSERT ... SELECT joins instead of Python dictionaries. PostgreSQL loads them with COPY FROM STDIN,
+other backends with batched executemany INSERTs. Memory use is bounded by one batch either way.
+"""
+
+
+def distinct_from(connection, left, right):
+    """Null-safe `left <> right` SQL."""
+    return f"{left} {'IS DISTINCT FROM' if connection.vendor == 'postgresql' else 'IS NOT'} {right}"
+
+
+def _copy_value(value):
+    if value is None:
+        return '\\N'
+    return str(value).replace('\\', '\\\\').replace('\t', '\\t').replace('\n', '\\n').replace('\r', '\\r')
+
+
+class CopyStream:
+    """Read-only file-like object serializing rows to the COPY text format on demand."""
+
+    def __init__(self, rows):
+        self.rows = iter(rows)
+        self.buffer = ''
+
+    def read(self, size=-1):
+        while size < 0 or len(self.buffer) < size:
+            row = next(self.rows, None)
+            if row is None:
+                break
+            self.buffer += '\t'.join(_copy_value(value) for value in row) + '\n'
+
+        if size < 0:
+            size = len(self.buffer)
+        out, self.buffer = self.buffer[:size], self.buffer[size:]
+        return out
+
+    readline = read
+
+
+class StagingTable:
+    """
+    Temporary table `name` with `columns` [(column, sql_type)], dropped on exit.
+
+        with StagingTable('part_staging', [('uuid', 'integer'), ('name', 'text')]) as staging:
+            staging.load(rows)
+            cursor.execute(f"INSERT INTO ... SELECT ... FROM {staging.table}")
+    """
+
+    def __init__(self, name, columns, using='default', batch_size=5000):
+        self.connection = connections[using]
+        self.table = self.connection.ops.quote_name(name)
+        self.columns = columns
+        self.batch_size = batch_size
+
+    def __repr__(self):
+        return f"<StagingTable {self.table}: {', '.join(column for column, _ in self.columns)}>"
+
+    def __enter__(self):
+        columns = ', '.join(f"{self.connection.ops.quote_name(column)} {sql_type}" for column, sql_type in self.columns)
+        with self.connection.cursor() as cursor:
+            cursor.execute(f"DROP TABLE IF EXISTS {self.table}")
+            cursor.execute(f"CREATE TEMPORARY TABLE {self.table} ({columns})")
+        return self
+
+    def __exit__(self, *exc_info):
+        with self.connection.cursor() as cursor:
+            cursor.execute(f"DROP TABLE IF EXISTS {self.table}")
+
+    def load(self, rows):
+        """Stream `rows` (tuples in column order) into the table, return the number of rows loaded."""
+        columns = ', '.join(self.connection.ops.quote_name(column) for column, _ in self.columns)
+        counted = _Counter(rows)
+
+        with self.connection.cursor() as cursor:
+            if self.connection.vendor == 'postgresql':
+                cursor.copy_expert(f"COPY {self.table} ({columns}) FROM STDIN", CopyStream(counted))
+            else:
+                placeholders = ', '.join(['%s'] * len(self.columns))
+                sql = f"INSERT INTO {self.table} ({columns}) VALUES ({placeholders})"
+                rows = iter(counted)
+                for batch in iter(lambda: list(islice(rows, self.batch_size)), []):
+                    cursor.executemany(sql, batch)
+
+        return counted.count
+
+
+class _Counter:
+
+    def __init__(self, rows):
+        self.rows = rows
+        self.count = 0
+
+    def __iter__(self):
+        for row in self.rows:
+            self.count += 1
+            yield row
@@ -1,13 +1,14 @@
 
 
-from django.db import models
-from django.db.models import F, Value, Sum
+from django.db import models, transaction
+from django.db.models import F, Value
+from django.db.models.functions import Coalesce
 
 from core.models import TimestampModel
-from utils.core import group_by
-from utils.django import dictionary_annotation, has_annotation
+from utils.core import round_or_none
+from utils.django import has_annotation
 from modules.models import Module, ModulePart
-from parts.models import Part
+from parts.models import Part, StockMovement
 
 
 class ModuleDemand(TimestampModel):
@@ -26,22 +27,16 @@ class ModuleDemand(TimestampModel):
         return self.module.module_parts.annotate(missing_count=Value(self.count) * F('count') - F('part__stock')).filter(missing_count__gt=0)
 
     def set_completed(self, count=None):
-        module_parts = self.module_parts.all()
-
         count = count or self.count
-        parts_to_update = []
-
-        for module_part in module_parts:
-            part = module_part.part
-            part.stock -= module_part.count * count
-            parts_to_update.append(part)
+        part_deltas = {part_id: -part_count * count for part_id, part_count in self.module.module_parts.values_list('part_id', 'count')}
 
-        Part.bulk_update(parts_to_update)
-        self.completed_count += count
-        self.save()
+        with transaction.atomic():
+            StockMovement.record(part_deltas, kind='consumption', reference=repr(self))
+            self.completed_count += count
+            self.save()
 
     def min_price(self):
-        return self.module.min_price() * self.count()
+        return round_or_none((self.module.min_price or 0) * self.count, 2)
 
     @property
     def completed(self):
@@ -54,21 +49,7 @@ class ModuleDemand(TimestampModel):
     @classmethod
     def annotate_parts(cls, qs=None):
 
-        if qs and has_annotation(qs, 'total_demand'): return qs
-
-        module_parts = ModulePart.objects.select_related('module').exclude(module__demands=None)
-        module_parts = module_parts.annotate(total_demand=Sum('module__demands__count') * F('count'))
-        module_parts_by_uuid = group_by(module_parts, 'part.uuid')
-        uuid_demand_dict = {uuid: sum([module_part.total_demand for module_part in module_parts]) for uuid, module_parts in module_parts_by_uuid.items()}
-
-        # TODO case annotation will be slow for large parts querysets
-        parts = dictionary_annotation(
-            qs=qs or Part.objects.all(),
-            key_column_name='uuid',
-            new_column_name='total_demand',
-            field_type=models.IntegerField,
-            data_dict=uuid_demand_dict,
-            default=0
-        )
+        qs = Part.objects.all() if qs is None else qs
+        if has_annotation(qs, 'total_demand'): return qs
 
-        return parts
+        return qs.annotate(total_demand=Coalesce(F('availability__total_demand'), Value(0), output_field=models.BigIntegerField()))
@@ -26,8 +26,9 @@ class DeviceModuleInline(admin.TabularInline):
 @admin.register(Module)
 class ModuleAdmin(admin.ModelAdmin):
     list_display = 'name', 'min_price', 'current_price'
-    fields = 'name', 'created', 'modified',  # 'min_price', 'current_price'
-    readonly_fields = 'created', 'modified'  # , 'min_price', 'current_price'
+    list_select_related = 'rollup',
+    fields = 'name', 'created', 'modified', 'min_price', 'current_price'
+    readonly_fields = 'created', 'modified', 'min_price', 'current_price'
     list_editable = ()
 
     search_fields = 'name',
@@ -45,6 +46,8 @@ class DeviceModuleInlineAdmin(admin.TabularInline):
 
 @admin.register(Device)
 class DeviceAdmin(admin.ModelAdmin):
+    list_display = 'name', 'min_price', 'current_price'
+    list_select_related = 'rollup',
     fields = 'name',
     inlines = DeviceModuleInlineAdmin,
     search_fields = 'name',
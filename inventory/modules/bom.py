@@ -0,0 +1,118 @@
+
+
+import time
+
+from collections import defaultdict
+from threading import Lock
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from core.signals import bulk_changed
+from utils.django import bump_cache_generation, get_cache_generation
+
+from .models import DeviceModule, ModulePart
+
+
+"""
+Bill of materials
+
+Device -> Module -> Part structure loaded once per process into two sparse matrices
+(device x module and module x part). Part quantities for any mix of devices and modules
+are then a vector-matrix product instead of a walk over the ORM.
+
+The matrices are reloaded when module parts or device modules change (see `utils.django.get_cache_generation`
+for other workers) and every `MODULE_BOM_TTL` seconds.
+"""
+
+GENERATION_KEY = 'modules:bom:generation'
+
+
+class SparseMatrix:
+    """Row-major sparse matrix {row: {column: value}}, zeros are not stored."""
+
+    def __init__(self, triples=()):
+        self.rows = defaultdict(dict)
+        for row, column, value in triples:
+            if value:
+                self.rows[row][column] = self.rows[row].get(column, 0) + value
+
+    def __repr__(self):
+        return f"<SparseMatrix {len(self.rows)} rows, {self.nnz} values>"
+
+    @property
+    def nnz(self):
+        return sum(len(row) for row in self.rows.values())
+
+    def vecmul(self, vector):
+        """Return `vector @ self` for a sparse vector {row: value}."""
+        out = defaultdict(int)
+        for row, factor in vector.items():
+            if not factor:
+                continue
+            for column, value in self.rows.get(row, {}).items():
+                out[column] += factor * value
+        return dict(out)
+
+    def matmul(self, other):
+        """Return `self @ other` as a new SparseMatrix."""
+        out = SparseMatrix()
+        for row, vector in self.rows.items():
+            out.rows[row] = other.vecmul(vector)
+        return out
+
+
+class BillOfMaterials:
+
+    def __init__(self):
+        self.device_modules = SparseMatrix(DeviceModule.objects.values_list('device_id', 'module_id', 'count'))
+        self.module_parts = SparseMatrix(ModulePart.objects.values_list('module_id', 'part_id', 'count'))
+        self.device_parts = self.device_modules.matmul(self.module_parts)
+
+    def __repr__(self):
+        return f"<BillOfMaterials {len(self.device_modules.rows)} devices, {len(self.module_parts.rows)} modules>"
+
+    def module_counts(self, devices=None):
+        """Return {module_id: count} for {device_id: units}."""
+        return self.device_modules.vecmul(devices or {})
+
+    def part_counts(self, devices=None, modules=None):
+        """Return {part_id: count} needed for {device_id: units} and {module_id: units} combined."""
+        out = defaultdict(int)
+        for part_id, count in self.device_parts.vecmul(devices or {}).items():
+            out[part_id] += count
+        for part_id, count in self.module_parts.vecmul(modules or {}).items():
+            out[part_id] += count
+        return {part_id: count for part_id, count in out.items() if count}
+
+
+_bom = None
+_bom_generation = None
+_bom_expires = 0
+_bom_lock = Lock()
+
+
+def get_bom():
+    """Return the process-wide BillOfMaterials, reload it if the BOM changed since it was loaded or it expired."""
+    global _bom, _bom_generation, _bom_expires
+
+    generation = get_cache_generation(GENERATION_KEY)
+    with _bom_lock:
+        if _bom is None or _bom_generation != generation or time.monotonic() >= _bom_expires:
+            _bom, _bom_generation = BillOfMaterials(), generation
+            _bom_expires = time.monotonic() + settings.MODULE_BOM_TTL
+        return _bom
+
+
+def invalidate_bom():
+    """Drop the BillOfMaterials of all workers once the current transaction commits."""
+    transaction.on_commit(lambda: bump_cache_generation(GENERATION_KEY))
+
+
+@receiver([post_save, post_delete, bulk_changed], sender=ModulePart)
+@receiver([post_save, post_delete, bulk_changed], sender=DeviceModule)
+def _bom_changed(sender, raw=False, **kwargs):
+    if raw: return
+    invalidate_bom()
@@ -0,0 +1,59 @@
+# Generated by Django 3.2.9 on 2026-10-18 17:18
+
+from django.db import migrations, models
+from django.db.models import F, OuterRef, Subquery, Sum
+import django.db.models.deletion
+
+
+def populate_rollups(apps, schema_editor):
+    Module = apps.get_model('modules', 'Module')
+    Device = apps.get_model('modules', 'Device')
+    ModulePart = apps.get_model('modules', 'ModulePart')
+    DeviceModule = apps.get_model('modules', 'DeviceModule')
+    ModuleRollup = apps.get_model('modules', 'ModuleRollup')
+    DeviceRollup = apps.get_model('modules', 'DeviceRollup')
+
+    def price_rollup(Through, parent_field, price_field):
+        rows = Through.objects.filter(**{parent_field: OuterRef(parent_field)}).order_by().values(parent_field)
+        return Subquery(rows.annotate(total=Sum(F('count') * F(price_field))).values('total'))
+
+    ModuleRollup.objects.bulk_create([ModuleRollup(module_id=pk) for pk in Module.objects.values_list('id', flat=True)])
+    DeviceRollup.objects.bulk_create([DeviceRollup(device_id=pk) for pk in Device.objects.values_list('id', flat=True)])
+
+    ModuleRollup.objects.update(
+        min_price=price_rollup(ModulePart, 'module_id', 'part__min_price'),
+        current_price=price_rollup(ModulePart, 'module_id', 'part__current_price'),
+    )
+    DeviceRollup.objects.update(
+        min_price=price_rollup(DeviceModule, 'device_id', 'module__rollup__min_price'),
+        current_price=price_rollup(DeviceModule, 'device_id', 'module__rollup__current_price'),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('modules', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ModuleRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('min_price', models.FloatField(null=True)),
+                ('current_price', models.FloatField(null=True)),
+                ('module', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='rollup', to='modules.module')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='DeviceRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('min_price', models.FloatField(null=True)),
+                ('current_price', models.FloatField(null=True)),
+                ('device', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='rollup', to='modules.device')),
+            ],
+        ),
+        migrations.RunPython(populate_rollups, migrations.RunPython.noop),
+    ]
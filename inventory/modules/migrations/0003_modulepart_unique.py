@@ -0,0 +1,30 @@
+# Generated by Django 3.2.9 on 2026-10-18 17:23
+
+from django.db import migrations
+from django.db.models import Count, Min, Sum
+
+
+def merge_duplicate_lines(apps, schema_editor):
+    ModulePart = apps.get_model('modules', 'ModulePart')
+
+    duplicates = ModulePart.objects.order_by().values('module_id', 'part_id').annotate(lines=Count('id'), keep_id=Min('id'), total=Sum('count')).filter(lines__gt=1)
+    for duplicate in duplicates:
+        lines = ModulePart.objects.filter(module_id=duplicate['module_id'], part_id=duplicate['part_id'])
+        lines.exclude(id=duplicate['keep_id']).delete()
+        lines.update(count=duplicate['total'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('parts', '0003_stock_journal'),
+        ('modules', '0002_rollups'),
+    ]
+
+    operations = [
+        migrations.RunPython(merge_duplicate_lines, migrations.RunPython.noop),
+        migrations.AlterUniqueTogether(
+            name='modulepart',
+            unique_together={('module', 'part')},
+        ),
+    ]
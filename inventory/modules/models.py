@@ -1,15 +1,23 @@
 
 
-from collections import defaultdict
+from django.db import models, transaction
+from django.db.models import F, OuterRef, Subquery, Sum
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
 
-from django.db import models
-from django.db.models import Sum, F
-from core.models import TimestampModel
+from core.models import BulkChangedManager, TimestampModel
+from core.signals import bulk_changed
 from utils.core import round_or_none
 from utils.django import dictionary_annotation
 from parts.models import Part
 
 
+def price_rollup(Through, parent_field, price_field):
+    """Correlated subquery of Sum(count * price_field) over the `Through` rows of the outer rollup's parent."""
+    rows = Through.objects.filter(**{parent_field: OuterRef(parent_field)}).order_by().values(parent_field)
+    return Subquery(rows.annotate(total=Sum(F('count') * F(price_field))).values('total'))
+
+
 class Module(TimestampModel):
 
     name = models.CharField(max_length=256, unique=True)
@@ -30,11 +38,13 @@ class Module(TimestampModel):
 
     @property
     def min_price(self):
-        return round_or_none(self.price('min_price'), 2)
+        rollup = getattr(self, 'rollup', None)  # missing after raw saves (loaddata)
+        return round_or_none(rollup.min_price if rollup else self.price('min_price'), 2)
 
     @property
     def current_price(self):
-        return round_or_none(self.price('current_price'), 2)
+        rollup = getattr(self, 'rollup', None)
+        return round_or_none(rollup.current_price if rollup else self.price('current_price'), 2)
 
 
 class ModulePart(models.Model):
@@ -43,8 +53,11 @@ class ModulePart(models.Model):
     part = models.ForeignKey(Part, on_delete=models.CASCADE, related_name='module_parts')
     count = models.IntegerField(default=1)
 
+    objects = BulkChangedManager()
+
     class Meta:
         ordering = 'module__name', 'part__name'
+        unique_together = 'module', 'part'
 
     def __repr__(self):
         return f"<ModulePart {self.id}: {self.module.name} - {self.part.name} x {self.count}>"
@@ -70,6 +83,8 @@ class Device(models.Model):
     name = models.CharField(max_length=256)
     modules = models.ManyToManyField(Module, through='DeviceModule', related_name='devices')
 
+    objects = BulkChangedManager()
+
     class Meta:
         ordering = 'name',
 
@@ -79,13 +94,23 @@ class Device(models.Model):
     def __str__(self):
         return self.name
 
-    def part_id_counts(self):
-        part_id_count_dict = defaultdict(int)
+    def price(self, price_field):
+        price_field = f"module__module_parts__part__{price_field}"
+        total = Sum(F('count') * F('module__module_parts__count') * F(price_field))
+        return DeviceModule.objects.filter(device=self).aggregate(total=total)['total']
+
+    @property
+    def min_price(self):
+        rollup = getattr(self, 'rollup', None)  # missing after raw saves (loaddata)
+        return round_or_none(rollup.min_price if rollup else self.price('min_price'), 2)
 
-        for module_part in ModulePart.objects.filter(module__id__in=self.modules.values_list('id', flat=True)):
-            part_id_count_dict[module_part.part_id] += module_part.count
+    @property
+    def current_price(self):
+        rollup = getattr(self, 'rollup', None)
+        return round_or_none(rollup.current_price if rollup else self.price('current_price'), 2)
 
-        return part_id_count_dict
+    def part_id_counts(self, count=1):
+        return get_bom().part_counts(devices={self.id: count})
 
     def parts(self):
         return dictionary_annotation(
@@ -104,6 +129,8 @@ class DeviceModule(models.Model):
     device = models.ForeignKey(Device, on_delete=models.CASCADE, related_name='device_modules')
     count = models.IntegerField(default=1)
 
+    objects = BulkChangedManager()
+
     class Meta:
         unique_together = 'module', 'device'
 
@@ -116,3 +143,124 @@ class DeviceModule(models.Model):
     @property
     def device_name(self):
         return self.device.name
+
+
+class ModuleRollup(models.Model):
+    """Stored Sum(count * part price) of a module, kept up to date by the signal handlers below."""
+
+    module = models.OneToOneField(Module, on_delete=models.CASCADE, related_name='rollup')
+    min_price = models.FloatField(null=True)
+    current_price = models.FloatField(null=True)
+
+    objects = BulkChangedManager()
+
+    def __repr__(self):
+        return f"<ModuleRollup {self.module_id}: {self.min_price} / {self.current_price}>"
+
+    def __str__(self):
+        return self.__repr__()
+
+    @classmethod
+    def refresh(cls, module_ids=None):
+        """Recompute rollups of `module_ids` (ids or an id queryset, all if None) and of the devices using them."""
+        rows = cls.objects.all() if module_ids is None else cls.objects.filter(module_id__in=module_ids)
+
+        with transaction.atomic():
+            rows.update(
+                min_price=price_rollup(ModulePart, 'module_id', 'part__min_price'),
+                current_price=price_rollup(ModulePart, 'module_id', 'part__current_price'),
+            )
+            device_ids = None if module_ids is None else DeviceModule.objects.filter(module_id__in=module_ids).values('device_id')
+            DeviceRollup.refresh(device_ids)
+
+    @classmethod
+    def create_missing(cls):
+        """Create and compute the rollups of modules without one (i.e. after `bulk_create`)."""
+        module_ids = list(Module.objects.filter(rollup=None).values_list('id', flat=True))
+        if module_ids:
+            cls.objects.bulk_create([cls(module_id=pk) for pk in module_ids])
+            cls.refresh(module_ids)
+
+    @classmethod
+    def rebuild(cls):
+        """Create the module and device rollups missing and recompute all of them."""
+        with transaction.atomic():
+            cls.objects.bulk_create([cls(module_id=pk) for pk in Module.objects.filter(rollup=None).values_list('id', flat=True)])
+            DeviceRollup.objects.bulk_create([DeviceRollup(device_id=pk) for pk in Device.objects.filter(rollup=None).values_list('id', flat=True)])
+            cls.refresh()
+
+
+class DeviceRollup(models.Model):
+    """Stored Sum(count * module price) of a device, computed from the module rollups."""
+
+    device = models.OneToOneField(Device, on_delete=models.CASCADE, related_name='rollup')
+    min_price = models.FloatField(null=True)
+    current_price = models.FloatField(null=True)
+
+    objects = BulkChangedManager()
+
+    def __repr__(self):
+        return f"<DeviceRollup {self.device_id}: {self.min_price} / {self.current_price}>"
+
+    def __str__(self):
+        return self.__repr__()
+
+    @classmethod
+    def refresh(cls, device_ids=None):
+        rows = cls.objects.all() if device_ids is None else cls.objects.filter(device_id__in=device_ids)
+        rows.update(
+            min_price=price_rollup(DeviceModule, 'device_id', 'module__rollup__min_price'),
+            current_price=price_rollup(DeviceModule, 'device_id', 'module__rollup__current_price'),
+        )
+
+    @classmethod
+    def create_missing(cls):
+        """Create and compute the rollups of devices without one (i.e. after `bulk_create`)."""
+        device_ids = list(Device.objects.filter(rollup=None).values_list('id', flat=True))
+        if device_ids:
+            cls.objects.bulk_create([cls(device_id=pk) for pk in device_ids])
+            cls.refresh(device_ids)
+
+
+@receiver(post_save, sender=Module)
+def _module_saved(sender, instance, created, raw=False, **kwargs):
+    if raw or not created: return
+    ModuleRollup.objects.create(module=instance)
+
+
+@receiver(post_save, sender=Device)
+def _device_saved(sender, instance, created, raw=False, **kwargs):
+    if raw or not created: return
+    DeviceRollup.objects.create(device=instance)
+
+
+@receiver(bulk_changed, sender=Module)
+def _modules_bulk_changed(sender, **kwargs):
+    ModuleRollup.create_missing()
+
+
+@receiver(bulk_changed, sender=Device)
+def _devices_bulk_changed(sender, **kwargs):
+    DeviceRollup.create_missing()
+
+
+@receiver([post_save, post_delete], sender=ModulePart)
+def _module_part_changed(sender, instance, raw=False, **kwargs):
+    if raw: return
+    ModuleRollup.refresh([instance.module_id])
+
+
+@receiver([post_save, post_delete], sender=DeviceModule)
+def _device_module_changed(sender, instance, raw=False, **kwargs):
+    if raw: return
+    DeviceRollup.refresh([instance.device_id])
+
+
+@receiver(post_save, sender=Part)
+def _part_prices_changed(sender, instance, raw=False, update_fields=None, **kwargs):
+    if raw or (update_fields and not {'min_price', 'current_price'} & set(update_fields)): return
+    ModuleRollup.refresh(ModulePart.objects.filter(part_id=instance.id).values('module_id'))
+
+
+# connect the BOM cache invalidation signals
+from .bom import get_bom
@@ -0,0 +1,55 @@
+
+import graphene
+
+from django.db.models import F, Value
+from django.db.models.functions import Greatest
+
+from .models import Module, ModulePart
+from api.fields import NestedField
+from api.filters import CursorPaginationFilter, DjangoFilter, PaginationFilter
+from api.registry import register_type
+from parts.schema import PartType
+
+
+@register_type('ModulePart')
+class ModulePartType:
+    class Meta:
+        model = ModulePart
+        fields = ['id', 'count']
+        related_fields = {
+            NestedField('part', PartType),
+        }
+        lookups = {
+            'id': graphene.ID(),
+            'module': graphene.ID(),
+            'part': graphene.ID(),
+        }
+        filters = {
+            'django': DjangoFilter,
+            'pagination': PaginationFilter,
+            'cursor': CursorPaginationFilter,
+        }
+        group_by = ['module', 'module__name', 'part', 'part__category']
+        aggregate_fields = {
+            'count': F('count'),
+            'missing': Greatest(F('count') - F('part__stock'), Value(0)),  # pieces short of building the module once
+        }
+
+
+@register_type('Module')
+class ModuleType:
+    class Meta:
+        model = Module
+        fields = ['id', 'name']
+        related_fields = {
+            NestedField('module_parts', ModulePartType),
+        }
+        lookups = {
+            'id': graphene.ID(),
+            'name': graphene.String(),
+        }
+        filters = {
+            'django': DjangoFilter,
+            'pagination': PaginationFilter,
+            'cursor': CursorPaginationFilter,
+        }
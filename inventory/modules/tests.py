@@ -0,0 +1,121 @@
+from django.test import TestCase, override_settings
+
+from parts.models import Part
+
+from . import bom
+from .bom import get_bom
+from .models import Device, DeviceModule, DeviceRollup, Module, ModulePart, ModuleRollup
+
+
+class PriceRollupTest(TestCase):
+
+    def setUp(self):
+        self.resistor = Part.objects.create(uuid=1, name='10k / 0603', category='resistors', min_price=1, current_price=2)
+        self.condenser = Part.objects.create(uuid=2, name='100n / 0603', category='condensers', min_price=3, current_price=5)
+        self.module = Module.objects.create(name='module')
+        self.device = Device.objects.create(name='device')
+        ModulePart.objects.create(module=self.module, part=self.resistor, count=4)
+        ModulePart.objects.create(module=self.module, part=self.condenser, count=2)
+        DeviceModule.objects.create(device=self.device, module=self.module, count=3)
+
+    def assertRollups(self, module_prices, device_prices):
+        rollup = ModuleRollup.objects.get(module=self.module)
+        self.assertEqual((rollup.min_price, rollup.current_price), module_prices)
+        rollup = DeviceRollup.objects.get(device=self.device)
+        self.assertEqual((rollup.min_price, rollup.current_price), device_prices)
+
+    def test_module_parts(self):
+        self.assertRollups((10, 18), (30, 54))
+
+        ModulePart.objects.filter(part=self.condenser).get().delete()
+        self.assertRollups((4, 8), (12, 24))
+
+    def test_part_prices(self):
+        self.resistor.current_price = 3
+        self.resistor.save(update_fields=['current_price'])
+        self.assertRollups((10, 22), (30, 66))
+
+        self.resistor.name = '10k / 0805'
+        self.resistor.save(update_fields=['name'])
+        self.assertRollups((10, 22), (30, 66))
+
+    def test_device_modules(self):
+        device_module = DeviceModule.objects.get(device=self.device)
+        device_module.count = 1
+        device_module.save()
+        self.assertRollups((10, 18), (10, 18))
+
+        device_module.delete()
+        self.assertRollups((10, 18), (None, None))
+
+    def test_bulk_create(self):
+        module, = Module.objects.bulk_create([Module(name='bulk module')])
+        device, = Device.objects.bulk_create([Device(name='bulk device')])
+        self.assertTrue(ModuleRollup.objects.filter(module__name='bulk module').exists())
+        self.assertTrue(DeviceRollup.objects.filter(device__name='bulk device').exists())
+        self.assertIsNone(Module.objects.get(name='bulk module').min_price)
+        self.assertIsNone(Device.objects.get(name='bulk device').min_price)
+
+    def test_missing_rollup(self):
+        ModuleRollup.objects.all().delete()
+        DeviceRollup.objects.all().delete()  # as after loaddata, whose raw saves don't create them
+
+        module = Module.objects.select_related('rollup').get(id=self.module.id)
+        self.assertEqual((module.min_price, module.current_price), (10, 18))
+        device = Device.objects.get(id=self.device.id)
+        self.assertEqual((device.min_price, device.current_price), (30, 54))
+
+    def test_rebuild(self):
+        ModuleRollup.objects.all().delete()
+        DeviceRollup.objects.update(min_price=None, current_price=None)
+
+        ModuleRollup.rebuild()
+        self.assertEqual(ModuleRollup.objects.count(), 1)
+        self.assertRollups((10, 18), (30, 54))
+
+
+class BillOfMaterialsTest(TestCase):
+
+    def setUp(self):
+        bom._bom = None
+        self.resistor = Part.objects.create(uuid=1, name='10k / 0603', category='resistors')
+        self.condenser = Part.objects.create(uuid=2, name='100n / 0603', category='condensers')
+        self.module = Module.objects.create(name='module')
+        self.device = Device.objects.create(name='device')
+        ModulePart.objects.create(module=self.module, part=self.resistor, count=4)
+        DeviceModule.objects.create(device=self.device, module=self.module, count=3)
+
+    def test_part_counts(self):
+        self.assertEqual(get_bom().part_counts(modules={self.module.id: 2}), {self.resistor.id: 8})
+        self.assertEqual(get_bom().part_counts(devices={self.device.id: 1}, modules={self.module.id: 1}), {self.resistor.id: 16})
+        self.assertEqual(self.device.part_id_counts(2), {self.resistor.id: 24})
+
+    def test_reloaded_after_the_commit(self):
+        get_bom()
+        with self.captureOnCommitCallbacks(execute=True) as callbacks:
+            ModulePart.objects.create(module=self.module, part=self.condenser, count=1)
+            self.assertEqual(get_bom().part_counts(modules={self.module.id: 1}), {self.resistor.id: 4})
+        self.assertTrue(callbacks)
+        self.assertEqual(get_bom().part_counts(modules={self.module.id: 1}), {self.resistor.id: 4, self.condenser.id: 1})
+
+    def test_bulk_writes(self):
+        get_bom()
+        with self.captureOnCommitCallbacks(execute=True):
+            DeviceModule.objects.filter(device=self.device).update(count=1)
+        self.assertEqual(get_bom().part_counts(devices={self.device.id: 1}), {self.resistor.id: 4})
+
+        with self.captureOnCommitCallbacks(execute=True):
+            ModulePart.objects.bulk_create([ModulePart(module=self.module, part=self.condenser, count=2)])
+        self.assertEqual(get_bom().part_counts(devices={self.device.id: 1}), {self.resistor.id: 4, self.condenser.id: 2})
+
+    @override_settings(MODULE_BOM_TTL=3600)
+    def test_kept_until_a_bump(self):
+        get_bom()
+        ModulePart.objects.filter(module=self.module).update(count=1)  # a write whose bump this worker doesn't see
+        self.assertEqual(get_bom().part_counts(modules={self.module.id: 1}), {self.resistor.id: 4})
+
+    @override_settings(MODULE_BOM_TTL=0)
+    def test_expires_without_a_bump(self):
+        get_bom()
+        ModulePart.objects.filter(module=self.module).update(count=1)
+        self.assertEqual(get_bom().part_counts(modules={self.module.id: 1}), {self.resistor.id: 1})
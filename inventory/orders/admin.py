@@ -6,7 +6,7 @@ from django.core.exceptions import ValidationError
 from .models import Order, OrderPart
 from utils.django import names_enum, DefaultFilter
 from modules.models import Device, Module
-from parts.models import Part
+from parts.availability import availability_snapshot
 
 
 class OrderPartStatusFilter(DefaultFilter):
@@ -18,28 +18,15 @@ class OrderPartStatusFilter(DefaultFilter):
     other_lookups = 'order__ordered', 'order__delivered'
 
 
-@admin.register(OrderPart)
-class OrderPartAdmin(admin.ModelAdmin):
-
-    model = OrderPart
-    fields = 'part', 'count', 'price', 'stock', 'demand', 'ordered', 'missing', 'supplier'
-    list_display = 'part', 'count', 'price', 'stock', 'demand', 'ordered', 'missing', 'supplier'
-    autocomplete_fields = 'part',
-    readonly_fields = 'stock', 'demand', 'ordered', 'missing'
-    ordering = 'part__name',
-
-    list_filter = OrderPartStatusFilter,
-
-    def get_queryset(self, request):
-        qs = super().get_queryset(request)
-        self.part_values_dict = {item['id']: item for item in Part.annotate_missing().values('id', 'total_demand', 'total_ordered', 'missing')}
-        return qs
+class PartAvailabilityMixin:
+    """Readonly availability columns read from the shared snapshot, warmed with the part ids on the page."""
 
     def _get_value(self, order_part, field):
-        return self.part_values_dict[order_part.part.id][field]
+        if order_part.part_id is None: return None
+        return availability_snapshot.get_part(order_part.part_id)[field]
 
     def stock(self, order_part):
-        return order_part.part.stock
+        return self._get_value(order_part, 'stock')
 
     def demand(self, order_part):
         return self._get_value(order_part, 'total_demand')
@@ -51,34 +38,41 @@ class OrderPartAdmin(admin.ModelAdmin):
         return self._get_value(order_part, 'missing')
 
 
-class OrderPartInlineAdmin(admin.TabularInline):
+@admin.register(OrderPart)
+class OrderPartAdmin(PartAvailabilityMixin, admin.ModelAdmin):
 
     model = OrderPart
-    extra = 1
     fields = 'part', 'count', 'price', 'stock', 'demand', 'ordered', 'missing', 'supplier'
+    list_display = 'part', 'count', 'price', 'stock', 'demand', 'ordered', 'missing', 'supplier'
     autocomplete_fields = 'part',
     readonly_fields = 'stock', 'demand', 'ordered', 'missing'
     ordering = 'part__name',
+    list_select_related = 'part', 'supplier'
 
-    def get_queryset(self, request):
-        qs = super().get_queryset(request)
-        self.part_values_dict = {item['id']: item for item in Part.annotate_missing().values('id', 'total_demand', 'total_ordered', 'missing')}
-        return qs
+    list_filter = OrderPartStatusFilter,
 
-    def _get_value(self, order_part, field):
-        return self.part_values_dict[order_part.part.id][field]
+    def get_changelist_instance(self, request):
+        changelist = super().get_changelist_instance(request)
+        availability_snapshot.get(order_part.part_id for order_part in changelist.result_list)
+        return changelist
 
-    def stock(self, order_part):
-        return order_part.part.stock
 
-    def demand(self, order_part):
-        return self._get_value(order_part, 'total_demand')
+class OrderPartInlineAdmin(PartAvailabilityMixin, admin.TabularInline):
 
-    def ordered(self, order_part):
-        return self._get_value(order_part, 'total_ordered')
+    model = OrderPart
+    extra = 1
+    fields = 'part', 'count', 'price', 'stock', 'demand', 'ordered', 'missing', 'supplier'
+    autocomplete_fields = 'part',
+    readonly_fields = 'stock', 'demand', 'ordered', 'missing'
+    ordering = 'part__name',
 
-    def missing(self, order_part):
-        return self._get_value(order_part, 'missing')
+    def get_queryset(self, request):
+        return super().get_queryset(request).select_related('part')
+
+    def get_formset(self, request, obj=None, **kwargs):
+        if obj is not None:
+            availability_snapshot.get(obj.order_parts.values_list('part_id', flat=True))
+        return super().get_formset(request, obj, **kwargs)
 
 
 class OrderForm(forms.ModelForm):
@@ -133,6 +127,7 @@ class OrderStatusFilter(DefaultFilter):
 @admin.register(Order)
 class OrderAdmin(admin.ModelAdmin):
     list_display = '__str__', 'pk', 'status', 'part_count', 'price', 'created', 'modified'
+    list_select_related = 'rollup',
 
     fieldsets = (
         ("", {"fields": (
@@ -162,7 +157,7 @@ class OrderAdmin(admin.ModelAdmin):
     save_as = True
 
     def part_count(self, order):
-        return int(order.parts.count())
+        return order.part_count
 
     def price(self, order):
         price = order.price()
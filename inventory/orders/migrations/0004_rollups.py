@@ -0,0 +1,40 @@
+# Generated by Django 3.2.9 on 2026-10-18 17:18
+
+from django.db import migrations, models
+from django.db.models import Count, F, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
+import django.db.models.deletion
+
+
+def populate_rollups(apps, schema_editor):
+    Order = apps.get_model('orders', 'Order')
+    OrderPart = apps.get_model('orders', 'OrderPart')
+    OrderRollup = apps.get_model('orders', 'OrderRollup')
+
+    OrderRollup.objects.bulk_create([OrderRollup(order_id=pk) for pk in Order.objects.values_list('id', flat=True)])
+
+    lines = OrderPart.objects.filter(order_id=OuterRef('order_id')).order_by().values('order_id')
+    OrderRollup.objects.update(
+        total_price=Subquery(lines.annotate(total=Sum(F('price') * F('count'))).values('total')),
+        line_count=Coalesce(Subquery(lines.annotate(total=Count('id')).values('total')), Value(0)),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('orders', '0003_remove_order_delivered'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='OrderRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('total_price', models.FloatField(null=True)),
+                ('line_count', models.IntegerField(default=0)),
+                ('order', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='rollup', to='orders.order')),
+            ],
+        ),
+        migrations.RunPython(populate_rollups, migrations.RunPython.noop),
+    ]
@@ -1,15 +1,20 @@
 
 import hashlib
 
-from django.db import models
-from django.db.models import F, Sum
-
-from core.models import TimestampModel
-from utils.core import group_by
-from utils.django import dictionary_annotation, has_annotation, names_enum, annotate_related_aggregate
+from django.db import models, transaction
+from django.db.models import Count, F, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from django.utils import timezone
+
+from core.models import BulkChangedManager, TimestampModel
+from core.signals import bulk_changed
+from utils.core import round_or_none
+from utils.django import has_annotation, names_enum, annotate_related_aggregate
 from demands.models import ModuleDemand
-from modules.models import ModulePart, Device
-from parts.models import Part
+from modules.bom import get_bom
+from parts.models import Part, PartAvailability, StockMovement
 from suppliers.models import Supplier
 
 
@@ -38,21 +43,30 @@ class Order(TimestampModel):
         return super().save(*args, **kwargs)
 
     def price(self):
-        order_parts = OrderPart.objects.filter(order_id=self.id).annotate(total_price=F('price') * F('count'))
-        price = order_parts.aggregate(Sum('total_price'))['total_price__sum']
-        return round(float(price), 2) if price else None
-
-    def set_delivered(self, model_part_dict=None):
-
-        parts_to_update = []
-        order_parts = OrderPart.objects.filter(order=self)
-
-        for order_part in order_parts:
-            part = order_part.part
-            part.stock += order_part.count
-
-        Part.bulk_update(parts_to_update)
-        self.status = 'delivered'
+        rollup = getattr(self, 'rollup', None)  # missing after raw saves (loaddata)
+        if rollup:
+            return round_or_none(rollup.total_price, 2)
+        return round_or_none(self.order_parts.aggregate(total=Sum(F('price') * F('count')))['total'], 2)
+
+    @property
+    def part_count(self):
+        rollup = getattr(self, 'rollup', None)
+        return rollup.line_count if rollup else self.order_parts.count()
+
+    def set_delivered(self):
+        """
+        Receive the ordered parts into stock and mark the order delivered, return False if it already was.
+
+        The status changes by a conditional UPDATE in the same transaction as the receipt, a concurrent or repeated call
+        waits for the row and then finds the order delivered, so the parts are received once.
+        """
+        with transaction.atomic():
+            delivered = Order.objects.filter(id=self.id).exclude(status='delivered').update(status='delivered', modified=timezone.now())
+            self.status = 'delivered'
+            if not delivered:
+                return False
+            StockMovement.record(self.order_parts.values_list('part_id', 'count'), kind='receipt', reference=repr(self))
+            return True
 
     def bulk_add_parts(self, part_ids, counts, count_multiplier=1):
 
@@ -66,6 +80,8 @@ class Order(TimestampModel):
             ))
 
         OrderPart.objects.bulk_create(to_create)
+        PartAvailability.refresh(part_ids)
+        OrderRollup.refresh([self.id])
 
     def populate_parts(self, module_id=None, device_id=None, part_ids=None, multiplier=1):
 
@@ -73,42 +89,28 @@ class Order(TimestampModel):
             raise ValueError("`populate_parts` received more than one source argument.")
 
         if module_id:
-            part_ids, counts = zip(*ModulePart.objects.filter(module_id=module_id).values_list('part_id', 'count').exclude(module__demands=None))
-            count_multiplier = multiplier
+            part_counts = get_bom().part_counts(modules={int(module_id): multiplier})
 
         elif device_id:
-            part_ids, counts = zip(*Device.objects.get(id=device_id).part_id_counts().items())
-            count_multiplier = multiplier
+            part_counts = get_bom().part_counts(devices={int(device_id): multiplier})
 
         elif part_ids:
-            counts = [1] * len(part_ids)
+            part_counts = {part_id: multiplier for part_id in part_ids}
 
         else:
-            part_ids, counts = zip(*ModuleDemand.parts().exclude(total_demand__isnull=True).values_list('id', 'total_demand'))
-            count_multiplier = multiplier
+            module_counts = ModuleDemand.objects.order_by().values('module_id').annotate(total=Sum('count')).values_list('module_id', 'total')
+            part_counts = get_bom().part_counts(modules={module_id: total * multiplier for module_id, total in module_counts})
 
-        self.bulk_add_parts(part_ids, counts, count_multiplier)
+        if part_counts:
+            self.bulk_add_parts(*zip(*part_counts.items()))
 
     @classmethod
     def annotate_parts(cls, qs=None):
 
-        if qs and has_annotation(qs, 'total_ordered'): return qs
-
-        order_parts_by_uuid = group_by(OrderPart.objects.annotate(part_uuid=F('part__uuid')), 'part_uuid')
-        # TODO next line should be optimized with Aggregate / SQL `GROUP BY`
-        uuid_ordered_dict = {uuid: sum([order_part.count for order_part in order_parts]) for uuid, order_parts in order_parts_by_uuid.items()}
-
-        # TODO case annotation will be slow for large parts querysets
-        parts = dictionary_annotation(
-            qs=qs or Part.objects.all(),
-            key_column_name='uuid',
-            new_column_name='total_ordered',
-            field_type=models.IntegerField,
-            data_dict=uuid_ordered_dict,
-            default=0
-        )
+        qs = Part.objects.all() if qs is None else qs
+        if has_annotation(qs, 'total_ordered'): return qs
 
-        return parts
+        return qs.annotate(total_ordered=Coalesce(F('availability__total_ordered'), Value(0), output_field=models.BigIntegerField()))
 
 
 class OrderPart(models.Model):
@@ -119,6 +121,8 @@ class OrderPart(models.Model):
     supplier = models.ForeignKey(Supplier, null=True, blank=True, on_delete=models.SET_NULL)
     price = models.FloatField(null=True, blank=True)
 
+    objects = BulkChangedManager()
+
     class Meta:
         unique_together = 'order', 'part'
 
@@ -130,7 +134,8 @@ class OrderPart(models.Model):
 
     @classmethod
     def annotate_parts(cls, qs=None):
-        if qs and has_annotation(qs, 'avg_price'): return qs
+        qs = Part.objects.all() if qs is None else qs
+        if has_annotation(qs, 'avg_price'): return qs
         return annotate_related_aggregate(
             qs,
             field='avg_price',
@@ -139,3 +144,61 @@ class OrderPart(models.Model):
             RelatedModel=OrderPart,
             function='Avg'
         )
+
+
+class OrderRollup(models.Model):
+    """Stored total price and line count of an order, kept up to date by the signal handlers below."""
+
+    order = models.OneToOneField(Order, on_delete=models.CASCADE, related_name='rollup')
+    total_price = models.FloatField(null=True)
+    line_count = models.IntegerField(default=0)
+
+    objects = BulkChangedManager()
+
+    def __repr__(self):
+        return f"<OrderRollup {self.order_id}: {self.line_count} lines, {self.total_price}>"
+
+    def __str__(self):
+        return self.__repr__()
+
+    @classmethod
+    def refresh(cls, order_ids=None):
+        """Recompute rollups of `order_ids` (ids or an id queryset, all if None)."""
+        lines = OrderPart.objects.filter(order_id=OuterRef('order_id')).order_by().values('order_id')
+        rows = cls.objects.all() if order_ids is None else cls.objects.filter(order_id__in=order_ids)
+        rows.update(
+            total_price=Subquery(lines.annotate(total=Sum(F('price') * F('count'))).values('total')),
+            line_count=Coalesce(Subquery(lines.annotate(total=Count('id')).values('total')), Value(0)),
+        )
+
+    @classmethod
+    def create_missing(cls):
+        """Create and compute the rollups of orders without one (i.e. after `bulk_create`)."""
+        order_ids = list(Order.objects.filter(rollup=None).values_list('id', flat=True))
+        if order_ids:
+            cls.objects.bulk_create([cls(order_id=pk) for pk in order_ids])
+            cls.refresh(order_ids)
+
+    @classmethod
+    def rebuild(cls):
+        """Create the rollups missing and recompute all of them."""
+        with transaction.atomic():
+            cls.objects.bulk_create([cls(order_id=pk) for pk in Order.objects.filter(rollup=None).values_list('id', flat=True)])
+            cls.refresh()
+
+
+@receiver(post_save, sender=Order)
+def _order_saved(sender, instance, created, raw=False, **kwargs):
+    if raw or not created: return
+    OrderRollup.objects.create(order=instance)
+
+
+@receiver(bulk_changed, sender=Order)
+def _orders_bulk_changed(sender, **kwargs):
+    OrderRollup.create_missing()
+
+
+@receiver([post_save, post_delete], sender=OrderPart)
+def _order_part_changed(sender, instance, raw=False, **kwargs):
+    if raw: return
+    OrderRollup.refresh([instance.order_id])
@@ -0,0 +1,59 @@
+
+import graphene
+
+from django.db.models import ExpressionWrapper, F, FloatField
+
+from .models import Order, OrderPart
+from api.fields import NestedField
+from api.filters import CursorPaginationFilter, DjangoFilter, PaginationFilter
+from api.registry import register_type
+from parts.schema import PartType
+from suppliers.schema import SupplierType
+
+
+@register_type('OrderPart')
+class OrderPartType:
+    class Meta:
+        model = OrderPart
+        fields = ['id', 'count', 'price']
+        related_fields = {
+            NestedField('part', PartType),
+            NestedField('supplier', SupplierType),
+        }
+        lookups = {
+            'id': graphene.ID(),
+            'order': graphene.ID(),
+            'part': graphene.ID(),
+            'supplier': graphene.ID(),
+        }
+        filters = {
+            'django': DjangoFilter,
+            'pagination': PaginationFilter,
+            'cursor': CursorPaginationFilter,
+        }
+        group_by = ['order', 'order__name', 'order__status', 'part', 'part__category', 'supplier', 'supplier__name']
+        aggregate_fields = {
+            'count': F('count'),
+            'price': F('price'),
+            'spend': ExpressionWrapper(F('count') * F('price'), output_field=FloatField()),
+        }
+
+
+@register_type('Order')
+class OrderType:
+    class Meta:
+        model = Order
+        fields = ['id', 'name', 'status']
+        related_fields = {
+            NestedField('order_parts', OrderPartType),
+        }
+        lookups = {
+            'id': graphene.ID(),
+            'name': graphene.String(),
+            'status': graphene.String(),
+        }
+        filters = {
+            'django': DjangoFilter,
+            'pagination': PaginationFilter,
+            'cursor': CursorPaginationFilter,
+        }
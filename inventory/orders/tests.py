@@ -0,0 +1,75 @@
+from django.test import TestCase
+
+from parts.models import Part, PartAvailability, StockMovement
+
+from .models import Order, OrderPart, OrderRollup
+
+
+class SetDeliveredTest(TestCase):
+
+    def setUp(self):
+        self.resistor = Part.objects.create(uuid=1, name='10k / 0603', category='resistors', stock=5)
+        self.condenser = Part.objects.create(uuid=2, name='100n / 0603', category='condensers')
+        self.order = Order.objects.create()
+        OrderPart.objects.create(order=self.order, part=self.resistor, count=10)
+        OrderPart.objects.create(order=self.order, part=self.condenser, count=3)
+
+    def test_receives_the_ordered_parts(self):
+        self.assertTrue(self.order.set_delivered())
+
+        self.assertEqual(Order.objects.get(id=self.order.id).status, 'delivered')
+        self.assertEqual(dict(Part.objects.values_list('id', 'stock')), {self.resistor.id: 15, self.condenser.id: 3})
+        self.assertEqual(StockMovement.objects.filter(kind='receipt').count(), 2)
+        self.assertEqual(PartAvailability.objects.get(part=self.resistor).stock, 15)
+
+    def test_delivering_twice_receives_once(self):
+        self.order.set_delivered()
+        self.assertFalse(self.order.set_delivered())
+        self.assertFalse(Order.objects.get(id=self.order.id).set_delivered())  # a stale instance of the same order
+
+        self.assertEqual(Part.objects.get(id=self.resistor.id).stock, 15)
+        self.assertEqual(StockMovement.objects.filter(kind='receipt').count(), 2)
+
+
+class OrderRollupTest(TestCase):
+
+    def setUp(self):
+        self.part = Part.objects.create(uuid=1, name='10k / 0603', category='resistors')
+        self.order = Order.objects.create()
+
+    def assertRollup(self, line_count, total_price):
+        rollup = OrderRollup.objects.get(order=self.order)
+        self.assertEqual((rollup.line_count, rollup.total_price), (line_count, total_price))
+
+    def test_lines(self):
+        self.assertRollup(0, None)
+
+        order_part = OrderPart.objects.create(order=self.order, part=self.part, count=10, price=0.5)
+        self.assertRollup(1, 5)
+
+        order_part.count = 20
+        order_part.save()
+        self.assertRollup(1, 10)
+
+        order_part.delete()
+        self.assertRollup(0, None)
+
+    def test_bulk_create(self):
+        Order.objects.bulk_create([Order(name='bulk order')])
+        order = Order.objects.get(name='bulk order')
+        self.assertEqual((order.part_count, order.price()), (0, None))
+        self.assertTrue(OrderRollup.objects.filter(order=order).exists())
+
+    def test_missing_rollup(self):
+        OrderPart.objects.create(order=self.order, part=self.part, count=10, price=0.5)
+        OrderRollup.objects.all().delete()
+
+        order = Order.objects.get(id=self.order.id)
+        self.assertEqual((order.part_count, order.price()), (1, 5))
+
+    def test_rebuild(self):
+        OrderRollup.objects.all().delete()
+        OrderPart.objects.create(order=self.order, part=self.part, count=10, price=0.5)
+
+        OrderRollup.rebuild()
+        self.assertRollup(1, 5)
@@ -1,8 +1,12 @@
 
+import math
+
 from django.contrib import admin
 from django.db.models import F
 
 from .models import Part
+from .search import search_parts
+from .values import format_value
 from utils.django import custom_titled_filter
 from orders.models import Order
 
@@ -45,6 +49,32 @@ class StockFilter(admin.SimpleListFilter):
         return queryset.filter(missing__gt=0)
 
 
+class CompValueFilter(admin.SimpleListFilter):
+    """
+    Decade ranges of the parsed component value, i.e. 1kΩ - 10kΩ, served by the (comp_unit, comp_magnitude) index.
+    Arbitrary ranges work through the query string: ?comp_unit=ohm&comp_magnitude__gte=1000&comp_magnitude__lte=10000
+    """
+    title = ('value')
+    parameter_name = 'value_range'
+
+    def lookups(self, request, model_admin):
+        values = Part.objects.filter(comp_magnitude__gt=0).order_by().values_list('comp_unit', 'comp_magnitude').distinct()
+        decades = sorted({(unit, math.floor(math.log10(magnitude) + 1e-9)) for unit, magnitude in values})
+        return [
+            (f'{unit}:{exponent}', f'{format_value(10 ** exponent, unit)} - {format_value(10 ** (exponent + 1), unit)}')
+            for unit, exponent in decades
+        ]
+
+    def queryset(self, request, queryset):
+        if not self.value():
+            return queryset
+
+        unit, exponent = self.value().split(':')
+        low, high = float(f'1e{exponent}'), float(f'1e{int(exponent) + 1}')
+        # parsed values carry float noise, 100n is 1.0000000000000001e-07
+        return queryset.filter(comp_unit=unit, comp_magnitude__gte=low * (1 - 1e-9), comp_magnitude__lt=high * (1 - 1e-9))
+
+
 class ModulePartInline(admin.TabularInline):
     model = Part.modules.through
     extra = 1
@@ -64,10 +94,10 @@ def create_order(modeladmin, request, queryset):
 
 @admin.register(Part)
 class PartAdmin(admin.ModelAdmin):
-    list_display = 'uuid', 'name', 'stock', 'demand', 'ordered', 'missing', 'avg_price', 'min_price', 'current_price', 'category', 'title', 'description', 'tme_type', 'farnell_code', 'comp_value', 'comp_class'
+    list_display = 'uuid', 'name', 'stock', 'demand', 'ordered', 'missing', 'avg_price', 'min_price', 'current_price', 'category', 'title', 'description', 'tme_type', 'farnell_code', 'comp_value', 'value', 'comp_class'
     list_editable = 'name', 'stock', 'min_price', 'current_price', 'category', 'title', 'description', 'tme_type', 'farnell_code', 'comp_value', 'comp_class'
 
-    list_filter = 'category', StockFilter, ('modules__name', custom_titled_filter('module name'))
+    list_filter = 'category', StockFilter, CompValueFilter, ('modules__name', custom_titled_filter('module name'))
     search_fields = 'uuid', 'name'
     readonly_fields = 'created', 'modified'
 
@@ -78,6 +108,9 @@ class PartAdmin(admin.ModelAdmin):
         qs = super().get_queryset(request)
         return Part.annotate_missing(qs)
 
+    def get_search_results(self, request, queryset, search_term):
+        return search_parts(search_term, queryset), False
+
     def demand(self, part):
         return part.total_demand
 
@@ -89,3 +122,7 @@ class PartAdmin(admin.ModelAdmin):
 
     def avg_price(self, part):
         return part.avg_price
+
+    @admin.display(ordering='comp_magnitude')
+    def value(self, part):
+        return format_value(part.comp_magnitude, part.comp_unit)
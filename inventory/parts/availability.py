@@ -0,0 +1,80 @@
+
+
+import time
+
+from threading import Lock
+
+from django.conf import settings
+from django.db import transaction
+
+from utils.django import bump_cache_generation, get_cache_generation
+
+
+"""
+Availability snapshot
+
+Process-level cache of PartAvailability rows for the admin. Every write that changes availability
+goes through `PartAvailability.refresh`, which bumps a generation counter once its transaction commits,
+see `utils.django.get_cache_generation` for when other workers see it. Rows are dropped after
+`PART_AVAILABILITY_SNAPSHOT_TTL` seconds anyway, so a missed bump leaves them stale that long at most.
+"""
+
+GENERATION_KEY = 'parts:availability:generation'
+AVAILABILITY_FIELDS = 'total_demand', 'total_ordered', 'stock', 'missing'
+
+
+def get_generation():
+    return get_cache_generation(GENERATION_KEY)
+
+
+def bump_generation():
+    bump_cache_generation(GENERATION_KEY)
+
+
+def bump_generation_on_commit():
+    transaction.on_commit(bump_generation)
+
+
+class AvailabilitySnapshot:
+    """{part_id: {total_demand, total_ordered, stock, missing}} filled lazily for the part ids asked for."""
+
+    def __init__(self):
+        self.generation = None
+        self.expires = 0
+        self.rows = {}
+        self._lock = Lock()
+
+    def __repr__(self):
+        return f"<AvailabilitySnapshot generation {self.generation}: {len(self.rows)} parts>"
+
+    def get(self, part_ids):
+        """Return availability of `part_ids`, only the ones not cached for the current generation hit the database."""
+        from .models import PartAvailability
+
+        part_ids = {int(part_id) for part_id in part_ids}
+        generation = get_generation()
+
+        with self._lock:
+            if generation != self.generation or time.monotonic() >= self.expires:
+                self.rows = {}
+                self.generation = generation
+                self.expires = time.monotonic() + settings.PART_AVAILABILITY_SNAPSHOT_TTL
+            rows = self.rows  # other threads may swap in empty rows, this dict only ever gets rows added
+            missing = part_ids - rows.keys()
+
+        fetched = {part_id: dict.fromkeys(AVAILABILITY_FIELDS, 0) for part_id in missing}  # parts without a ledger row
+        if missing:
+            for row in PartAvailability.objects.filter(part_id__in=missing).values('part_id', *AVAILABILITY_FIELDS):
+                fetched[row.pop('part_id')] = row
+
+            with self._lock:
+                if self.rows is rows:
+                    rows.update(fetched)
+
+        return {part_id: fetched[part_id] if part_id in fetched else rows[part_id] for part_id in part_ids}
+
+    def get_part(self, part_id):
+        return self.get([part_id])[int(part_id)]
+
+
+availability_snapshot = AvailabilitySnapshot()
@@ -0,0 +1,55 @@
+
+
+import csv
+
+from .models import Part
+
+
+"""
+Part export
+
+Catalog rows with their availability columns, streamed as CSV/TSV lines. Rows come from a server-side
+cursor (`.iterator()`) and lines are produced one at a time, so memory doesn't grow with the catalog.
+"""
+
+EXPORT_COLUMNS = (
+    ('uuid', 'uuid'),
+    ('name', 'name'),
+    ('category', 'category'),
+    ('title', 'title'),
+    ('comp_value', 'comp_value'),
+    ('tme_type', 'tme_type'),
+    ('farnell_code', 'farnell_code'),
+    ('stock', 'stock'),
+    ('demand', 'total_demand'),
+    ('ordered', 'total_ordered'),
+    ('missing', 'missing'),
+    ('min_price', 'min_price'),
+    ('current_price', 'current_price'),
+)
+
+DELIMITERS = {
+    'csv': ',',
+    'tsv': '\t',
+}
+
+
+class _Echo:
+    """Pseudo-buffer handing back what `csv.writer` writes to it instead of storing it."""
+
+    def write(self, value):
+        return value
+
+
+def export_rows(qs=None, chunk_size=2000):
+    """Yield the header and a tuple per part in EXPORT_COLUMNS order."""
+    qs = Part.annotate_missing(qs).order_by('uuid')
+    yield tuple(label for label, _ in EXPORT_COLUMNS)
+    yield from qs.values_list(*(field for _, field in EXPORT_COLUMNS)).iterator(chunk_size=chunk_size)
+
+
+def export_lines(fmt='csv', qs=None):
+    """Yield the export as text lines in `fmt` (csv or tsv)."""
+    writer = csv.writer(_Echo(), delimiter=DELIMITERS[fmt])
+    for row in export_rows(qs):
+        yield writer.writerow(row)
@@ -0,0 +1,52 @@
+# Generated by Django 3.2.9 on 2026-10-18 17:12
+
+from django.db import migrations, models
+from django.db.models import F, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce, Greatest
+import django.db.models.deletion
+
+
+def populate_availability(apps, schema_editor):
+    Part = apps.get_model('parts', 'Part')
+    PartAvailability = apps.get_model('parts', 'PartAvailability')
+    ModulePart = apps.get_model('modules', 'ModulePart')
+    OrderPart = apps.get_model('orders', 'OrderPart')
+
+    PartAvailability.objects.bulk_create([PartAvailability(part_id=pk) for pk in Part.objects.values_list('id', flat=True)], batch_size=1000)
+
+    demand = ModulePart.objects.filter(part_id=OuterRef('part_id'), module__demands__isnull=False).order_by()
+    demand = demand.values('part_id').annotate(total=Sum(F('count') * F('module__demands__count'))).values('total')
+    ordered = OrderPart.objects.filter(part_id=OuterRef('part_id')).order_by()
+    ordered = ordered.values('part_id').annotate(total=Sum('count')).values('total')
+
+    PartAvailability.objects.update(
+        total_demand=Coalesce(Subquery(demand), Value(0), output_field=models.BigIntegerField()),
+        total_ordered=Coalesce(Subquery(ordered), Value(0), output_field=models.BigIntegerField()),
+        stock=Subquery(Part.objects.filter(id=OuterRef('part_id')).values('stock')),
+    )
+    PartAvailability.objects.update(missing=Greatest(F('total_demand') - F('total_ordered') - F('stock'), Value(0)))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('parts', '0001_initial'),
+        ('demands', '0001_initial'),
+        ('modules', '0001_initial'),
+        ('orders', '0003_remove_order_delivered'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PartAvailability',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('total_demand', models.BigIntegerField(default=0)),
+                ('total_ordered', models.BigIntegerField(default=0)),
+                ('stock', models.BigIntegerField(default=0)),
+                ('missing', models.BigIntegerField(default=0)),
+                ('part', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='availability', to='parts.part')),
+            ],
+        ),
+        migrations.RunPython(populate_availability, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,54 @@
+# Generated by Django 3.2.9 on 2026-10-18 17:15
+
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+import uuid
+
+
+def snapshot_current_stock(apps, schema_editor):
+    """Stock predates the journal, so the first snapshot is taken straight from the stock column."""
+    Part = apps.get_model('parts', 'Part')
+    StockSnapshot = apps.get_model('parts', 'StockSnapshot')
+
+    created = django.utils.timezone.now()
+    StockSnapshot.objects.bulk_create([
+        StockSnapshot(part_id=part_id, stock=stock, last_movement_id=0, created=created)
+        for part_id, stock in Part.objects.values_list('id', 'stock')
+    ], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('parts', '0002_partavailability'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StockSnapshot',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('stock', models.BigIntegerField()),
+                ('last_movement_id', models.BigIntegerField(default=0)),
+                ('created', models.DateTimeField(db_index=True, default=django.utils.timezone.now)),
+                ('part', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='stock_snapshots', to='parts.part')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='StockMovement',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('receipt', 'Receipt'), ('consumption', 'Consumption'), ('adjustment', 'Adjustment')], max_length=64)),
+                ('delta', models.BigIntegerField()),
+                ('reference', models.CharField(blank=True, max_length=256, null=True)),
+                ('batch', models.UUIDField(db_index=True, default=uuid.uuid4)),
+                ('created', models.DateTimeField(db_index=True, default=django.utils.timezone.now)),
+                ('part', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='stock_movements', to='parts.part')),
+            ],
+            options={
+                'ordering': ('id',),
+            },
+        ),
+        migrations.RunPython(snapshot_current_stock, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,42 @@
+# Generated by Django 3.2.9 on 2026-10-18 17:41
+
+from django.db import migrations
+
+
+# (index, table, column), the expression matches what Django emits for icontains/istartswith on PostgreSQL
+SEARCH_INDEXES = [
+    ('parts_part_name_trgm', 'parts_part', 'name'),
+    ('parts_part_title_trgm', 'parts_part', 'title'),
+    ('parts_part_comp_value_trgm', 'parts_part', 'comp_value'),
+    ('parts_partoption_name_trgm', 'parts_partoption', 'name'),
+]
+
+
+def create_trigram_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql': return
+    quote_name = schema_editor.connection.ops.quote_name
+
+    schema_editor.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+    for index, table, column in SEARCH_INDEXES:
+        schema_editor.execute(
+            f"CREATE INDEX IF NOT EXISTS {quote_name(index)} ON {quote_name(table)} USING gin (UPPER({quote_name(column)}::text) gin_trgm_ops)"
+        )
+
+
+def drop_trigram_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql': return
+    quote_name = schema_editor.connection.ops.quote_name
+
+    for index, _, _ in SEARCH_INDEXES:
+        schema_editor.execute(f"DROP INDEX IF EXISTS {quote_name(index)}")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('parts', '0003_stock_journal'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_trigram_indexes, drop_trigram_indexes),
+    ]
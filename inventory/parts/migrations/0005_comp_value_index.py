@@ -0,0 +1,124 @@
+# Generated by Django 3.2.9 on 2026-10-18 17:52
+
+import re
+
+from django.db import migrations, models
+
+
+# parts.values as of this migration, migrations don't import application code that can change after them
+
+MULTIPLIERS = {
+    'p': 1e-12,
+    'n': 1e-9,
+    'u': 1e-6,
+    'µ': 1e-6,
+    'm': 1e-3,
+    'R': 1,
+    'k': 1e3,
+    'K': 1e3,
+    'M': 1e6,
+    'G': 1e9,
+}
+
+UNITS = {
+    'f': 'F',
+    'h': 'H',
+    'r': 'ohm',
+    'ohm': 'ohm',
+    'ω': 'ohm',
+}
+
+CATEGORY_UNITS = {
+    'condensers': 'F',
+    'inductors': 'H',
+    'resistors': 'ohm',
+    'trimmers': 'ohm',
+}
+
+# digits, an optional multiplier (which may stand for the decimal point, "4k7"), optional decimals, an optional unit
+VALUE_RE = re.compile(r'^(\d+(?:[.,]\d+)?)([pnuµmRkKMG]?)(\d*)(F|H|R|ohm|Ω)?$', re.IGNORECASE)
+
+
+def parse_value(text, unit=None, strict=False):
+    """
+    Return (magnitude, unit) of a single value word, None if it isn't one.
+    `unit` is the unit implied by the category, `strict` requires a multiplier or a unit to be written out.
+    """
+    match = VALUE_RE.match(text.strip())
+    if not match:
+        return None
+
+    number, multiplier, decimals, written_unit = match.groups()
+    if multiplier and multiplier not in MULTIPLIERS:  # the match ignores case, the multipliers don't
+        multiplier = multiplier.lower() if multiplier.lower() in MULTIPLIERS else None
+        if multiplier is None:
+            return None
+    if decimals and (not multiplier or '.' in number or ',' in number):
+        return None
+    if strict and not multiplier and not written_unit:
+        return None
+    if multiplier == 'R' and written_unit:
+        return None
+
+    written_unit = UNITS[written_unit.lower()] if written_unit else None
+    if multiplier == 'R':
+        written_unit = 'ohm'
+    unit = written_unit or unit
+    if not unit:
+        return None
+
+    magnitude = float(f"{number.replace(',', '.')}{'.' if decimals else ''}{decimals}") * MULTIPLIERS.get(multiplier, 1)
+    return magnitude, unit
+
+
+def parse_part_value(category, name=None, comp_value=None, tme_type=None):
+    """Return (magnitude, unit) of a part from its catalog fields, (None, None) if none of them holds a value."""
+    unit = CATEGORY_UNITS.get(category)
+    name_words = re.split(r'[\s/]+', (name or '').strip())
+
+    candidates = [(name_words[0], unit != 'ohm')]
+    candidates += [(word, False) for word in re.split(r'[\s/]+', (comp_value or '').strip())[:1]]
+    candidates += [(word, True) for word in re.split(r'[\s/_-]+', tme_type or '') if word]
+
+    for word, strict in candidates:
+        value = parse_value(word, unit, strict) if word else None
+        if value:
+            return value
+    return None, None
+
+
+def backfill_comp_values(apps, schema_editor):
+    Part = apps.get_model('parts', 'Part')
+
+    parts = [
+        Part(id=part_id, comp_magnitude=magnitude, comp_unit=unit)
+        for part_id, *fields in Part.objects.values_list('id', 'category', 'name', 'comp_value', 'tme_type').iterator()
+        for magnitude, unit in [parse_part_value(*fields)]
+        if unit
+    ]
+    Part.objects.bulk_update(parts, ['comp_magnitude', 'comp_unit'], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('parts', '0004_search_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='part',
+            name='comp_magnitude',
+            field=models.FloatField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='part',
+            name='comp_unit',
+            field=models.CharField(blank=True, editable=False, max_length=16, null=True),
+        ),
+        migrations.RunPython(backfill_comp_values, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='part',
+            index=models.Index(fields=['comp_unit', 'comp_magnitude'], name='parts_part_comp_value_idx'),
+        ),
+    ]
@@ -1,10 +1,23 @@
 
 
-from django.db import models
-from django.db.models import F, Case, When
-from core.models import TimestampModel
+from collections import defaultdict
+from uuid import uuid4
+
+from django.db import connections, models, transaction
+from django.db.models import F, Max, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce, Greatest
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from django.utils import timezone
+
+from core.models import BulkChangedManager, TimestampModel
+from core.signals import bulk_changed
+from utils.core import flatten
 from utils.django import names_enum, has_annotation
 
+from .availability import bump_generation_on_commit
+from .values import parse_part_value
+
 
 PART_CATEGORIES = names_enum(
     'condensers',
@@ -18,6 +31,75 @@ PART_CATEGORIES = names_enum(
     'misc'
 )
 
+VALUE_SOURCE_FIELDS = 'category', 'name', 'comp_value', 'tme_type'  # parsed into comp_magnitude and comp_unit
+
+STOCK_MOVEMENT_KINDS = names_enum(
+    'receipt',
+    'consumption',
+    'adjustment',
+)
+
+
+class PartManager(BulkChangedManager):
+
+    def _can_update_from_values(self, connection):
+        if connection.vendor == 'postgresql':
+            return True
+        return connection.vendor == 'sqlite' and connection.Database.sqlite_version_info >= (3, 35)  # UPDATE FROM ... RETURNING
+
+    def _lock(self, part_ids):
+        """Lock the rows of `part_ids` in id order, SQLite has no row locks, its writers lock the whole database."""
+        list(self.select_for_update().filter(id__in=part_ids).order_by('id').values_list('id', flat=True))
+
+    def adjust_stock(self, part_deltas):
+        """
+        Add {part_id: delta} to stock of any number of parts and return {part_id: new_stock}.
+
+        Runs a single `UPDATE ... FROM (VALUES ...) RETURNING` per batch, the increment happens in the database
+        on locked rows, so concurrent adjustments can't lose updates. The UPDATE locks rows in the order of its join,
+        so each batch first takes its locks with `SELECT ... ORDER BY id FOR UPDATE`. Batches are sorted by id,
+        concurrent adjustments of overlapping parts wait for each other instead of deadlocking.
+        Other backends fall back to one `F('stock') + delta` UPDATE per distinct delta, after the same locking.
+        """
+        part_deltas = sorted((int(part_id), int(delta)) for part_id, delta in dict(part_deltas).items() if delta)
+        connection = connections[self.db]
+        out = {}
+
+        if not part_deltas:
+            return out
+
+        batch_size = (connection.features.max_query_params or 10000) // 2
+
+        with transaction.atomic(using=self.db):
+
+            if not self._can_update_from_values(connection):
+                for i in range(0, len(part_deltas), batch_size):
+                    self._lock([part_id for part_id, _ in part_deltas[i: i + batch_size]])
+                part_ids_by_delta = defaultdict(list)
+                for part_id, delta in part_deltas:
+                    part_ids_by_delta[delta].append(part_id)
+                for delta, part_ids in part_ids_by_delta.items():
+                    self.filter(id__in=part_ids).update(stock=F('stock') + delta)
+                return dict(self.filter(id__in=[part_id for part_id, _ in part_deltas]).values_list('id', 'stock'))
+
+            table = connection.ops.quote_name(self.model._meta.db_table)
+
+            with connection.cursor() as cursor:
+                for i in range(0, len(part_deltas), batch_size):
+                    batch = part_deltas[i: i + batch_size]
+                    self._lock([part_id for part_id, _ in batch])
+                    values = ', '.join(['(%s, %s)'] * len(batch))
+                    cursor.execute(
+                        f"UPDATE {table} SET stock = {table}.stock + v.delta "
+                        f"FROM (SELECT column1 AS id, column2 AS delta FROM (VALUES {values}) AS t) AS v "
+                        f"WHERE {table}.id = v.id RETURNING {table}.id, {table}.stock",
+                        flatten(batch)
+                    )
+                    out.update(cursor.fetchall())
+            bulk_changed.send(sender=self.model)
+
+        return out
+
 
 class Part(TimestampModel):
 
@@ -31,13 +113,20 @@ class Part(TimestampModel):
     farnell_code = models.CharField(max_length=512, null=True)
     comp_value = models.CharField(max_length=512, null=True)
     comp_class = models.CharField(max_length=512, null=True)
+    comp_magnitude = models.FloatField(null=True, blank=True, editable=False)  # parsed value in base units, see parts.values
+    comp_unit = models.CharField(max_length=16, null=True, blank=True, editable=False)
 
     stock = models.BigIntegerField(default=0)
     min_price = models.FloatField(default=0)
     current_price = models.FloatField(default=0)
 
+    objects = PartManager()
+
     class Meta:
         ordering = 'uuid',
+        indexes = [
+            models.Index(fields=['comp_unit', 'comp_magnitude'], name='parts_part_comp_value_idx'),
+        ]
 
     def __repr__(self):
         return f"<Part {self.id}: {self.uuid}: {self.name}>"
@@ -45,9 +134,72 @@ class Part(TimestampModel):
     def __str__(self):
         return self.name
 
+    def save(self, *args, **kwargs):
+        """Journal direct stock edits (i.e. from the admin) as adjustments so the projection doesn't drift."""
+        previous_stock = (Part.objects.filter(pk=self.pk).values_list('stock', flat=True).first() if self.pk else None) or 0
+
+        self.comp_magnitude, self.comp_unit = parse_part_value(self.category, self.name, self.comp_value, self.tme_type)
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and set(VALUE_SOURCE_FIELDS) & set(update_fields):
+            kwargs['update_fields'] = {*update_fields, 'comp_magnitude', 'comp_unit'}
+
+        out = super().save(*args, **kwargs)
+        if self.stock != previous_stock:
+            StockMovement.objects.create(part=self, kind='adjustment', delta=self.stock - previous_stock)
+        return out
+
     @classmethod
-    def annotate_missing(self, qs=None):
-        if qs and has_annotation(qs, 'missing'): return qs
+    def update_comp_values(cls, qs=None):
+        """Re-parse `comp_magnitude` and `comp_unit` of `qs` (all parts if None) after bulk writes, return the number changed."""
+        qs = Part.objects.all() if qs is None else qs
+        rows = qs.order_by().values_list('id', *VALUE_SOURCE_FIELDS, 'comp_magnitude', 'comp_unit').iterator()
+
+        changed = []
+        for part_id, category, name, comp_value, tme_type, *current in rows:
+            value = parse_part_value(category, name, comp_value, tme_type)
+            if value != tuple(current):
+                changed.append(cls(id=part_id, comp_magnitude=value[0], comp_unit=value[1]))
+
+        cls.objects.bulk_update(changed, ['comp_magnitude', 'comp_unit'], batch_size=1000)
+        return len(changed)
+
+    @classmethod
+    def stock_projection(cls, when=None, last_movement_id=None):
+        """Return an expression of stock at `when` (now if None): latest snapshot + movements journaled since."""
+        snapshot = StockSnapshot.latest(when)
+
+        movements = StockMovement.objects.filter(part_id=OuterRef('id'))
+        if when:
+            movements = movements.filter(created__lte=when)
+        if last_movement_id is not None:
+            movements = movements.filter(id__lte=last_movement_id)
+        if snapshot:
+            movements = movements.filter(id__gt=snapshot['last_movement_id'])
+        movements = movements.order_by().values('part_id').annotate(total=Sum('delta')).values('total')
+
+        base = Value(0)
+        if snapshot:
+            base = Subquery(StockSnapshot.objects.filter(part_id=OuterRef('id'), created=snapshot['created']).values('stock')[:1])
+
+        return Coalesce(base, Value(0), output_field=models.BigIntegerField()) + Coalesce(Subquery(movements), Value(0), output_field=models.BigIntegerField())
+
+    @classmethod
+    def annotate_stock_at(cls, when, qs=None):
+        """Annotate `stock_at`, the point-in-time stock reconstructed from the journal."""
+        qs = Part.objects.all() if qs is None else qs
+        return qs.annotate(stock_at=cls.stock_projection(when))
+
+    @classmethod
+    def refresh_stock(cls):
+        """Re-project the cached `stock` column of every part from the journal."""
+        with transaction.atomic():
+            Part.objects.update(stock=cls.stock_projection())
+            PartAvailability.refresh()
+
+    @classmethod
+    def annotate_missing(cls, qs=None):
+        qs = Part.objects.all() if qs is None else qs
+        if has_annotation(qs, 'missing'): return qs
 
         from demands.models import ModuleDemand
         from orders.models import Order, OrderPart
@@ -55,13 +207,7 @@ class Part(TimestampModel):
         qs = ModuleDemand.annotate_parts(qs)
         qs = Order.annotate_parts(qs)
         qs = OrderPart.annotate_parts(qs)
-        qs = qs.annotate(_missing=F('total_demand') - F('total_ordered') - F('stock'))
-        qs = qs.annotate(
-            missing=Case(
-                When(_missing__gte=0, then=F('_missing')),
-                default=0
-            )
-        )
+        qs = qs.annotate(missing=Coalesce(F('availability__missing'), Value(0), output_field=models.BigIntegerField()))
 
         return qs
 
@@ -69,3 +215,161 @@ class Part(TimestampModel):
 class PartOption(TimestampModel):
     name = models.CharField(max_length=256)
     part = models.ForeignKey(Part, on_delete=models.CASCADE)
+
+
+class StockMovement(models.Model):
+    """Append-only journal of stock changes, `Part.stock` is its cached projection."""
+
+    part = models.ForeignKey(Part, on_delete=models.CASCADE, related_name='stock_movements')
+    kind = models.CharField(max_length=64, choices=STOCK_MOVEMENT_KINDS)
+    delta = models.BigIntegerField()
+    reference = models.CharField(max_length=256, null=True, blank=True)
+    batch = models.UUIDField(default=uuid4, db_index=True)
+    created = models.DateTimeField(default=timezone.now, db_index=True)
+
+    objects = BulkChangedManager()
+
+    class Meta:
+        ordering = 'id',
+
+    def __repr__(self):
+        return f"<StockMovement {self.id}: {self.kind} {self.part_id} {self.delta:+}>"
+
+    def __str__(self):
+        return self.__repr__()
+
+    @classmethod
+    def record(cls, part_deltas, kind, reference=None):
+        """Journal {part_id: delta} in one bulk insert, apply it to `Part.stock` and return the new stock levels."""
+        batch = uuid4()
+        movements = [
+            cls(part_id=part_id, kind=kind, delta=delta, reference=reference, batch=batch)
+            for part_id, delta in dict(part_deltas).items() if delta
+        ]
+
+        if not movements:
+            return {}
+
+        with transaction.atomic():
+            cls.objects.bulk_create(movements, batch_size=1000)
+            stock = Part.objects.adjust_stock((movement.part_id, movement.delta) for movement in movements)
+            PartAvailability.refresh(Part.objects.filter(stock_movements__batch=batch).values('id'))
+
+        return stock
+
+
+class StockSnapshot(models.Model):
+    """Stock of every part at the time of a periodic snapshot, including movements up to `last_movement_id`."""
+
+    part = models.ForeignKey(Part, on_delete=models.CASCADE, related_name='stock_snapshots')
+    stock = models.BigIntegerField()
+    last_movement_id = models.BigIntegerField(default=0)
+    created = models.DateTimeField(default=timezone.now, db_index=True)
+
+    objects = BulkChangedManager()
+
+    def __repr__(self):
+        return f"<StockSnapshot {self.id}: {self.part_id} x {self.stock} at {self.created}>"
+
+    def __str__(self):
+        return self.__repr__()
+
+    @classmethod
+    def latest(cls, when=None):
+        """Return {'created', 'last_movement_id'} of the latest snapshot taken before `when`."""
+        qs = cls.objects.filter(created__lte=when) if when else cls.objects.all()
+        return qs.order_by('-created').values('created', 'last_movement_id').first()
+
+    @classmethod
+    def take(cls):
+        """Snapshot the journal projection of all parts, so later projections only sum newer movements."""
+        with transaction.atomic():
+            last_movement_id = StockMovement.objects.aggregate(last=Max('id'))['last'] or 0
+            stocks = Part.objects.annotate(projected=Part.stock_projection(last_movement_id=last_movement_id)).values_list('id', 'projected')
+
+            created = timezone.now()
+            cls.objects.bulk_create([
+                cls(part_id=part_id, stock=stock, last_movement_id=last_movement_id, created=created)
+                for part_id, stock in stocks
+            ], batch_size=1000)
+
+
+class PartAvailability(models.Model):
+    """Materialized demand/ordered/stock totals per part, kept up to date by the signal handlers below."""
+
+    part = models.OneToOneField(Part, on_delete=models.CASCADE, related_name='availability')
+    total_demand = models.BigIntegerField(default=0)
+    total_ordered = models.BigIntegerField(default=0)
+    stock = models.BigIntegerField(default=0)
+    missing = models.BigIntegerField(default=0)
+
+    objects = BulkChangedManager()
+
+    def __repr__(self):
+        return f"<PartAvailability {self.part_id}: {self.total_demand} / {self.total_ordered} / {self.stock} -> {self.missing}>"
+
+    def __str__(self):
+        return self.__repr__()
+
+    @classmethod
+    def refresh(cls, part_ids=None):
+        """Recompute the rows for `part_ids` (ids or an id queryset, all rows if None) with two set-based UPDATEs."""
+        from modules.models import ModulePart
+        from orders.models import OrderPart
+
+        demand = ModulePart.objects.filter(part_id=OuterRef('part_id'), module__demands__isnull=False).order_by()
+        demand = demand.values('part_id').annotate(total=Sum(F('count') * F('module__demands__count'))).values('total')
+        ordered = OrderPart.objects.filter(part_id=OuterRef('part_id')).order_by()
+        ordered = ordered.values('part_id').annotate(total=Sum('count')).values('total')
+        stock = Part.objects.filter(id=OuterRef('part_id')).values('stock')
+
+        rows = cls.objects.all() if part_ids is None else cls.objects.filter(part_id__in=part_ids)
+
+        with transaction.atomic():
+            rows.update(
+                total_demand=Coalesce(Subquery(demand), Value(0), output_field=models.BigIntegerField()),
+                total_ordered=Coalesce(Subquery(ordered), Value(0), output_field=models.BigIntegerField()),
+                stock=Subquery(stock),
+            )
+            rows.update(missing=Greatest(F('total_demand') - F('total_ordered') - F('stock'), Value(0)))
+            bump_generation_on_commit()
+
+    @classmethod
+    def create_missing(cls):
+        """Create zeroed rows for parts without one (i.e. after `bulk_create` or a raw INSERT)."""
+        new_part_ids = Part.objects.filter(availability__isnull=True).values_list('id', flat=True)
+        cls.objects.bulk_create([cls(part_id=part_id) for part_id in new_part_ids], batch_size=1000)
+
+    @classmethod
+    def rebuild(cls):
+        """Create the rows missing for any part and recompute the whole table."""
+        with transaction.atomic():
+            cls.create_missing()
+            cls.refresh()
+
+
+# Rows are only ever updated outside of `Part` creation and `rebuild`, so a cascading delete can't resurrect them
+@receiver(post_save, sender=Part)
+def _part_saved(sender, instance, created, raw=False, **kwargs):
+    if raw: return
+    if created:
+        PartAvailability.objects.create(part=instance)
+    PartAvailability.refresh([instance.id])
+
+
+@receiver([post_save, post_delete], sender='modules.ModulePart')
+@receiver([post_save, post_delete], sender='orders.OrderPart')
+def _part_line_changed(sender, instance, raw=False, **kwargs):
+    if raw: return
+    PartAvailability.refresh([instance.part_id])
+
+
+@receiver([post_save, post_delete], sender='demands.ModuleDemand')
+def _module_demand_changed(sender, instance, raw=False, **kwargs):
+    if raw: return
+    from modules.models import ModulePart
+    PartAvailability.refresh(ModulePart.objects.filter(module_id=instance.module_id).values('part_id'))
+
+
+# connect the search index invalidation signals
+from .search import search_parts
@@ -0,0 +1,62 @@
+
+import graphene
+
+from django.db.models import ExpressionWrapper, F, FloatField
+
+from graphql_jwt.decorators import login_required
+
+from .models import Part
+from .search import search_parts
+from api.fields import ModelListField
+from api.filters import CursorPaginationFilter, DjangoFilter, PaginationFilter
+from api.registry import register_type
+
+
+@register_type('Part')
+class PartType:
+    class Meta:
+        model = Part
+        fields = [
+            'id', 'uuid', 'name', 'category', 'title', 'description', 'tme_type', 'farnell_code', 'comp_value', 'comp_class',
+            'comp_magnitude', 'comp_unit', 'stock', 'min_price', 'current_price',
+        ]
+        lookups = {
+            'id': graphene.ID(),
+            'uuid': graphene.Int(),
+            'name': graphene.String(),
+            'category': graphene.String(),
+            # parametric ranges in base units (ohm, F, H), i.e. compUnit: "ohm", compMagnitude_Gte: 1000, compMagnitude_Lte: 10000
+            'comp_unit': graphene.String(),
+            'comp_magnitude__gte': graphene.Float(),
+            'comp_magnitude__lte': graphene.Float(),
+        }
+        filters = {
+            'django': DjangoFilter,
+            'pagination': PaginationFilter,
+            'cursor': CursorPaginationFilter,
+        }
+        group_by = ['category', 'comp_class', 'comp_unit', 'tme_type']
+        aggregate_fields = {
+            'stock': F('stock'),
+            'min_price': F('min_price'),
+            'current_price': F('current_price'),
+            'comp_magnitude': F('comp_magnitude'),
+            'stock_value': ExpressionWrapper(F('stock') * F('current_price'), output_field=FloatField()),
+        }
+
+
+@register_type('SearchParts')
+class SearchPartsType:
+    """Parts matching every word of `query` in their name, option names, title or component value, best matches first."""
+
+    class Meta:
+        arguments = {
+            'query': graphene.String(required=True),
+            'limit': graphene.Int(default_value=20),
+        }
+
+    parts = ModelListField(Part)
+
+    @login_required
+    def resolve(root, info, query, limit=20):
+        return {'parts': search_parts(query, limit=limit)}
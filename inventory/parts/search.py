@@ -0,0 +1,187 @@
+
+
+import json
+import re
+import time
+
+from bisect import bisect_left
+from heapq import nsmallest
+from threading import Lock
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Exists, OuterRef, Q
+from django.db.models.expressions import RawSQL
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from utils.django import bump_cache_generation, case_order_qs, get_cache_generation
+
+from .models import Part, PartOption
+
+
+"""
+Part search
+
+Ranked search over part names, option names (the '/' separated aliases), titles and component values.
+Every word of the query has to match one of those fields, results are ranked with `case_order_qs`.
+
+PostgreSQL matches substrings with `icontains`, served by the trigram GIN indexes of migration 0004.
+Other backends (SQLite in development) narrow the candidates with an in-memory index of sorted words,
+a flattened prefix trie, so there a query word matches the beginning of a word of those fields.
+The index is rebuilt when parts or options change (see `utils.django.get_cache_generation` for other workers)
+and every `PART_SEARCH_INDEX_TTL` seconds.
+"""
+
+GENERATION_KEY = 'parts:search:generation'
+SEARCH_FIELDS = {'uuid', 'name', 'title', 'comp_value'}
+
+# index ranks, lower is better
+RANKS = UUID, NAME_START, OPTION_START, NAME_WORD, OTHER_WORD = range(5)
+
+
+def tokenize(text):
+    return [token for token in re.split(r'[\s/,;]+', (text or '').lower()) if token]
+
+
+class PrefixIndex:
+    """
+    Sorted words with the part they come from, all words starting with a prefix are one contiguous slice.
+    There's one sorted array per rank, so a search can stop once the better ranks found enough parts.
+    """
+
+    def __init__(self):
+        parts = list(Part.objects.values_list('id', 'uuid', 'name', 'title', 'comp_value').iterator())
+        name_order = {part_id: i for i, (part_id, *_) in enumerate(sorted(parts, key=lambda part: part[2]))}
+        entries = [[] for _ in RANKS]
+
+        for part_id, uuid, name, title, comp_value in parts:
+            entries[UUID].append((str(uuid), part_id))
+            entries[NAME_START] += [(token, part_id) for token in tokenize(name)[:1]]
+            entries[NAME_WORD] += [(token, part_id) for token in tokenize(name)[1:]]
+            entries[OTHER_WORD] += [(token, part_id) for token in tokenize(title) + tokenize(comp_value)]
+
+        for part_id, name in PartOption.objects.values_list('part_id', 'name').iterator():
+            entries[OPTION_START] += [(token, part_id) for token in tokenize(name)[:1]]
+            entries[NAME_WORD] += [(token, part_id) for token in tokenize(name)[1:]]
+
+        self.ranks = []
+        for rank_entries in entries:
+            rank_entries.sort()
+            words = [word for word, _ in rank_entries]
+            part_ids = [part_id for _, part_id in rank_entries]
+            self.ranks.append((words, part_ids, [name_order.get(part_id, 0) for part_id in part_ids]))
+
+    def __repr__(self):
+        return f"<PrefixIndex {sum(len(words) for words, _, _ in self.ranks)} words>"
+
+    def lookup(self, prefix):
+        """Yield (part_ids, name positions) of every rank having words starting with `prefix`, best rank first."""
+        for words, part_ids, name_positions in self.ranks:
+            start = bisect_left(words, prefix)
+            end = bisect_left(words, prefix + '\uffff', lo=start)
+            if start < end:
+                yield part_ids[start:end], name_positions[start:end]
+
+    def search(self, words, limit=None, among=None):
+        """
+        Return ids of the parts matching all `words`, ranked by how the first word matched, then by name.
+        Only parts with ids in `among` are considered if given, `limit` caps the number of ids.
+        """
+        first, *others = words
+        allowed = [{part_id for part_ids, _ in self.lookup(word) for part_id in part_ids} for word in others]
+        if among is not None:
+            allowed.append(set(among))
+
+        out = {}
+        for part_ids, name_positions in self.lookup(first):
+            candidates = zip(name_positions, part_ids)
+            if allowed:
+                candidates = ((position, part_id) for position, part_id in candidates if all(part_id in ids for ids in allowed))
+            # a part can have several words with the prefix
+            candidates = nsmallest(2 * limit, candidates) if limit else sorted(candidates)
+
+            for _, part_id in candidates:
+                out.setdefault(part_id, None)
+                if len(out) == limit:
+                    return list(out)
+        return list(out)
+
+
+_index = None
+_index_generation = None
+_index_expires = 0
+_index_lock = Lock()
+
+
+def get_index():
+    """Return the process-wide PrefixIndex, rebuild it if parts or options changed since it was built or it expired."""
+    global _index, _index_generation, _index_expires
+
+    generation = get_cache_generation(GENERATION_KEY)
+    with _index_lock:
+        if _index is None or _index_generation != generation or time.monotonic() >= _index_expires:
+            _index, _index_generation = PrefixIndex(), generation
+            _index_expires = time.monotonic() + settings.PART_SEARCH_INDEX_TTL
+        return _index
+
+
+def invalidate_index():
+    """Drop the PrefixIndex of all workers, has to be called after bulk writes that don't send signals."""
+    bump_cache_generation(GENERATION_KEY)
+
+
+def filter_ids(qs, ids):
+    """
+    Filter `qs` to the parts of `ids`, any number of them.
+    SQLite gets the ids as one JSON parameter, an `id__in` list takes a query variable per id and would exceed the limit
+    of the library (999 before SQLite 3.32, 32766 after).
+    """
+    if connection.vendor == 'sqlite':
+        return qs.filter(id__in=RawSQL('SELECT value FROM json_each(%s)', [json.dumps(ids)]))
+    return qs.filter(id__in=ids)
+
+
+def search_parts(query, qs=None, limit=None):
+    """
+    Return `qs` (all parts if None) filtered to the parts matching every word of `query`, best matches first.
+    Pass the number of results needed as `limit`, so the fallback index only hands over a few times as many candidates.
+    """
+    qs = Part.objects.all() if qs is None else qs
+    query = (query or '').strip()
+    words = tokenize(query)
+
+    if not words:
+        return qs
+
+    if connection.vendor == 'postgresql':
+        for word in words:
+            options = PartOption.objects.filter(part_id=OuterRef('id'), name__icontains=word)
+            qs = qs.filter(Q(name__icontains=word) | Q(title__icontains=word) | Q(comp_value__icontains=word) | Exists(options))
+    else:
+        among = qs.values_list('id', flat=True) if qs.query.has_filters() else None  # narrow to `qs` before capping
+        qs = filter_ids(qs, get_index().search(words, limit=limit * 5 if limit else None, among=among))
+
+    option_prefix = PartOption.objects.filter(part_id=OuterRef('id'), name__istartswith=query)
+    qs = qs.annotate(_option_prefix=Exists(option_prefix))
+
+    lookups = [('uuid', 'exact', int(query))] if query.isdecimal() else []  # isdigit() holds for '²', which int() refuses
+    lookups += [
+        ('name', 'iexact', query),
+        ('name', 'istartswith', query),
+        ('_option_prefix', 'exact', True),
+        ('name', 'icontains', query),
+        ('comp_value', 'istartswith', query),
+        ('title', 'icontains', query),
+        ('comp_value', 'icontains', query),
+    ]
+    qs = case_order_qs(qs, 'name', lookups)
+    return qs[:limit] if limit else qs
+
+
+@receiver([post_save, post_delete], sender=Part)
+@receiver([post_save, post_delete], sender=PartOption)
+def _search_fields_changed(sender, raw=False, update_fields=None, **kwargs):
+    if raw: return
+    if update_fields and not SEARCH_FIELDS & set(update_fields): return
+    transaction.on_commit(invalidate_index)
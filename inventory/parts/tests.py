@@ -0,0 +1,234 @@
+import sqlite3
+
+from unittest import skipIf
+from unittest.mock import patch
+
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+
+from demands.models import ModuleDemand
+from modules.models import Module, ModulePart
+from orders.models import Order, OrderPart
+
+from . import search
+from .availability import AvailabilitySnapshot
+from .models import Part, PartAvailability, StockMovement
+from .search import search_parts
+from .values import format_value, parse_part_value, parse_value
+
+
+class AdjustStockTest(TestCase):
+
+    def setUp(self):
+        self.parts = Part.objects.bulk_create([Part(uuid=uuid, name=f'{uuid}R / 0603', category='resistors', stock=10) for uuid in range(1, 4)])
+        self.ids = [part.id for part in Part.objects.order_by('id')]
+
+    def adjust(self):
+        return Part.objects.adjust_stock({self.ids[2]: 5, self.ids[0]: -3, str(self.ids[1]): 0})
+
+    def test_adjust_stock(self):
+        self.assertEqual(self.adjust(), {self.ids[0]: 7, self.ids[2]: 15})
+        self.assertEqual(dict(Part.objects.values_list('id', 'stock')), {self.ids[0]: 7, self.ids[1]: 10, self.ids[2]: 15})
+        self.assertEqual(Part.objects.adjust_stock({}), {})
+
+    def test_without_update_from(self):
+        with patch.object(type(Part.objects), '_can_update_from_values', return_value=False):
+            self.assertEqual(self.adjust(), {self.ids[0]: 7, self.ids[2]: 15})
+
+    def test_rows_are_locked_in_id_order_first(self):
+        with CaptureQueriesContext(connection) as queries:
+            self.adjust()
+        statements = [query['sql'] for query in queries if not query['sql'].startswith(('SAVEPOINT', 'RELEASE'))]
+        self.assertTrue(statements[0].startswith('SELECT'))
+        self.assertIn('ORDER BY', statements[0])
+        self.assertTrue(statements[1].startswith('UPDATE'))
+
+
+class PartAvailabilityTest(TestCase):
+
+    def setUp(self):
+        self.part = Part.objects.create(uuid=1, name='10k / 0603', category='resistors')
+        self.module = Module.objects.create(name='module')
+        ModulePart.objects.create(module=self.module, part=self.part, count=4)
+
+    def assertAvailability(self, total_demand, total_ordered, stock, missing):
+        availability = PartAvailability.objects.get(part=self.part)
+        self.assertEqual(
+            (availability.total_demand, availability.total_ordered, availability.stock, availability.missing),
+            (total_demand, total_ordered, stock, missing),
+        )
+        self.assertEqual(Part.annotate_missing(Part.objects.filter(id=self.part.id)).get().missing, missing)
+
+    def test_created_with_the_part(self):
+        self.assertAvailability(0, 0, 0, 0)
+
+    def test_demand(self):
+        demand = ModuleDemand.objects.create(module=self.module, count=3)
+        self.assertAvailability(12, 0, 0, 12)
+
+        demand.count = 1
+        demand.save()
+        self.assertAvailability(4, 0, 0, 4)
+
+        demand.delete()
+        self.assertAvailability(0, 0, 0, 0)
+
+    def test_orders_and_stock(self):
+        ModuleDemand.objects.create(module=self.module, count=3)
+        order = Order.objects.create(name='order')
+        order_part = OrderPart.objects.create(order=order, part=self.part, count=5)
+        self.assertAvailability(12, 5, 0, 7)
+
+        StockMovement.record({self.part.id: 10}, kind='adjustment')
+        self.assertAvailability(12, 5, 10, 0)
+
+        order_part.delete()
+        self.assertAvailability(12, 0, 10, 2)
+
+    def test_module_parts(self):
+        ModuleDemand.objects.create(module=self.module, count=2)
+        ModulePart.objects.filter(module=self.module).get().delete()
+        self.assertAvailability(0, 0, 0, 0)
+
+    def test_rebuild(self):
+        Part.objects.bulk_create([Part(uuid=2, name='4k7 / 0603', category='resistors')])
+        ModuleDemand.objects.create(module=self.module, count=1)
+        PartAvailability.objects.update(missing=0)
+
+        PartAvailability.rebuild()
+        self.assertEqual(PartAvailability.objects.count(), 2)
+        self.assertAvailability(4, 0, 0, 4)
+
+
+class AvailabilitySnapshotTest(TestCase):
+
+    def setUp(self):
+        self.part = Part.objects.create(uuid=1, name='10k / 0603', category='resistors')
+        self.snapshot = AvailabilitySnapshot()
+
+    def test_refresh_drops_the_rows(self):
+        self.assertEqual(self.snapshot.get_part(self.part.id)['stock'], 0)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            StockMovement.record({self.part.id: 7}, kind='adjustment')
+
+        self.assertEqual(self.snapshot.get_part(self.part.id)['stock'], 7)
+
+    @override_settings(PART_AVAILABILITY_SNAPSHOT_TTL=3600)
+    def test_rows_are_kept_until_a_bump(self):
+        self.assertEqual(self.snapshot.get_part(self.part.id)['stock'], 0)
+        PartAvailability.objects.filter(part=self.part).update(stock=7)  # a write whose bump this worker doesn't see
+        self.assertEqual(self.snapshot.get_part(self.part.id)['stock'], 0)
+
+    @override_settings(PART_AVAILABILITY_SNAPSHOT_TTL=0)
+    def test_rows_expire_without_a_bump(self):
+        self.assertEqual(self.snapshot.get_part(self.part.id)['stock'], 0)
+        PartAvailability.objects.filter(part=self.part).update(stock=7)
+        self.assertEqual(self.snapshot.get_part(self.part.id)['stock'], 7)
+
+
+    def test_rows_swapped_during_a_fetch(self):
+        other = Part.objects.create(uuid=2, name='4k7 / 0603', category='resistors')
+        self.snapshot.get_part(self.part.id)
+
+        def refresh(execute, sql, params, many, context):
+            self.snapshot.rows = {}  # as a concurrent request after a bump or the expiry
+            return execute(sql, params, many, context)
+
+        with connection.execute_wrapper(refresh):
+            availability = self.snapshot.get([self.part.id, other.id])
+        self.assertEqual(availability[self.part.id]['stock'], 0)
+        self.assertEqual(availability[other.id]['stock'], 0)
+        self.assertEqual(self.snapshot.rows, {})
+
+
+class SearchPartsTest(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        Part.objects.bulk_create([Part(uuid=uuid, name=f'{uuid}R / 0603', category='resistors') for uuid in range(1000, 1300)])
+
+    def setUp(self):
+        search._index = None
+
+    def test_finds_all_matches_without_a_limit(self):
+        self.assertEqual(search_parts('1').count(), 300)
+
+    def test_filtered_queryset_keeps_its_matches(self):
+        qs = Part.objects.filter(uuid__gte=1250)
+        self.assertEqual(set(search_parts('1', qs).values_list('uuid', flat=True)), set(range(1250, 1300)))
+
+    def test_limit(self):
+        self.assertEqual(len(search_parts('12', limit=5)), 5)
+        self.assertEqual(search_parts('1299', limit=5)[0].uuid, 1299)
+
+    def test_non_decimal_digits(self):
+        self.assertEqual(search_parts('²').count(), 0)
+
+    @skipIf(connection.vendor != 'sqlite', "the limit of query variables is SQLite's")
+    def test_more_matches_than_query_variables(self):
+        Part.objects.bulk_create([Part(uuid=uuid, name=f'{uuid}R / 0805', category='resistors') for uuid in range(10000, 11500)])
+        connection.ensure_connection()
+        limit = connection.connection.getlimit(sqlite3.SQLITE_LIMIT_VARIABLE_NUMBER)
+        connection.connection.setlimit(sqlite3.SQLITE_LIMIT_VARIABLE_NUMBER, 999)  # the default before SQLite 3.32
+        self.addCleanup(connection.connection.setlimit, sqlite3.SQLITE_LIMIT_VARIABLE_NUMBER, limit)
+
+        self.assertEqual(search_parts('1').count(), 1800)
+        self.assertEqual(search_parts('1', Part.objects.filter(uuid__gte=1100)).count(), 1700)
+        self.assertEqual(len(search_parts('0805', limit=300)), 300)
+
+    @skipIf(connection.vendor == 'postgresql', "PostgreSQL searches the table, there's no index to expire")
+    @override_settings(PART_SEARCH_INDEX_TTL=0)
+    def test_index_expires_without_a_bump(self):
+        search_parts('1').count()
+        Part.objects.create(uuid=5000, name='new part', category='misc')  # its bump waits for a commit, as another worker's would
+        self.assertEqual(search_parts('new').count(), 1)
+
+
+class ParseValueTest(TestCase):
+
+    def assertValue(self, value, magnitude, unit):
+        self.assertIsNotNone(value)
+        self.assertAlmostEqual(value[0], magnitude, delta=magnitude * 1e-9)
+        self.assertEqual(value[1], unit)
+
+    def test_multipliers(self):
+        self.assertValue(parse_value('10k', 'ohm'), 1e4, 'ohm')
+        self.assertValue(parse_value('100nF'), 1e-7, 'F')
+        self.assertValue(parse_value('1M', 'ohm'), 1e6, 'ohm')
+        self.assertValue(parse_value('1m', 'H'), 1e-3, 'H')
+        self.assertValue(parse_value('1,5uF'), 1.5e-6, 'F')
+
+    def test_multiplier_for_the_decimal_point(self):
+        self.assertValue(parse_value('4k7', 'ohm'), 4700, 'ohm')
+        self.assertValue(parse_value('2u2', 'F'), 2.2e-6, 'F')
+        self.assertValue(parse_value('4R7'), 4.7, 'ohm')
+        self.assertIsNone(parse_value('4.7k7', 'ohm'))
+
+    def test_units(self):
+        self.assertValue(parse_value('680R'), 680, 'ohm')
+        self.assertValue(parse_value('10kΩ'), 1e4, 'ohm')
+        self.assertValue(parse_value('1K2', 'ohm'), 1200, 'ohm')
+        self.assertIsNone(parse_value('10k'))  # no unit written or implied
+        self.assertIsNone(parse_value('1RF'))
+
+    def test_strict(self):
+        self.assertIsNone(parse_value('470', 'ohm', strict=True))
+        self.assertValue(parse_value('470', 'ohm'), 470, 'ohm')
+        self.assertValue(parse_value('470R', 'ohm', strict=True), 470, 'ohm')
+
+    def test_not_a_value(self):
+        for text in ('', 'BC547', '0805', '10x', '²', 'k7'):
+            self.assertIsNone(parse_value(text, strict=True), text)
+
+    def test_part_value(self):
+        self.assertValue(parse_part_value('resistors', '4k7 / 0805'), 4700, 'ohm')
+        self.assertValue(parse_part_value('resistors', 'SMD 0805', tme_type='SMD0805-1K2'), 1200, 'ohm')
+        self.assertValue(parse_part_value('condensers', '100n X7R', comp_value='10n'), 1e-7, 'F')
+        self.assertEqual(parse_part_value('transistors', 'BC547', tme_type='BC547B-TO92'), (None, None))
+
+    def test_format_value(self):
+        self.assertEqual(format_value(4700, 'ohm'), '4.7kΩ')
+        self.assertEqual(format_value(1e-7, 'F'), '100nF')
+        self.assertEqual(format_value(None, 'ohm'), '')
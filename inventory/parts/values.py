@@ -0,0 +1,111 @@
+
+
+import math
+import re
+
+
+"""
+Component values
+
+Parses the free text values of parts ("10k", "4k7", "100nF", "2u2", "680R") into a magnitude in base units
+and a unit, stored in the indexed `Part.comp_magnitude` and `Part.comp_unit`, so parametric searches like
+"resistors between 1k and 10k" are range scans: `comp_unit='ohm', comp_magnitude__range=(1e3, 1e4)`.
+
+Sources by priority: the first word of the name (the catalog writes values there, "4k7 / 0805"), the first word of
+`comp_value` (sparse and sometimes copied over from the row above), then the words of `tme_type` ("SMD0805-1K2").
+Names and order codes are full of part numbers, so a bare number only counts as a resistance in the first word
+of a resistor or trimmer name or in `comp_value`.
+"""
+
+MULTIPLIERS = {
+    'p': 1e-12,
+    'n': 1e-9,
+    'u': 1e-6,
+    'µ': 1e-6,
+    'm': 1e-3,
+    'R': 1,
+    'k': 1e3,
+    'K': 1e3,
+    'M': 1e6,
+    'G': 1e9,
+}
+
+UNITS = {
+    'f': 'F',
+    'h': 'H',
+    'r': 'ohm',
+    'ohm': 'ohm',
+    'ω': 'ohm',
+}
+
+CATEGORY_UNITS = {
+    'condensers': 'F',
+    'inductors': 'H',
+    'resistors': 'ohm',
+    'trimmers': 'ohm',
+}
+
+UNIT_SYMBOLS = {'F': 'F', 'H': 'H', 'ohm': 'Ω'}
+
+# digits, an optional multiplier (which may stand for the decimal point, "4k7"), optional decimals, an optional unit
+VALUE_RE = re.compile(r'^(\d+(?:[.,]\d+)?)([pnuµmRkKMG]?)(\d*)(F|H|R|ohm|Ω)?$', re.IGNORECASE)
+
+
+def parse_value(text, unit=None, strict=False):
+    """
+    Return (magnitude, unit) of a single value word, None if it isn't one.
+    `unit` is the unit implied by the category, `strict` requires a multiplier or a unit to be written out.
+    """
+    match = VALUE_RE.match(text.strip())
+    if not match:
+        return None
+
+    number, multiplier, decimals, written_unit = match.groups()
+    if multiplier and multiplier not in MULTIPLIERS:  # the match ignores case, the multipliers don't
+        multiplier = multiplier.lower() if multiplier.lower() in MULTIPLIERS else None
+        if multiplier is None:
+            return None
+    if decimals and (not multiplier or '.' in number or ',' in number):
+        return None
+    if strict and not multiplier and not written_unit:
+        return None
+    if multiplier == 'R' and written_unit:
+        return None
+
+    written_unit = UNITS[written_unit.lower()] if written_unit else None
+    if multiplier == 'R':
+        written_unit = 'ohm'
+    unit = written_unit or unit
+    if not unit:
+        return None
+
+    magnitude = float(f"{number.replace(',', '.')}{'.' if decimals else ''}{decimals}") * MULTIPLIERS.get(multiplier, 1)
+    return magnitude, unit
+
+
+def parse_part_value(category, name=None, comp_value=None, tme_type=None):
+    """Return (magnitude, unit) of a part from its catalog fields, (None, None) if none of them holds a value."""
+    unit = CATEGORY_UNITS.get(category)
+    name_words = re.split(r'[\s/]+', (name or '').strip())
+
+    candidates = [(name_words[0], unit != 'ohm')]
+    candidates += [(word, False) for word in re.split(r'[\s/]+', (comp_value or '').strip())[:1]]
+    candidates += [(word, True) for word in re.split(r'[\s/_-]+', tme_type or '') if word]
+
+    for word, strict in candidates:
+        value = parse_value(word, unit, strict) if word else None
+        if value:
+            return value
+    return None, None
+
+
+def format_value(magnitude, unit):
+    """Format a magnitude with an engineering multiplier, 4700 ohm -> '4.7kΩ'."""
+    if magnitude is None:
+        return ''
+    if magnitude == 0:
+        return f"0{UNIT_SYMBOLS.get(unit, unit)}"
+
+    exponent = max(min(int(math.floor(math.log10(abs(magnitude)) / 3)) * 3, 9), -12)
+    prefix = {-12: 'p', -9: 'n', -6: 'µ', -3: 'm', 0: '', 3: 'k', 6: 'M', 9: 'G'}[exponent]
+    return f"{magnitude / 10 ** exponent:.4g}{prefix}{UNIT_SYMBOLS.get(unit, unit)}"
@@ -0,0 +1,19 @@
+
+
+from django.contrib.admin.views.decorators import staff_member_required
+from django.http import StreamingHttpResponse
+
+from .export import export_lines
+
+
+CONTENT_TYPES = {
+    'csv': 'text/csv',
+    'tsv': 'text/tab-separated-values',
+}
+
+
+@staff_member_required
+def export_parts(request, fmt):
+    response = StreamingHttpResponse(export_lines(fmt), content_type=f"{CONTENT_TYPES[fmt]}; charset=utf-8")
+    response['Content-Disposition'] = f'attachment; filename="parts.{fmt}"'
+    return response
@@ -1,7 +1,7 @@
 
 from django.db import models
 
-from core.models import TimestampModel
+from core.models import BulkChangedManager, TimestampModel
 from parts.models import Part
 
 
@@ -10,6 +10,8 @@ class Supplier(models.Model):
     name = models.CharField(max_length=256, unique=True)
     parts = models.ManyToManyField(Part, through='PartPrice', related_name='suppliers')
 
+    objects = BulkChangedManager()
+
 
 class PartPrice(TimestampModel):
 
@@ -0,0 +1,22 @@
+
+import graphene
+
+from .models import Supplier
+from api.filters import CursorPaginationFilter, DjangoFilter, PaginationFilter
+from api.registry import register_type
+
+
+@register_type('Supplier')
+class SupplierType:
+    class Meta:
+        model = Supplier
+        fields = ['id', 'name']
+        lookups = {
+            'id': graphene.ID(),
+            'name': graphene.String(),
+        }
+        filters = {
+            'django': DjangoFilter,
+            'pagination': PaginationFilter,
+            'cursor': CursorPaginationFilter,
+        }
@@ -19,10 +19,16 @@ from django.db.models import (
     Subquery,
     OuterRef,
 )
+from django.core.cache import cache, caches
+from django.core.cache.backends.dummy import DummyCache
+from django.core.cache.backends.locmem import LocMemCache
+from django.core import checks
 from django.core.exceptions import ImproperlyConfigured
 from django.db.models.aggregates import Count
 from django.utils.deprecation import MiddlewareMixin
 
+from core.signals import bulk_changed
+
 
 def fk_and_filter(qs, related_field, ids):
     """ForeignKey `AND` filter, returns only objects that have a relation to ALL ids at related field."""
@@ -183,6 +189,7 @@ def clone_throughs(throughs, **kwargs):
             setattr(t, key, value)
 
     Model.objects.bulk_create(throughs)
+    bulk_changed.send(sender=Model)
 
 
 def model_to_str(model):
@@ -228,6 +235,43 @@ def has_annotation(qs, field):
     return field in qs.query.annotations
 
 
+def is_shared_cache(alias='default'):
+    """Return whether all workers see the cache `alias`, unlike Django's default per-process LocMemCache or the DummyCache."""
+    return not isinstance(caches[alias], (LocMemCache, DummyCache))
+
+
+def get_cache_generation(key):
+    """
+    Return the generation counter stored under `key` in the default cache.
+
+    Per-process caches (the availability snapshot, the search index, the bill of materials, the persisted query
+    catalogue, the response cache) are rebuilt when a write bumps their generation. Workers see the bumps of each other
+    only when the default cache is shared by all of them (`is_shared_cache`), i.e. Redis, memcached or the database.
+    With a per-process cache each worker only sees its own, so those caches have to expire or fall back to the database
+    on their own.
+    """
+    return cache.get_or_set(key, 0, timeout=None)
+
+
+def bump_cache_generation(key):
+    try:
+        cache.incr(key)
+    except ValueError:  # the key expired or was never set
+        cache.set(key, 1, timeout=None)
+
+
+@checks.register(checks.Tags.caches, deploy=True)
+def check_shared_cache(app_configs, **kwargs):
+    if is_shared_cache():
+        return []
+    return [checks.Warning(
+        f"The default cache ({type(caches['default']).__name__}) isn't shared by the workers.",
+        hint="Cache generations of one worker aren't seen by the others, per-process caches only expire on their own. "
+             "Set CACHES['default'] to Redis, memcached or the database when running several workers.",
+        id='utils.W001',
+    )]
+
+
 class DefaultFilter(admin.SimpleListFilter):
 
     def __init__(self, *args, **kwargs):
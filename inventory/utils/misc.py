@@ -28,8 +28,8 @@ def request(url, data, method, headers, timeout=3):
 
 
 def parse_event(event):
-    query_param_string = event['rawQueryString']
-    query_kwargs = dict([tuple(kwarg.split('=')) for kwarg in query_param_string.split('&')])
+    query_param_string = event.get('rawQueryString', '')
+    query_kwargs = dict(urllib.parse.parse_qsl(query_param_string))  # decoded, an empty query string gives {}
     method = event['requestContext']['http']['method']
 
     return method, query_kwargs
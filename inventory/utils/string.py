@@ -2,6 +2,8 @@
 
 import pprint
 import re
+
+from functools import lru_cache
 from textwrap import indent as indent_fn
 from typing import Sequence
 
@@ -10,6 +12,7 @@ def decapitalize(string):
     return string[0].lower() + string[1:]
 
 
+@lru_cache(maxsize=4096)  # called for every field and argument name of every parsed selection
 def camel_to_snake(camel):
     out = re.sub('(.)([A-Z][a-z]+)', r'\1_\2', camel)
     return re.sub('([a-z0-9])([A-Z])', r'\1_\2', out).lower()